@@ -0,0 +1,93 @@
+"""
+This module provides:
+- Calendar month buckets for dashboard charts
+- Monthly counts for a log table in one indexed range query
+
+The range filter is on the raw created_at column ('YYYY-MM-DD HH:MM:SS' text),
+so SQLite can answer it from the created_at / (user_id, created_at) indexes.
+Wrapping the column in strftime() would force a full table scan.
+
+Usage:
+    from aggregations import last_n_months, monthly_counts
+
+    months = last_n_months(12)
+    counts = monthly_counts(conn, 'recommendation_logs', months, user_id=5)
+"""
+
+import datetime
+import calendar
+
+
+# Tables that can be aggregated (the name is interpolated into SQL)
+AGGREGATE_TABLES = ('detection_logs', 'recommendation_logs', 'fertilizer_logs')
+
+
+class Month:
+    """One calendar month bucket."""
+
+    def __init__(self, year: int, month: int):
+        self.year = year
+        self.month = month
+
+    @property
+    def key(self) -> str:
+        """'YYYY-MM', the same form as substr(created_at, 1, 7)."""
+        return f"{self.year:04d}-{self.month:02d}"
+
+    @property
+    def label(self) -> str:
+        """Short month name, e.g. 'Jan'."""
+        return calendar.month_abbr[self.month]
+
+    @property
+    def start(self) -> str:
+        return f"{self.key}-01 00:00:00"
+
+    def next(self) -> 'Month':
+        if self.month == 12:
+            return Month(self.year + 1, 1)
+        return Month(self.year, self.month + 1)
+
+    def __repr__(self):
+        return f"Month({self.key})"
+
+
+def last_n_months(n: int, now: datetime.datetime = None) -> list:
+    """The last n calendar months, oldest first, ending with the current month."""
+    now = now or datetime.datetime.now()
+    months = []
+    year, month = now.year, now.month
+    for _ in range(n):
+        months.append(Month(year, month))
+        month -= 1
+        if month == 0:
+            month = 12
+            year -= 1
+    return months[::-1]
+
+
+def monthly_counts(conn, table: str, months: list, user_id=None) -> list:
+    """
+    Count rows of `table` per month with a single range query.
+
+    Args:
+        months: consecutive Month buckets, oldest first (see last_n_months)
+        user_id: restrict to one user's rows; None counts everyone
+
+    Returns:
+        A list of counts aligned with `months`.
+    """
+    if table not in AGGREGATE_TABLES:
+        raise ValueError(f"Cannot aggregate table {table}")
+    if not months:
+        return []
+
+    sql = f"SELECT substr(created_at, 1, 7) AS ym, COUNT(*) FROM {table} WHERE created_at >= ? AND created_at < ?"
+    params = [months[0].start, months[-1].next().start]
+    if user_id is not None:
+        sql += " AND user_id = ?"
+        params.append(user_id)
+    sql += " GROUP BY ym"
+
+    by_key = dict(conn.execute(sql, params).fetchall())
+    return [by_key.get(m.key, 0) for m in months]
@@ -1,13 +1,11 @@
-from flask import Flask, request, render_template, redirect, flash, session, jsonify
+from flask import Flask, request, render_template, redirect, flash, session, jsonify, Response
 import numpy as np
 import sqlite3
 import pickle
 import os
 import secrets
-from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 import datetime
-import calendar
 
 # =============================================================================
 # CONFIGURATION - Load from environment variables with secure defaults
@@ -45,15 +43,43 @@ from security import (
     add_security_headers
 )
 
+# Password hashing runs on a bounded worker pool (503 when saturated)
+from password_hashing import password_hasher, HashingSaturated
+
+# Pooled SQLite connections (WAL mode), shared by every route
+from db import get_db, db_pool
+# Cached (id, email, username, profile_picture, is_admin) rows for page routes
+from user_cache import user_cache
+# Prediction/recommendation logs are committed in batches on a background thread
+from log_writer import log_writer
+# Per-stage latency histograms (/metrics) and level-gated structured logging
+import logging
+from metrics import metrics, stage_span, get_logger, log_event
+from migrations import migrate
+from aggregations import last_n_months, monthly_counts
+import rollups
+
 # Add security headers to all responses
 @app.after_request
 def apply_security_headers(response):
     return add_security_headers(response)
 
-# Load models
-model = pickle.load(open('model.pkl', 'rb'))
-mx = pickle.load(open('minmaxscaler.pkl', 'rb'))
-sc = pickle.load(open('standscaler.pkl', 'rb'))
+# Models run in this process (local) or in the inference worker pool
+# (remote, see inference_workers.py); remote web workers load no models at all
+INFERENCE_MODE = os.environ.get('INFERENCE_MODE', 'local').lower()
+
+if INFERENCE_MODE == 'remote':
+    from inference_workers import inference_client
+    model = mx = sc = crop_scorer = None
+else:
+    # Load models
+    model = pickle.load(open('model.pkl', 'rb'))
+    mx = pickle.load(open('minmaxscaler.pkl', 'rb'))
+    sc = pickle.load(open('standscaler.pkl', 'rb'))
+
+    # Fused scaler + flattened forest; falls back to sklearn if it doesn't match on the dataset
+    from crop_scorer import build_scorer
+    crop_scorer = build_scorer(model, mx, sc)
 
 # Crop dictionary
 crop_dict = {
@@ -64,83 +90,86 @@ crop_dict = {
     20: "Cotton", 21: "Jute", 22: "Coffee"
 }
 
+# Feature order expected by the scalers and model: [N, P, K, temperature, ph]
+CROP_FEATURES = ('nitrogen', 'phosphorus', 'potassium', 'temperature', 'ph')
+
+RECOMMENDATION_LOG_INSERT = (
+    "INSERT INTO recommendation_logs (user_id, crop, nitrogen, phosphorus, potassium, temperature, ph) "
+    "VALUES (?,?,?,?,?,?,?)"
+)
+
+
+def validate_crop_inputs(N, P, K, temp, ph):
+    """Check soil/climate values against realistic agricultural ranges. Returns a list of errors."""
+    validation_errors = []
+    
+    # Nitrogen: typical range 0-300 kg/ha (most crops need 0-200)
+    if N < 0 or N > 300:
+        validation_errors.append("Nitrogen should be between 0-300 kg/ha")
+    
+    # Phosphorus: typical range 0-150 kg/ha (most crops need 5-100)
+    if P < 0 or P > 150:
+        validation_errors.append("Phosphorus should be between 0-150 kg/ha")
+    
+    # Potassium: typical range 0-300 kg/ha (most crops need 5-250)
+    if K < 0 or K > 300:
+        validation_errors.append("Potassium should be between 0-300 kg/ha")
+    
+    # Temperature: realistic range for crop growth -10°C to 50°C
+    if temp < -10 or temp > 50:
+        validation_errors.append("Temperature should be between -10°C to 50°C")
+    
+    # pH: soil pH range 3.5 to 9.5 (most crops prefer 6.0-7.5)
+    if ph < 3.5 or ph > 9.5:
+        validation_errors.append("pH should be between 3.5-9.5")
+
+    return validation_errors
+
+
+def recommend_crops(features):
+    """Score an (n, 5) array of [N, P, K, temperature, ph] rows in one vectorized pass.
+    Returns one crop name per row.
+    """
+    features = np.asarray(features, dtype=np.float64).reshape(-1, len(CROP_FEATURES))
+    if INFERENCE_MODE == 'remote':
+        predictions = inference_client.recommend_crops(features)
+    elif crop_scorer is not None:
+        predictions = crop_scorer.predict(features)
+    else:
+        predictions = model.predict(sc.transform(mx.transform(features)))
+    return [crop_dict.get(p, "Unknown") for p in predictions]
+
 
 # USER AUTH SYSTEM
 
 def init_db():
-    with sqlite3.connect('database.db') as conn:
-        conn.execute('''CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            banned_until TEXT,
-            ban_reason TEXT,
-            profile_picture TEXT,
-            is_admin BOOLEAN DEFAULT 0
-        )''')
-        # Log of crop recommendations
-        conn.execute('''CREATE TABLE IF NOT EXISTS recommendation_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            crop TEXT,
-            nitrogen REAL,
-            phosphorus REAL,
-            potassium REAL,
-            temperature REAL,
-            ph REAL,
-            created_at TEXT DEFAULT (datetime('now'))
-        )''')
-        # Detection logs for storing plant disease detection results
-        conn.execute('''CREATE TABLE IF NOT EXISTS detection_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            plant_name TEXT,
-            disease TEXT,
-            confidence REAL,
-            image_url TEXT,
-            all_probabilities TEXT,
-            created_at TEXT DEFAULT (datetime('now'))
-        )''')
-        
-        # New table for Fertilizer Recommendations
-        conn.execute('''CREATE TABLE IF NOT EXISTS fertilizer_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            crop TEXT,
-            nitrogen_current REAL,
-            phosphorus_current REAL,
-            potassium_current REAL,
-            recommendation TEXT,
-            created_at TEXT DEFAULT (datetime('now'))
-        )''')
-        
-        # Add ban columns if they don't exist (for existing databases)
-        try:
-            conn.execute('ALTER TABLE users ADD COLUMN banned_until TEXT')
-        except:
-            pass 
-        try:
-            conn.execute('ALTER TABLE users ADD COLUMN ban_reason TEXT')
-        except:
-            pass  
-        try:
-            conn.execute('ALTER TABLE users ADD COLUMN profile_picture TEXT')
-        except:
-            pass
-        try:
-            conn.execute('ALTER TABLE users ADD COLUMN is_admin BOOLEAN DEFAULT 0')
-            # Set user ID 2 as admin default
-            conn.execute('UPDATE users SET is_admin = 1 WHERE id = 2')
-        except:
-            pass  
-        try:
-            conn.execute('ALTER TABLE detection_logs ADD COLUMN all_probabilities TEXT')
-        except:
-            pass
+    """Create the schema and apply any pending migrations (see migrations.py)."""
+    with get_db() as conn:
+        migrate(conn)
 
 init_db()
 
+
+def verify_login_password(user, password) -> bool:
+    """Check a users row (SELECT *) against a password; upgrade the stored hash if its cost is outdated."""
+    is_valid, upgraded_hash = password_hasher.verify_and_update(user[3], password)
+    if upgraded_hash:
+        with get_db() as conn:
+            conn.execute("UPDATE users SET password = ? WHERE id = ?", (upgraded_hash, user[0]))
+    return is_valid
+
+
+@app.errorhandler(HashingSaturated)
+def handle_hashing_saturated(e):
+    """Password hashing pool is full: shed load instead of queueing more request threads."""
+    if request.path.startswith('/api/'):
+        response = jsonify({'error': 'Server is busy. Please try again in a moment.'})
+    else:
+        response = app.make_response(("Server is busy. Please try again in a moment.", 503))
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
 # Login required decorator
 def login_required(f):
     @wraps(f)
@@ -164,13 +193,12 @@ def admin_required(f):
             return redirect('/login')
         
         # Check if user is admin
-        with sqlite3.connect('database.db') as conn:
-            user = conn.execute("SELECT is_admin FROM users WHERE id = ?", (session['user_id'],)).fetchone()
-            if not user or not user[0]:
-                if request.path.startswith('/api/'):
-                    return jsonify({'error': 'Admin privileges required'}), 403
-                flash('Access denied. Admin privileges required.', 'danger')
-                return redirect('/')
+        user = user_cache.get(session['user_id'])
+        if not user or not user[4]:
+            if request.path.startswith('/api/'):
+                return jsonify({'error': 'Admin privileges required'}), 403
+            flash('Access denied. Admin privileges required.', 'danger')
+            return redirect('/')
 
         return f(*args, **kwargs)
     return decorated_function
@@ -190,19 +218,13 @@ def no_cache(f):
 @app.route('/')
 @no_cache
 def home():
-    user = None
-    if 'user_id' in session:
-        with sqlite3.connect('database.db') as conn:
-            user = conn.execute("SELECT id, email, username FROM users WHERE id = ?", (session['user_id'],)).fetchone()
+    user = user_cache.get(session.get('user_id'))
     return render_template("home.html", user=user)
 
 @app.route('/index')
 @no_cache
 def index():
-    user = None
-    if 'user_id' in session:
-        with sqlite3.connect('database.db') as conn:
-            user = conn.execute("SELECT id, email, username FROM users WHERE id = ?", (session['user_id'],)).fetchone()
+    user = user_cache.get(session.get('user_id'))
     # allow result passed via query string after redirect
     result = request.args.get('result')
     return render_template("index.html", user=user, result=result)
@@ -211,10 +233,7 @@ def index():
 @login_required
 @no_cache
 def dashboard():
-    user = None
-    if 'user_id' in session:
-        with sqlite3.connect('database.db') as conn:
-            user = conn.execute("SELECT id, email, username, profile_picture FROM users WHERE id = ?", (session['user_id'],)).fetchone()
+    user = user_cache.get(session.get('user_id'))
     return render_template("dashboard.html", user=user)
 
 @app.route('/signup', methods=['GET', 'POST'])
@@ -245,10 +264,10 @@ def signup():
             flash(error, "danger")
             return redirect('/signup')
 
-        password = generate_password_hash(raw_password)
+        password = password_hasher.hash(raw_password)
 
         try:
-            with sqlite3.connect('database.db') as conn:
+            with get_db() as conn:
                 conn.execute("INSERT INTO users (email, username, password) VALUES (?, ?, ?)",
                          (email, username, password))
             flash("Signup successful. Please log in.", "success")
@@ -277,10 +296,10 @@ def login():
             flash(f"Too many failed attempts. Try again in {remaining} seconds.", "danger")
             return redirect('/login')
 
-        with sqlite3.connect('database.db') as conn:
+        with get_db() as conn:
             user = conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
 
-        if user and check_password_hash(user[3], password):
+        if user and verify_login_password(user, password):
             # Clear brute force tracking on successful login
             brute_force.record_success(email)
             
@@ -291,7 +310,7 @@ def login():
                     return redirect('/login')
                 else:
                     # Check if temporary ban is still active
-                    with sqlite3.connect('database.db') as conn:
+                    with get_db() as conn:
                         ban_check = conn.execute("""
                             SELECT CASE 
                                 WHEN banned_until > datetime('now') THEN 1 
@@ -343,10 +362,7 @@ def logout():
 @login_required
 @no_cache
 def profile():
-    user = None
-    if 'user_id' in session:
-        with sqlite3.connect('database.db') as conn:
-            user = conn.execute("SELECT id, email, username, profile_picture FROM users WHERE id = ?", (session['user_id'],)).fetchone()
+    user = user_cache.get(session.get('user_id'))
     return render_template("profile.html", user=user)
 
 @app.route('/update-username', methods=['POST'])
@@ -363,10 +379,10 @@ def update_username():
         flash('Please provide both new username and password.', 'warning')
         return redirect('/profile')
     
-    with sqlite3.connect('database.db') as conn:
+    with get_db() as conn:
         # Verify password first
         user = conn.execute("SELECT * FROM users WHERE id = ?", (session['user_id'],)).fetchone()
-        if not user or not check_password_hash(user[3], password):
+        if not user or not password_hasher.verify(user[3], password):
             flash('Incorrect password.', 'danger')
             return redirect('/profile')
         
@@ -380,6 +396,7 @@ def update_username():
         conn.execute("UPDATE users SET username = ? WHERE id = ?", (new_username, session['user_id']))
         session['username'] = new_username
         flash('Username updated successfully!', 'success')
+    user_cache.invalidate(session['user_id'])
     
     return redirect('/profile')
 
@@ -406,17 +423,23 @@ def update_password():
         flash('New password must be at least 6 characters long.', 'warning')
         return redirect('/profile')
     
-    with sqlite3.connect('database.db') as conn:
-        # Verify current password
+    with get_db() as conn:
         user = conn.execute("SELECT * FROM users WHERE id = ?", (session['user_id'],)).fetchone()
-        if not user or not check_password_hash(user[3], current_password):
-            flash('Current password is incorrect.', 'danger')
-            return redirect('/profile')
-        
-        # Update password
-        new_password_hash = generate_password_hash(new_password)
-        conn.execute("UPDATE users SET password = ? WHERE id = ?", (new_password_hash, session['user_id']))
+
+    # Verify and hash with no connection checked out; the KDFs take tens of milliseconds
+    if not user or not password_hasher.verify(user[3], current_password):
+        flash('Current password is incorrect.', 'danger')
+        return redirect('/profile')
+    new_password_hash = password_hasher.hash(new_password)
+
+    with get_db() as conn:
+        # Only if the password was not changed meanwhile
+        updated = conn.execute("UPDATE users SET password = ? WHERE id = ? AND password = ?",
+                               (new_password_hash, session['user_id'], user[3])).rowcount
+    if updated:
         flash('Password updated successfully!', 'success')
+    else:
+        flash('Your password was changed in the meantime. Please try again.', 'warning')
     
     return redirect('/profile')
 
@@ -466,7 +489,7 @@ def upload_profile_picture():
     # Update database with relative path
     relative_path = f"uploads/{filename}"
     
-    with sqlite3.connect('database.db') as conn:
+    with get_db() as conn:
         # Delete old profile picture if exists
         old_picture = conn.execute("SELECT profile_picture FROM users WHERE id = ?", (session['user_id'],)).fetchone()
         if old_picture and old_picture[0]:
@@ -476,6 +499,7 @@ def upload_profile_picture():
         
         # Update with new picture
         conn.execute("UPDATE users SET profile_picture = ? WHERE id = ?", (relative_path, session['user_id']))
+    user_cache.invalidate(session['user_id'])
     
     flash('Profile picture updated successfully!', 'success')
     return redirect('/profile')
@@ -487,7 +511,7 @@ def delete_profile_picture():
     if 'user_id' not in session:
         return redirect('/login')
     
-    with sqlite3.connect('database.db') as conn:
+    with get_db() as conn:
         # Get current profile picture
         user = conn.execute("SELECT profile_picture FROM users WHERE id = ?", (session['user_id'],)).fetchone()
         if user and user[0]:
@@ -502,6 +526,7 @@ def delete_profile_picture():
             flash('Profile picture deleted successfully!', 'success')
         else:
             flash('No profile picture to delete.', 'info')
+    user_cache.invalidate(session['user_id'])
     
     return redirect('/profile')
 
@@ -511,23 +536,28 @@ def delete_account():
         flash("Please log in to delete your account.", "warning")
         return redirect('/profile')
     
+    user_id = session['user_id']
     password = request.form['password']
-    with sqlite3.connect('database.db') as conn:
-        user = conn.execute("SELECT * FROM users WHERE id = ?", (session['user_id'],)).fetchone()
-        if user and check_password_hash(user[3], password):
-            conn.execute("DELETE FROM users WHERE id = ?", (session['user_id'],))
-            session.clear()
-            flash("Account deleted successfully.", "success")
-            
-            # Create response with cache control headers
-            response = redirect('/signup')
-            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate, max-age=0'
-            response.headers['Pragma'] = 'no-cache'
-            response.headers['Expires'] = '0'
-            return response
-        else:
-            flash("Incorrect password. Account not deleted.", "danger")
-            return redirect('/profile')
+    with get_db() as conn:
+        user = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+        deleted = bool(user and password_hasher.verify(user[3], password))
+        if deleted:
+            conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+
+    if deleted:
+        user_cache.invalidate(user_id)
+        session.clear()
+        flash("Account deleted successfully.", "success")
+        
+        # Create response with cache control headers
+        response = redirect('/signup')
+        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate, max-age=0'
+        response.headers['Pragma'] = 'no-cache'
+        response.headers['Expires'] = '0'
+        return response
+    else:
+        flash("Incorrect password. Account not deleted.", "danger")
+        return redirect('/profile')
 
 @app.route('/forgot')
 def forgot():
@@ -544,17 +574,19 @@ def reset():
             flash("Passwords do not match.", "danger")
             return redirect('/reset')
 
-        with sqlite3.connect('database.db') as conn:
-            user = conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+        with get_db() as conn:
+            user = conn.execute("SELECT id FROM users WHERE email = ?", (email,)).fetchone()
 
-            if not user:
-                flash("Email not found.", "danger")
-                return redirect('/reset')
+        if not user:
+            flash("Email not found.", "danger")
+            return redirect('/reset')
 
-            conn.execute("UPDATE users SET password = ? WHERE email = ?",
-                     (generate_password_hash(new_password), email))
-            flash("Password reset successful.", "success")
-            return redirect('/login')
+        # Hash with no connection checked out
+        new_password_hash = password_hasher.hash(new_password)
+        with get_db() as conn:
+            conn.execute("UPDATE users SET password = ? WHERE id = ?", (new_password_hash, user[0]))
+        flash("Password reset successful.", "success")
+        return redirect('/login')
 
     return render_template("reset.html")
 
@@ -562,10 +594,7 @@ def reset():
 @login_required
 @no_cache
 def chatbot():
-    user = None
-    if 'user_id' in session:
-        with sqlite3.connect('database.db') as conn:
-            user = conn.execute("SELECT id, email, username FROM users WHERE id = ?", (session['user_id'],)).fetchone()
+    user = user_cache.get(session.get('user_id'))
     return render_template("chatbot.html", user=user)
 
 @app.route('/check-auth')
@@ -591,10 +620,10 @@ def api_signup():
     if not email or not username or not password:
         return jsonify({'error': 'Missing required fields'}), 400
 
-    hashed_password = generate_password_hash(password)
+    hashed_password = password_hasher.hash(password)
 
     try:
-        with sqlite3.connect('database.db') as conn:
+        with get_db() as conn:
             conn.execute("INSERT INTO users (email, username, password) VALUES (?, ?, ?)",
                      (email, username, hashed_password))
         return jsonify({'success': True, 'message': 'Signup successful'}), 201
@@ -616,17 +645,17 @@ def api_login():
         return jsonify({'error': 'Missing email or password'}), 400
 
     try:
-        with sqlite3.connect('database.db') as conn:
+        with get_db() as conn:
             user = conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
 
-        if user and check_password_hash(user[3], password):
+        if user and verify_login_password(user, password):
             # Check if user is banned
             if user[4]:  # banned_until column
                 if user[4] == '9999-12-31':
                     return jsonify({'error': 'Your account has been permanently banned.'}), 403
                 else:
                     # Check if temporary ban is still active
-                    with sqlite3.connect('database.db') as conn:
+                    with get_db() as conn:
                         ban_check = conn.execute("""
                             SELECT CASE 
                                 WHEN banned_until > datetime('now') THEN 1 
@@ -665,6 +694,8 @@ def api_login():
             })
         else:
             return jsonify({'error': 'Invalid credentials'}), 401
+    except HashingSaturated:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -681,7 +712,7 @@ def api_logout():
 @no_cache
 def admin_panel():
     """Admin panel to manage users"""
-    with sqlite3.connect('database.db') as conn:
+    with get_db() as conn:
         # Get all users with their details
         users = conn.execute("""
             SELECT id, email, username, password, 
@@ -705,7 +736,7 @@ def ban_user():
     ban_duration = request.form.get('ban_duration')  
     ban_reason = request.form.get('ban_reason', 'No reason provided')
     
-    with sqlite3.connect('database.db') as conn:
+    with get_db() as conn:
         if ban_type == 'temp':
             # Calculate ban until date
             ban_until = f"datetime('now', '+{ban_duration} days')"
@@ -723,6 +754,7 @@ def ban_user():
                 WHERE id = ?
             """, (ban_reason, user_id))
             flash('User permanently banned', 'danger')
+    user_cache.invalidate(user_id)
     
     return redirect('/admin')
 
@@ -732,13 +764,14 @@ def unban_user():
     """Unban a user"""
     user_id = request.form.get('user_id')
     
-    with sqlite3.connect('database.db') as conn:
+    with get_db() as conn:
         conn.execute("""
             UPDATE users 
             SET banned_until = NULL, ban_reason = NULL 
             WHERE id = ?
         """, (user_id,))
         flash('User unbanned successfully', 'success')
+    user_cache.invalidate(user_id)
     
     return redirect('/admin')
 
@@ -748,10 +781,13 @@ def admin_delete_user():
     """Delete a user account"""
     user_id = request.form.get('user_id')
     
-    with sqlite3.connect('database.db') as conn:
+    with get_db() as conn:
         conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
         flash('User account deleted successfully', 'success')
+    user_cache.invalidate(user_id)
     
+    return redirect('/admin')
+
 # CROP PREDICTION
 # ----------------
 @app.route('/predict', methods=['GET', 'POST'])
@@ -760,42 +796,26 @@ def predict():
     if request.method == 'GET':
         return redirect('/index')
     
+    with stage_span('crop', 'total'):
+        return _predict_form()
+
+
+def _predict_form():
+    """Handle a POST of the crop form; predict() times it as one crop pipeline run."""
     try:
-        N = float(request.form['Nitrogen'])
-        P = float(request.form['Phosphorus'])  
-        K = float(request.form['Potassium'])
-        temp = float(request.form['Temperature'])
-        ph = float(request.form['pH'])
-
-        # Input validation for realistic agricultural ranges
-        validation_errors = []
-        
-        # Nitrogen: typical range 0-300 kg/ha (most crops need 0-200)
-        if N < 0 or N > 300:
-            validation_errors.append("Nitrogen should be between 0-300 kg/ha")
-        
-        # Phosphorus: typical range 0-150 kg/ha (most crops need 5-100)
-        if P < 0 or P > 150:
-            validation_errors.append("Phosphorus should be between 0-150 kg/ha")
-        
-        # Potassium: typical range 0-300 kg/ha (most crops need 5-250)
-        if K < 0 or K > 300:
-            validation_errors.append("Potassium should be between 0-300 kg/ha")
-        
-        # Temperature: realistic range for crop growth -10°C to 50°C
-        if temp < -10 or temp > 50:
-            validation_errors.append("Temperature should be between -10°C to 50°C")
-        
-        # pH: soil pH range 3.5 to 9.5 (most crops prefer 6.0-7.5)
-        if ph < 3.5 or ph > 9.5:
-            validation_errors.append("pH should be between 3.5-9.5")
+        with stage_span('crop', 'parse'):
+            N = float(request.form['Nitrogen'])
+            P = float(request.form['Phosphorus'])  
+            K = float(request.form['Potassium'])
+            temp = float(request.form['Temperature'])
+            ph = float(request.form['pH'])
+
+            # Input validation for realistic agricultural ranges
+            validation_errors = validate_crop_inputs(N, P, K, temp, ph)
 
         # If validation errors exist, return them to the user
         if validation_errors:
-            user_ctx = None
-            if 'user_id' in session:
-                with sqlite3.connect('database.db') as conn:
-                    user_ctx = conn.execute("SELECT id, email, username FROM users WHERE id = ?", (session['user_id'],)).fetchone()
+            user_ctx = user_cache.get(session.get('user_id'))
             
             # Create error message with all validation issues
             error_msg = "Invalid input values detected:<br><br>"
@@ -805,83 +825,113 @@ def predict():
             
             return render_template("index.html", validation_errors=validation_errors, user=user_ctx)
 
-        feature = np.array([N, P, K, temp, ph]).reshape(1, -1)
-        mx_feature = mx.transform(feature)
-        sc_feature = sc.transform(mx_feature)
+        with stage_span('crop', 'inference'):
+            crop = recommend_crops([[N, P, K, temp, ph]])[0]
 
-        prediction = model.predict(sc_feature)[0]
-        crop = crop_dict.get(prediction, "Unknown")
-
-        # Log the recommendation event
+        # Log the recommendation event (committed in the background)
         try:
-            with sqlite3.connect('database.db') as conn:
-                conn.execute(
-                    """
-                    INSERT INTO recommendation_logs (user_id, crop, nitrogen, phosphorus, potassium, temperature, ph)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        session.get('user_id'),
-                        crop,
-                        N, P, K, temp, ph
-                    ),
+            with stage_span('crop', 'log'):
+                log_writer.write(
+                    RECOMMENDATION_LOG_INSERT,
+                    (session.get('user_id'), crop, N, P, K, temp, ph)
                 )
         except Exception as log_err:
             # Do not fail the user flow if logging has issues
             print(f"Recommendation log insert failed: {log_err}")
 
         # Fetch user for navbar/auth-sensitive template logic
-        user_ctx = None
-        if 'user_id' in session:
-            with sqlite3.connect('database.db') as conn:
-                user_ctx = conn.execute("SELECT id, email, username FROM users WHERE id = ?", (session['user_id'],)).fetchone()
+        user_ctx = user_cache.get(session.get('user_id'))
 
         result = f"{crop} is the best crop to be cultivated right there."
         # Render directly instead of redirect to avoid potential issues
-        return render_template("index.html", result=result, user=user_ctx)
+        with stage_span('crop', 'render'):
+            return render_template("index.html", result=result, user=user_ctx)
 
     except Exception as e:
         # Fetch user for navbar/auth-sensitive template logic even on error
-        user_ctx = None
-        if 'user_id' in session:
-            with sqlite3.connect('database.db') as conn:
-                user_ctx = conn.execute("SELECT id, email, username FROM users WHERE id = ?", (session['user_id'],)).fetchone()
+        user_ctx = user_cache.get(session.get('user_id'))
         return render_template("index.html", result=f"Error: {str(e)}", user=user_ctx)
 
 
 # PLANT DISEASE PREDICTION
 
-import tensorflow as tf
 import numpy as np
 import os
 from PIL import Image
 import io
 
-# Load the plant disease model
+# TensorFlow is only imported when the disease model is first loaded
+# (model_registry), i.e. on the first upload or in preload_inference(); crop,
+# auth and admin routes never pay for it, and with INFERENCE_MODE=remote this
+# process never imports it at all
+if INFERENCE_MODE == 'remote':
+    from inference_workers import remote_disease_model as disease_registry
+else:
+    from model_registry import disease_registry, preload_disease_model
+    # Every web worker runs its own TensorFlow: give each its share of the CPUs
+    # (WEB_CONCURRENCY is the worker count for gunicorn.conf.py and uvicorn)
+    disease_registry.share_cpus(int(os.environ.get('WEB_CONCURRENCY', 1)))
+from inference_batcher import MicroBatcher
+from image_pipeline import (
+    DISEASE_INPUT_SIZE,
+    UPLOAD_GRACE_SECONDS,
+    decode_image,
+    sniff_format,
+    save_upload_by_digest,
+    delete_upload,
+)
+from prediction_cache import prediction_cache, content_digest
+
+# Load the plant disease model (cached per worker by the registry)
 def load_disease_model():
-    try:
-        print("Attempting to load disease model...")
-        
-        
+    return disease_registry.get()
+
+
+def remove_unreferenced_uploads(image_urls):
+    """Delete upload files that no detection_logs row references any more.
+    Identical uploads share one content-addressed file, so a file may only go
+    with its last detection. Call after the transaction deleting the rows has
+    committed (a rollback must not leave rows pointing at deleted files).
+    Files handed out within UPLOAD_GRACE_SECONDS are kept: /predict-disease
+    returns the URL before the client logs its detection.
+    """
+    image_urls = set(filter(None, image_urls))
+    if not image_urls:
+        return
+    # Detection rows still queued in the write-behind log writer count as references
+    log_writer.flush()
+    with get_db() as conn:
+        unreferenced = [
+            image_url for image_url in image_urls
+            if conn.execute("SELECT 1 FROM detection_logs WHERE image_url = ? LIMIT 1", (image_url,)).fetchone() is None
+        ]
+    for image_url in unreferenced:
         try:
-            model = tf.keras.models.load_model("trained_plant_disease_model.keras")
-            print("Successfully loaded .keras model")
-            return model
-        except:
-            print("Failed to load .keras model, trying .h5 version...")
-            try:
-                model = tf.keras.models.load_model("plant_disease_model.h5")
-                print("Successfully loaded .h5 model")
-                return model
-            except Exception as e:
-                print(f"Failed to load .h5 model: {e}")
-        
-        print("No model files found or all failed to load")
-        return None
-        
-    except Exception as e:
-        print(f"Error in load_disease_model: {e}")
-        return None
+            if delete_upload(image_url, min_age=UPLOAD_GRACE_SECONDS):
+                print(f"Deleted image file: {image_url}")
+        except OSError as e:
+            print(f"Warning: Could not delete image file {image_url}: {e}")
+
+# Load and warm up the model at worker startup instead of on the first upload.
+# Not done at import time: gunicorn.conf.py (post_worker_init), asgi.py
+# (lifespan startup) and `python app.py` call preload_inference() after any fork.
+DISEASE_MODEL_WARMUP = os.environ.get('DISEASE_MODEL_WARMUP', '').lower() in ('1', 'true', 'yes')
+
+
+def preload_inference() -> bool:
+    """Load the disease stack now. In remote mode, just check that the inference pool answers."""
+    if INFERENCE_MODE == 'remote':
+        return disease_registry.get() is not None
+    return preload_disease_model(warm_up=True)
+
+# Concurrent /predict-disease requests share one model.predict call
+disease_batcher = MicroBatcher(
+    disease_registry.predict,
+    max_batch_size=int(os.environ.get('DISEASE_BATCH_MAX_SIZE', 16)),
+    max_wait_ms=float(os.environ.get('DISEASE_BATCH_MAX_WAIT_MS', 5)),
+    timeout=float(os.environ.get('DISEASE_BATCH_TIMEOUT', 30)),
+    name='disease-batcher'
+)
 
 # Class names for plant diseases
 DISEASE_CLASSES = [
@@ -957,9 +1007,9 @@ def test_model_loading():
         print("Testing model loading...")
         model = load_disease_model()
         if model is not None:
-            return {'success': True, 'message': 'Model loaded successfully', 'model_summary': str(model.summary())}
+            return {'success': True, 'message': 'Model loaded successfully', 'model': disease_registry.info()}
         else:
-            return {'success': False, 'message': 'Failed to load model'}
+            return {'success': False, 'message': 'Failed to load model', 'model': disease_registry.info()}
     except Exception as e:
         return {'success': False, 'message': f'Error testing model: {str(e)}'}
 
@@ -987,146 +1037,160 @@ def test_image_upload():
         print(f"Image upload test error: {e}")
         return {'success': False, 'error': f'Upload test failed: {str(e)}'}
 
-@app.route('/predict-disease', methods=['POST'])
-def predict_disease():
+# The disease prediction pipeline is split into plain functions of the upload
+# bytes so the Flask route and the asyncio entry point (asgi.py) share it:
+#   prepare_disease_input -> (inference via disease_batcher) -> build_disease_response
+
+# Debug dumps of shapes/probabilities are logged at DEBUG (LOG_LEVEL=DEBUG) and
+# are not even computed otherwise; each stage is timed into /metrics.
+disease_log = get_logger('plant.disease')
+
+
+def prepare_disease_input(image_bytes: bytes, own_buffer: bool = False) -> dict:
+    """Cache lookup, else in-memory decode of one upload.
+    Returns a dict with digest, image_format and either 'probabilities' (cache
+    hit), 'image' (a 128x128 array ready for disease_batcher) or 'error'.
+    The image is the calling thread's reused decode buffer unless own_buffer
+    is set (needed when it is used after the thread moves on to other work).
+    """
+    # Load the disease model
+    model = load_disease_model()
+    if model is None:
+        return {'error': 'Disease model not available'}
+
+    with stage_span('disease', 'digest'):
+        digest = content_digest(image_bytes)
+
+    # Same bytes + same model -> reuse the stored probabilities (retries, re-uploads)
+    with stage_span('disease', 'cache_lookup'):
+        cached = prediction_cache.get(digest, disease_registry.model_id)
+    if cached is not None:
+        log_event(disease_log, logging.DEBUG, 'prediction_cache_hit', digest=digest[:12])
+        return {'digest': digest, 'image_format': sniff_format(image_bytes), 'probabilities': cached}
+
+    # Decode the upload in memory (no temp file), downscaled straight to 128x128;
+    # the draft-mode downscale happens inside the decode, so both are one stage
     try:
-        # Check if image file is present
-        if 'image' not in request.files:
-            return {'success': False, 'error': 'No image file provided'}
-        
-        file = request.files['image']
-        if file.filename == '':
-            return {'success': False, 'error': 'No image file selected'}
-        
-        # Load the disease model
-        model = load_disease_model()
-        if model is None:
-            return {'success': False, 'error': 'Disease model not available'}
-        
-        # Debug: Check model input shape
-        print(f"Model input shape: {model.input_shape}")
-        print(f"Model output shape: {model.output_shape}")
-        
-        # Process the image using TensorFlow preprocessing
-        print("Processing image with TensorFlow preprocessing...")
-        
-        # Save uploaded file temporarily
-        temp_path = f"temp_{file.filename}"
-        file.save(temp_path)
-        
-        # Use TensorFlow preprocessing (matching Streamlit app)
-        image = tf.keras.preprocessing.image.load_img(temp_path, target_size=(128, 128))
-        input_arr = tf.keras.preprocessing.image.img_to_array(image)
-        input_arr = np.array([input_arr])  # convert single image to batch
-        
-        print(f"Image array shape: {input_arr.shape}")
-        print(f"Image array dtype: {input_arr.dtype}")
-        print(f"Image array min/max: {input_arr.min()}/{input_arr.max()}")
-        
-        # Clean up temp file
-        os.remove(temp_path)
-        
-        # Make prediction
-        print("Making prediction...")
-        predictions = model.predict(input_arr)
-        print(f"Raw predictions shape: {predictions.shape}")
-        print(f"Raw predictions: {predictions}")
-        
-        # Debug: Check if predictions are all the same
-        unique_predictions = np.unique(predictions)
-        print(f"Unique prediction values: {unique_predictions}")
-        print(f"Are all predictions identical? {len(unique_predictions) == 1}")
-        
+        with stage_span('disease', 'decode'):
+            out = np.empty((*DISEASE_INPUT_SIZE[::-1], 3), dtype=np.float32) if own_buffer else None
+            image_arr, image_format = decode_image(image_bytes, out=out)
+    except ValueError as e:
+        log_event(disease_log, logging.INFO, 'invalid_image', bytes=len(image_bytes), error=e)
+        return {'error': str(e)}
+
+    if disease_log.isEnabledFor(logging.DEBUG):
+        log_event(disease_log, logging.DEBUG, 'decoded', bytes=len(image_bytes), format=image_format,
+                  model_input=model.input_shape, shape=image_arr.shape, dtype=image_arr.dtype,
+                  min=float(image_arr.min()), max=float(image_arr.max()))
+    return {'digest': digest, 'image_format': image_format, 'image': image_arr}
+
+
+def build_disease_response(image_bytes: bytes, digest: str, image_format: str, probabilities) -> dict:
+    """Turn one probability vector into the /predict-disease JSON body and store the upload."""
+    with stage_span('disease', 'postprocess'):
+        predictions = np.asarray(probabilities)[np.newaxis, :]
         predicted_class_index = np.argmax(predictions)
         confidence = float(np.max(predictions) * 100)
-        
+
         # Get predicted class name
         predicted_class = DISEASE_CLASSES[predicted_class_index]
-        
+
         # Confidence threshold validation
         MIN_CONFIDENCE_THRESHOLD = 60.0  # Minimum confidence for reliable prediction
-        
+
         # Check if confidence is too low
         if confidence < MIN_CONFIDENCE_THRESHOLD:
-            print(f"⚠️ Low confidence prediction: {confidence:.1f}% (threshold: {MIN_CONFIDENCE_THRESHOLD}%)")
-            
-            # Get top 3 predictions for analysis
+            # Top 3 predictions for analysis
             top_3_indices = np.argsort(predictions[0])[-3:][::-1]
-            print("Top 3 predictions:")
-            for i, idx in enumerate(top_3_indices):
-                prob = predictions[0][idx] * 100
-                print(f"  {i+1}. {DISEASE_CLASSES[idx]}: {prob:.1f}%")
-        
+            log_event(disease_log, logging.INFO, 'low_confidence', digest=digest[:12],
+                      confidence=confidence, threshold=MIN_CONFIDENCE_THRESHOLD,
+                      top3=','.join(f"{DISEASE_CLASSES[idx]}:{predictions[0][idx] * 100:.1f}" for idx in top_3_indices))
+
         # Additional validation for potato diseases (common confusion)
         if 'Potato' in predicted_class:
             potato_early_idx = 4  # Potato___Early_blight
             potato_late_idx = 5   # Potato___Late_blight
-            
+
             early_prob = predictions[0][potato_early_idx] * 100
             late_prob = predictions[0][potato_late_idx] * 100
-            
-            print(f"Potato disease analysis:")
-            print(f"  Early blight: {early_prob:.1f}%")
-            print(f"  Late blight: {late_prob:.1f}%")
-            print(f"  Difference: {abs(early_prob - late_prob):.1f}%")
-            
+
             # If the difference is small, flag as uncertain
             if abs(early_prob - late_prob) < 15.0:
-                print(f"⚠️ Uncertain potato disease classification - small difference between early/late blight")
-        
-        # Debug: Print all prediction probabilities
-        print(f"All prediction probabilities: {[float(p) for p in predictions[0]]}")
-        print(f"Predicted class index: {int(predicted_class_index)}")
-        print(f"Predicted class: {predicted_class}")
-        print(f"Confidence: {float(confidence):.2f}%")
-        
-        # Debug: Check if this is always the same prediction
-        print(f"Model file being used: {'trained_plant_disease_model.keras' if os.path.exists('trained_plant_disease_model.keras') else 'plant_disease_model.h5'}")
-        
-        # Get all class probabilities for debugging
+                log_event(disease_log, logging.INFO, 'uncertain_potato_blight', digest=digest[:12],
+                          early_blight=float(early_prob), late_blight=float(late_prob))
+
+        if disease_log.isEnabledFor(logging.DEBUG):
+            log_event(disease_log, logging.DEBUG, 'prediction', digest=digest[:12],
+                      predicted=predicted_class, index=int(predicted_class_index), confidence=confidence,
+                      identical=len(np.unique(predictions)) == 1, model=disease_registry.model_id,
+                      model_path=disease_registry.model_path,
+                      probabilities=','.join(f"{float(p):.4f}" for p in predictions[0]))
+
+        # Get all class probabilities
         all_probabilities = {}
         for i, prob in enumerate(predictions[0]):
             all_probabilities[DISEASE_CLASSES[i]] = float(prob * 100)
-        
 
-        
-        # Save the uploaded image (optional)
-        upload_folder = 'static/uploads'
-        if not os.path.exists(upload_folder):
-            os.makedirs(upload_folder)
-        
-        # Generate unique filename
-        import uuid
-        filename = f"crop_{uuid.uuid4().hex[:8]}.jpg"
-        filepath = os.path.join(upload_folder, filename)
-        
-        # Convert TensorFlow image to PIL for saving
-        pil_image = tf.keras.preprocessing.image.array_to_img(input_arr[0])
-        pil_image.save(filepath)
-        
-        return {
-            'success': True,
-            'prediction': predicted_class,
-            'confidence': float(confidence),  
-            'image_path': f'/static/uploads/{filename}',
-            'all_probabilities': all_probabilities,
-            'disease_details': DISEASE_DETAILS.get(predicted_class, {
-                'plant': 'Unknown',
-                'status': 'Unknown',
-                'name': predicted_class.replace('_', ' '),
-                'symptoms': 'No specific info available.',
-                'treatment': 'Consult an expert.'
-            }),
-            'confidence_level': 'high' if confidence >= 80 else 'medium' if confidence >= 60 else 'low',
-            'debug_info': {
-                'predicted_index': int(predicted_class_index), 
-                'all_predictions': [float(p) for p in predictions[0].tolist()]
-            }
+    # Save the original upload bytes as-is (no re-encode); duplicates share one file
+    with stage_span('disease', 'store'):
+        image_path, written = save_upload_by_digest(image_bytes, digest, image_format)
+    prediction_cache.record_upload(len(image_bytes), written)
+    
+    return {
+        'success': True,
+        'prediction': predicted_class,
+        'confidence': float(confidence),  
+        'image_path': image_path,
+        'all_probabilities': all_probabilities,
+        'disease_details': DISEASE_DETAILS.get(predicted_class, {
+            'plant': 'Unknown',
+            'status': 'Unknown',
+            'name': predicted_class.replace('_', ' '),
+            'symptoms': 'No specific info available.',
+            'treatment': 'Consult an expert.'
+        }),
+        'confidence_level': 'high' if confidence >= 80 else 'medium' if confidence >= 60 else 'low',
+        'debug_info': {
+            'predicted_index': int(predicted_class_index), 
+            'all_predictions': [float(p) for p in predictions[0].tolist()]
         }
-        
-    except Exception as e:
-        print(f"Disease prediction error: {e}")
-        return {'success': False, 'error': f'Prediction failed: {str(e)}'}
+    }
+
+
+def predict_disease_bytes(image_bytes: bytes) -> dict:
+    """Run the whole pipeline synchronously on the calling thread."""
+    prepared = prepare_disease_input(image_bytes)
+    if 'error' in prepared:
+        return {'success': False, 'error': prepared['error']}
+
+    probabilities = prepared.get('probabilities')
+    if probabilities is None:
+        # Make prediction (batched with other in-flight requests); includes the queue wait
+        with stage_span('disease', 'inference'):
+            probabilities = disease_batcher.predict(prepared['image'])
+        prediction_cache.put(prepared['digest'], disease_registry.model_id, probabilities)
+
+    return build_disease_response(image_bytes, prepared['digest'], prepared['image_format'], probabilities)
+
+
+@app.route('/predict-disease', methods=['POST'])
+def predict_disease():
+    with stage_span('disease', 'total'):
+        try:
+            # Check if image file is present (parsing the multipart body reads the upload)
+            with stage_span('disease', 'upload'):
+                file = request.files.get('image')
+                if file is None:
+                    return {'success': False, 'error': 'No image file provided'}
+                if file.filename == '':
+                    return {'success': False, 'error': 'No image file selected'}
+                image_bytes = file.read()
+
+            return predict_disease_bytes(image_bytes)
+
+        except Exception as e:
+            disease_log.exception('prediction_failed error=%s', e)
+            return {'success': False, 'error': f'Prediction failed: {str(e)}'}
 
 @app.route('/test-model-prediction', methods=['GET'])
 def test_model_prediction():
@@ -1141,7 +1205,7 @@ def test_model_prediction():
         print(f"Test input shape: {test_input.shape}")
         print(f"Test input range: {test_input.min():.3f} to {test_input.max():.3f}")
         
-        predictions = model.predict(test_input)
+        predictions = model.predict(test_input, verbose=0)
         print(f"Test predictions shape: {predictions.shape}")
         print(f"Test predictions: {predictions}")
         
@@ -1161,13 +1225,59 @@ def test_model_prediction():
             'predicted_class': predicted_class,
             'confidence': confidence,
             'unique_predictions': unique_predictions.tolist(),
-            'predictions_vary': len(unique_predictions) > 1
+            'predictions_vary': len(unique_predictions) > 1,
+            'model': disease_registry.info()
         }
         
     except Exception as e:
         print(f"Model prediction test error: {e}")
         return {'success': False, 'error': f'Test failed: {str(e)}'}
 
+@app.route('/api/admin/runtime-stats', methods=['GET'])
+@admin_required
+@no_cache
+def api_admin_runtime_stats():
+    """Returns in-process serving metrics (model state, batching) for tuning."""
+    return {
+        'inference_mode': INFERENCE_MODE,
+        'disease_model': disease_registry.info(),
+        'disease_batcher': disease_batcher.stats(),
+        'db_pool': db_pool.stats(),
+        'rate_limiter': rate_limiter.stats(),
+        'brute_force': brute_force.stats(),
+        'password_hasher': password_hasher.stats(),
+        'user_cache': user_cache.stats(),
+        'prediction_cache': prediction_cache.stats(),
+        'log_writer': log_writer.stats()
+    }
+
+# Component stats exported next to the stage histograms on /metrics
+metrics.register_stats('disease_model', disease_registry.info)
+metrics.register_stats('disease_batcher', disease_batcher.stats)
+metrics.register_stats('prediction_cache', prediction_cache.stats)
+metrics.register_stats('log_writer', log_writer.stats)
+metrics.register_stats('db_pool', db_pool.stats)
+metrics.register_stats('password_hasher', password_hasher.stats)
+metrics.register_stats('user_cache', user_cache.stats)
+if INFERENCE_MODE == 'remote':
+    metrics.register_stats('inference_client', inference_client.stats)
+
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text format: this worker's pipeline stage histograms.
+    The component stats (admin-only on /api/admin/runtime-stats) are included
+    only with METRICS_TOKEN set and sent as 'Authorization: Bearer <token>';
+    a wrong token is rejected.
+    """
+    authorization = request.headers.get('Authorization')
+    authorized = bool(METRICS_TOKEN) and authorization is not None and \
+        secrets.compare_digest(authorization.encode(), f'Bearer {METRICS_TOKEN}'.encode())
+    if authorization is not None and not authorized:
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.render(include_stats=authorized), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # --------------------------
 # PLANT AI DASHBOARD (separate page)
 # --------------------------
@@ -1179,50 +1289,22 @@ def plant_dashboard():
     This is a separate page and does not modify existing UIs.
     """
     # Fetch logged-in user (id, email, username, profile_picture)
-    user = None
-    if 'user_id' in session:
-        with sqlite3.connect('database.db') as conn:
-            user = conn.execute(
-                "SELECT id, email, username, profile_picture FROM users WHERE id = ?",
-                (session['user_id'],)
-            ).fetchone()
+    user = user_cache.get(session.get('user_id'))
 
-    # Build last 12 months keys and labels (e.g., '2025-01', label 'Jan')
-    now = datetime.datetime.now()
-    month_keys = []  # e.g., '2025-01'
-    month_labels = []  # e.g., 'Jan'
-    y, m = now.year, now.month
-    for i in range(11, -1, -1):
-        yy = y
-        mm = m - i
-        while mm <= 0:
-            mm += 12
-            yy -= 1
-        month_keys.append(f"{yy:04d}-{mm:02d}")
-        month_labels.append(calendar.month_abbr[mm])
+    # Last 12 calendar months (keys like '2025-01', labels like 'Jan')
+    months = last_n_months(12)
+    month_labels = [m.label for m in months]
 
     # Recommendation metrics from logs
     crop_recommendations = 0
-    recs_by_month = {k: 0 for k in month_keys}
-    with sqlite3.connect('database.db') as conn:
+    with get_db() as conn:
         # Total recommendations
         cur = conn.execute("SELECT COUNT(*) FROM recommendation_logs")
         row = cur.fetchone()
         crop_recommendations = row[0] if row and row[0] is not None else 0
 
         # Count per month for last 12 months
-        cur = conn.execute(
-            """
-            SELECT strftime('%Y-%m', created_at) as ym, COUNT(*)
-            FROM recommendation_logs
-            GROUP BY ym
-            """
-        )
-        for ym, cnt in cur.fetchall():
-            if ym in recs_by_month:
-                recs_by_month[ym] = cnt
-
-    recs_per_month = [recs_by_month[k] for k in month_keys]
+        recs_per_month = monthly_counts(conn, 'recommendation_logs', months)
 
     # Rec growth = change between last month and previous month in percent
     last_month_cnt = recs_per_month[-1] if len(recs_per_month) >= 1 else 0
@@ -1241,7 +1323,7 @@ def plant_dashboard():
     disease_change = 0
 
     # Chart placeholders for diseases until logs are added for detections
-    diseases_per_month = [0 for _ in month_keys]
+    diseases_per_month = [0 for _ in months]
     
     # Recent detections table (sample data)
     recent_detections = [
@@ -1289,13 +1371,13 @@ def api_post_detection():
         return { 'error': 'Missing fields' }, 400
 
     try:
-        with sqlite3.connect('database.db') as conn:
-            cur = conn.cursor()
-            cur.execute(
+        # Written synchronously, not through log_writer: clients use the returned id
+        # (e.g. DELETE /api/detections/<id>), which a queued row does not have yet
+        with get_db() as conn:
+            detection_id = conn.execute(
                 "INSERT INTO detection_logs (user_id, plant_name, disease, confidence, image_url, all_probabilities) VALUES (?,?,?,?,?,?)",
                 (user_id, plant, disease, confidence, image_url, all_probabilities)
-            )
-            detection_id = cur.lastrowid
+            ).lastrowid
         return { 'success': True, 'detection_id': detection_id }
     except Exception as e:
         return { 'error': str(e) }, 500
@@ -1382,11 +1464,10 @@ def api_recommend_fertilizer():
         final_rec = " ".join(recommendations)
 
     try:
-        with sqlite3.connect('database.db') as conn:
-            conn.execute(
-                "INSERT INTO fertilizer_logs (user_id, crop, nitrogen_current, phosphorus_current, potassium_current, recommendation) VALUES (?,?,?,?,?,?)",
-                (user_id, crop, n_curr, p_curr, k_curr, final_rec)
-            )
+        log_writer.write(
+            "INSERT INTO fertilizer_logs (user_id, crop, nitrogen_current, phosphorus_current, potassium_current, recommendation) VALUES (?,?,?,?,?,?)",
+            (user_id, crop, n_curr, p_curr, k_curr, final_rec)
+        )
         return {
             'success': True,
             'crop': crop,
@@ -1402,7 +1483,7 @@ def api_recommend_fertilizer():
 def api_get_fertilizer_history():
     user_id = session.get('user_id')
     try:
-        with sqlite3.connect('database.db') as conn:
+        with get_db() as conn:
             conn.row_factory = sqlite3.Row
             rows = conn.execute(
                 "SELECT * FROM fertilizer_logs WHERE user_id = ? ORDER BY created_at DESC",
@@ -1413,49 +1494,136 @@ def api_get_fertilizer_history():
     except Exception as e:
         return {'error': str(e)}, 500
 
+# --- Keyset pagination for history endpoints ---
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+
+def _encode_cursor(created_at, row_id):
+    """Opaque cursor for the (created_at, id) position of the last row on a page."""
+    import base64
+    import json
+    raw = json.dumps([created_at, row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor):
+    import base64
+    import json
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return str(created_at), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def _history_page(conn, table, columns, filters, params):
+    """Fetch one page of `table` newest-first using keyset pagination on (created_at, id).
+
+    Reads `limit`, `cursor`, `from` and `to` (YYYY-MM-DD) from the query string.
+    `filters` are extra SQL conditions (with `params`) such as the user or disease.
+    Returns (rows, next_cursor); the column list must start with id and include created_at.
+    """
+    try:
+        limit = int(request.args.get('limit', HISTORY_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+
+    filters = list(filters)
+    params = list(params)
+
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+    try:
+        if date_from:
+            filters.append('created_at >= ?')
+            params.append(datetime.date.fromisoformat(date_from).isoformat())
+        if date_to:
+            # Inclusive end date: everything before the start of the next day
+            filters.append('created_at < ?')
+            params.append((datetime.date.fromisoformat(date_to) + datetime.timedelta(days=1)).isoformat())
+    except ValueError:
+        raise ValueError('from/to must be dates in YYYY-MM-DD format')
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        created_at, row_id = _decode_cursor(cursor)
+        filters.append('(created_at, id) < (?, ?)')
+        params.extend([created_at, row_id])
+
+    where = f"WHERE {' AND '.join(filters)}" if filters else ''
+    created_idx = columns.index('created_at')
+    rows = conn.execute(
+        f"SELECT {', '.join(columns)} FROM {table} {where} ORDER BY created_at DESC, id DESC LIMIT ?",
+        params + [limit + 1]
+    ).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1][created_idx], rows[-1][0])
+    return rows, next_cursor
+
+
+DETECTION_COLUMNS = ['id', 'user_id', 'plant_name', 'disease', 'confidence', 'image_url', 'created_at', 'all_probabilities']
+RECOMMENDATION_COLUMNS = ['id', 'user_id', 'crop', 'nitrogen', 'phosphorus', 'potassium', 'temperature', 'ph', 'created_at']
+
+
 @app.route('/api/detections', methods=['GET'])
 def api_get_detections():
-    """Returns detections for the logged-in user (or all if admin)."""
+    """Returns one page of detections for the logged-in user (or all if admin), newest first.
+    Query params: limit, cursor (from next_cursor), plant, disease, from, to.
+    """
     user_id = session.get('user_id')
+    filters, params = [], []
+    if user_id != 2:  # admin: return all
+        filters.append('user_id = ?')
+        params.append(user_id)
+    if request.args.get('plant'):
+        filters.append('plant_name = ?')
+        params.append(request.args['plant'])
+    if request.args.get('disease'):
+        filters.append('disease = ?')
+        params.append(request.args['disease'])
+
     try:
-        with sqlite3.connect('database.db') as conn:
-            cur = conn.cursor()
-            if user_id == 2:  # admin: return all
-                cur.execute("SELECT id, user_id, plant_name, disease, confidence, image_url, created_at, all_probabilities FROM detection_logs ORDER BY created_at DESC")
-            else:
-                cur.execute("SELECT id, user_id, plant_name, disease, confidence, image_url, created_at, all_probabilities FROM detection_logs WHERE user_id=? ORDER BY created_at DESC", (user_id,))
-            rows = cur.fetchall()
-        
-        results = []
-        import json
-        for r in rows:
-            probs = {}
-            try:
-                probs = json.loads(r[7] or '{}')
-            except:
-                pass
-            disease_key = (r[3] or "").strip()
-            results.append(dict(
-                id=r[0], 
-                user_id=r[1], 
-                plant_name=r[2], 
-                disease=r[3], 
-                confidence=r[4], 
-                image_url=r[5], 
-                created_at=r[6],
-                all_probabilities=probs,
-                disease_details=DISEASE_DETAILS.get(disease_key, {
-                    'plant': r[2] or 'Plant',
-                    'status': 'Unknown',
-                    'name': disease_key.replace('___', ': ').replace('_', ' ') or 'Unknown Disease',
-                    'symptoms': 'No specific info available for this historical record.',
-                    'treatment': 'Maintain general crop health and monitor for changes.'
-                })
-            ))
-        return { 'detections': results }
+        with get_db() as conn:
+            rows, next_cursor = _history_page(conn, 'detection_logs', DETECTION_COLUMNS, filters, params)
+    except ValueError as e:
+        return { 'error': str(e) }, 400
     except Exception as e:
         return { 'error': str(e) }, 500
 
+    results = []
+    import json
+    for r in rows:
+        probs = {}
+        try:
+            probs = json.loads(r[7] or '{}')
+        except:
+            pass
+        disease_key = (r[3] or "").strip()
+        results.append(dict(
+            id=r[0], 
+            user_id=r[1], 
+            plant_name=r[2], 
+            disease=r[3], 
+            confidence=r[4], 
+            image_url=r[5], 
+            created_at=r[6],
+            all_probabilities=probs,
+            disease_details=DISEASE_DETAILS.get(disease_key, {
+                'plant': r[2] or 'Plant',
+                'status': 'Unknown',
+                'name': disease_key.replace('___', ': ').replace('_', ' ') or 'Unknown Disease',
+                'symptoms': 'No specific info available for this historical record.',
+                'treatment': 'Maintain general crop health and monitor for changes.'
+            })
+        ))
+    return { 'detections': results, 'next_cursor': next_cursor, 'has_more': next_cursor is not None }
+
 
 @app.route('/api/detections/<int:detection_id>', methods=['DELETE'])
 def api_delete_detection(detection_id):
@@ -1466,7 +1634,7 @@ def api_delete_detection(detection_id):
         return { 'error': 'Authentication required' }, 401
     
     try:
-        with sqlite3.connect('database.db') as conn:
+        with get_db() as conn:
             cur = conn.cursor()
             
             # Check if the detection exists and belongs to the user (or user is admin)
@@ -1480,19 +1648,11 @@ def api_delete_detection(detection_id):
             if not detection:
                 return { 'error': 'Detection not found or access denied' }, 404
             
-            # Delete the associated image file if it exists
-            if detection[1]:  # image_url exists
-                import os
-                image_path = os.path.join('static', detection[1].lstrip('/static/'))
-                if os.path.exists(image_path):
-                    try:
-                        os.remove(image_path)
-                        print(f"Deleted image file: {image_path}")
-                    except Exception as e:
-                        print(f"Warning: Could not delete image file {image_path}: {e}")
-            
             # Delete the detection log entry
             cur.execute("DELETE FROM detection_logs WHERE id = ?", (detection_id,))
+
+        # Once committed, delete the associated image file unless another detection shares it
+        remove_unreferenced_uploads([detection[1]])
             
         return { 'success': True, 'message': 'Detection deleted successfully' }
     except Exception as e:
@@ -1501,43 +1661,48 @@ def api_delete_detection(detection_id):
 
 @app.route('/api/recommendations', methods=['GET'])
 def api_get_recommendations():
-    """Returns crop recommendations for the logged-in user (or all if admin)."""
+    """Returns one page of crop recommendations for the logged-in user (or all if admin), newest first.
+    Query params: limit, cursor (from next_cursor), crop, from, to.
+    """
     user_id = session.get('user_id')
+    filters, params = [], []
+    if user_id != 2:  # admin: return all
+        filters.append('user_id = ?')
+        params.append(user_id)
+    if request.args.get('crop'):
+        filters.append('crop = ?')
+        params.append(request.args['crop'])
+
     try:
-        with sqlite3.connect('database.db') as conn:
-            cur = conn.cursor()
-            if user_id == 2:  # admin: return all
-                cur.execute("SELECT id, user_id, crop, nitrogen, phosphorus, potassium, temperature, ph, created_at FROM recommendation_logs ORDER BY created_at DESC")
-            else:
-                cur.execute("SELECT id, user_id, crop, nitrogen, phosphorus, potassium, temperature, ph, created_at FROM recommendation_logs WHERE user_id=? ORDER BY created_at DESC", (user_id,))
-            rows = cur.fetchall()
+        with get_db() as conn:
+            rows, next_cursor = _history_page(conn, 'recommendation_logs', RECOMMENDATION_COLUMNS, filters, params)
         results = [dict(id=r[0], user_id=r[1], crop=r[2], nitrogen=r[3], phosphorus=r[4], potassium=r[5], temperature=r[6], ph=r[7], created_at=r[8]) for r in rows]
-        return { 'recommendations': results }
+        return { 'recommendations': results, 'next_cursor': next_cursor, 'has_more': next_cursor is not None }
+    except ValueError as e:
+        return { 'error': str(e) }, 400
     except Exception as e:
         return { 'error': str(e) }, 500
 
-@app.route('/api/recommendation', methods=['POST'])
-def api_post_recommendation():
-    """Accepts JSON: { crop, nitrogen, phosphorus, potassium, temperature, ph }
-    Stores recommendation event and returns the recommended crop (simple model used).
+crop_log = get_logger('plant.crop')
+
+
+def recommend_and_log(data: dict, user_id):
+    """Score one { nitrogen, phosphorus, potassium, temperature, ph } sample and queue its log row.
+    Returns (body, status) for /api/recommendation; shared with asgi.py.
     """
-    data = request.get_json() or {}
-    N = float(data.get('nitrogen') or 0)
-    P = float(data.get('phosphorus') or 0)
-    K = float(data.get('potassium') or 0)
-    T = float(data.get('temperature') or 0)
-    ph = float(data.get('ph') or 7)
-    user_id = session.get('user_id')
+    with stage_span('crop', 'parse'):
+        N = float(data.get('nitrogen') or 0)
+        P = float(data.get('phosphorus') or 0)
+        K = float(data.get('potassium') or 0)
+        T = float(data.get('temperature') or 0)
+        ph = float(data.get('ph') or 7)
 
     # True ML Recommendation using the loaded model and scalers
     try:
-        feature = np.array([N, P, K, T, ph]).reshape(1, -1)
-        mx_feature = mx.transform(feature)
-        sc_feature = sc.transform(mx_feature)
-        prediction = model.predict(sc_feature)[0]
-        crop = crop_dict.get(prediction, "Unknown")
+        with stage_span('crop', 'inference'):
+            crop = recommend_crops([[N, P, K, T, ph]])[0]
     except Exception as model_err:
-        print(f"Model prediction error in API: {model_err}")
+        log_event(crop_log, logging.WARNING, 'crop_model_failed', error=model_err, fallback='rules')
         # Fallback to simple logic if model fails
         crop = 'Wheat'
         if N>120 and ph>6 and T>28: crop='Sugarcane'
@@ -1545,54 +1710,158 @@ def api_post_recommendation():
         elif P>60: crop='Potato'
 
     try:
-        with sqlite3.connect('database.db') as conn:
-            conn.execute(
-                "INSERT INTO recommendation_logs (user_id, crop, nitrogen, phosphorus, potassium, temperature, ph) VALUES (?,?,?,?,?,?,?)",
-                (user_id, crop, N, P, K, T, ph)
-            )
-        return { 'recommended': crop }
+        with stage_span('crop', 'log'):
+            log_writer.write(RECOMMENDATION_LOG_INSERT, (user_id, crop, N, P, K, T, ph))
+        return { 'recommended': crop }, 200
     except Exception as e:
         return { 'error': str(e) }, 500
 
+@app.route('/api/recommendation', methods=['POST'])
+def api_post_recommendation():
+    """Accepts JSON: { crop, nitrogen, phosphorus, potassium, temperature, ph }
+    Stores recommendation event and returns the recommended crop (simple model used).
+    """
+    with stage_span('crop', 'total'):
+        data = request.get_json() or {}
+        return recommend_and_log(data, session.get('user_id'))
+
+
+# Column names accepted for each feature in batch uploads (lowercased)
+BATCH_FEATURE_ALIASES = {
+    'nitrogen': ('nitrogen', 'n'),
+    'phosphorus': ('phosphorus', 'p'),
+    'potassium': ('potassium', 'k'),
+    'temperature': ('temperature', 'temp', 't'),
+    'ph': ('ph',),
+}
+MAX_BATCH_ROWS = 10000
+
+
+def _parse_batch_row(item):
+    """Turn one JSON object, JSON list or CSV dict into [N, P, K, temperature, ph]."""
+    if isinstance(item, (list, tuple)):
+        if len(item) != len(CROP_FEATURES):
+            raise ValueError(f"Expected {len(CROP_FEATURES)} values: {', '.join(CROP_FEATURES)}")
+        values = [float(v) for v in item]
+    elif isinstance(item, dict):
+        lowered = {str(k).strip().lower(): v for k, v in item.items()}
+        values = []
+        for feature in CROP_FEATURES:
+            raw = next((lowered[a] for a in BATCH_FEATURE_ALIASES[feature] if lowered.get(a) not in (None, '')), None)
+            if raw is None:
+                raise ValueError(f"Missing field: {feature}")
+            values.append(float(raw))
+    else:
+        raise ValueError("Each sample must be an object or a list of values")
+
+    errors = validate_crop_inputs(*values)
+    if errors:
+        raise ValueError("; ".join(errors))
+    return values
+
+
+@app.route('/api/recommendation/batch', methods=['POST'])
+@rate_limiter.limit("10 per minute")
+def api_post_recommendation_batch():
+    """Accepts a JSON array of samples (or { samples: [...] }) or a CSV upload in field 'file'
+    with columns N/nitrogen, P/phosphorus, K/potassium, temperature, ph.
+    Scores every valid row in one vectorized pass, logs them in one transaction and
+    streams back one JSON line per input row (application/x-ndjson).
+    """
+    import csv
+    import io
+    import json
+
+    if 'file' in request.files:
+        try:
+            text = request.files['file'].read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            return {'error': 'CSV file must be UTF-8 encoded'}, 400
+        items = list(csv.DictReader(io.StringIO(text)))
+    else:
+        data = request.get_json(silent=True)
+        items = data.get('samples') if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return {'error': 'Expected a JSON array of samples or a CSV file upload'}, 400
+
+    if not items:
+        return {'error': 'No samples provided'}, 400
+    if len(items) > MAX_BATCH_ROWS:
+        return {'error': f'Too many samples. Maximum is {MAX_BATCH_ROWS} per request'}, 413
+
+    # Parse and validate; invalid rows are reported individually and not scored
+    features = []
+    valid_rows = []
+    row_errors = {}
+    with stage_span('crop_batch', 'parse'):
+        for i, item in enumerate(items):
+            try:
+                features.append(_parse_batch_row(item))
+                valid_rows.append(i)
+            except (TypeError, ValueError) as e:
+                row_errors[i] = str(e)
+
+    with stage_span('crop_batch', 'inference'):
+        crops = recommend_crops(features) if features else []
+    results = dict(zip(valid_rows, crops))
+
+    # Log all scored rows (one queued item, committed in a single batch)
+    if features:
+        user_id = session.get('user_id')
+        try:
+            with stage_span('crop_batch', 'log'):
+                log_writer.write_many(
+                    RECOMMENDATION_LOG_INSERT,
+                    [(user_id, crop, *row) for crop, row in zip(crops, features)]
+                )
+        except Exception as log_err:
+            print(f"Batch recommendation log insert failed: {log_err}")
+
+    def generate():
+        for i in range(len(items)):
+            if i in results:
+                line = {'row': i, 'recommended': results[i]}
+            else:
+                line = {'row': i, 'error': row_errors[i]}
+            yield json.dumps(line) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'X-Batch-Rows': str(len(items)),
+        'X-Batch-Errors': str(len(row_errors))
+    })
+
 
 @app.route('/api/dashboard-data', methods=['GET'])
 def api_dashboard_data():
     """Returns aggregated numbers and chart data for the current user (or admin sees all)."""
     user_id = session.get('user_id')
-    now = datetime.datetime.now()
-    month_keys = []
-    for i in range(11, -1, -1):
-        dt = now - datetime.timedelta(days=30*i)
-        month_keys.append(dt.strftime('%Y-%m'))
+    months = last_n_months(12)
+    month_keys = [m.key for m in months]
 
     try:
-        with sqlite3.connect('database.db') as conn:
+        with get_db() as conn:
             cur = conn.cursor()
-            # KPIs
+            # KPIs (from rollups); without a session there is no user, so no counts
             if user_id == 2:
-                cur.execute('SELECT COUNT(*) FROM detection_logs')
-                total_detections = cur.fetchone()[0] or 0
-                cur.execute('SELECT COUNT(*) FROM recommendation_logs')
-                total_recs = cur.fetchone()[0] or 0
+                counts = rollups.totals(conn)
+            elif user_id is None:
+                counts = {'detections': 0, 'recommendations': 0, 'fertilizer': 0}
             else:
-                cur.execute('SELECT COUNT(*) FROM detection_logs WHERE user_id=?', (user_id,))
-                total_detections = cur.fetchone()[0] or 0
-                cur.execute('SELECT COUNT(*) FROM recommendation_logs WHERE user_id=?', (user_id,))
-                total_recs = cur.fetchone()[0] or 0
+                counts = rollups.user_totals(conn, user_id)
+            total_detections = counts['detections']
+            total_recs = counts['recommendations']
 
             # Disease distribution
-            cur.execute('SELECT disease, COUNT(*) FROM detection_logs GROUP BY disease')
-            dist = cur.fetchall()
+            dist = rollups.distribution(conn, 'detection_logs')
 
             # Recommendations per month
-            recs_by_month = []
-            for mk in month_keys:
-                like = mk + '%'
-                if user_id == 2:
-                    cur.execute("SELECT COUNT(*) FROM recommendation_logs WHERE strftime('%Y-%m', created_at)=?", (mk,))
-                else:
-                    cur.execute("SELECT COUNT(*) FROM recommendation_logs WHERE user_id=? AND strftime('%Y-%m', created_at)=?", (user_id, mk))
-                recs_by_month.append(cur.fetchone()[0] or 0)
+            if user_id == 2:
+                recs_by_month = rollups.monthly_totals(conn, 'recommendation_logs', months)
+            elif user_id is None:
+                # monthly_counts(user_id=None) means every user's rows, not "no user"
+                recs_by_month = [0] * len(months)
+            else:
+                recs_by_month = monthly_counts(conn, 'recommendation_logs', months, user_id=user_id)
 
             # Recent 5 detections
             if user_id == 2:
@@ -1624,12 +1893,7 @@ def api_auth_me():
         return {'authenticated': False}, 200
     
     try:
-        with sqlite3.connect('database.db') as conn:
-            user = conn.execute(
-                "SELECT id, email, username, profile_picture, is_admin FROM users WHERE id = ?",
-                (user_id,)
-            ).fetchone()
-            
+        user = user_cache.get(user_id)
         if not user:
             return {'authenticated': False}, 200
             
@@ -1659,7 +1923,7 @@ def api_update_profile():
         return {'error': 'Username is required'}, 400
         
     try:
-        with sqlite3.connect('database.db') as conn:
+        with get_db() as conn:
             # Check if username is taken by another user
             existing = conn.execute(
                 "SELECT id FROM users WHERE username = ? AND id != ?",
@@ -1673,6 +1937,7 @@ def api_update_profile():
                 "UPDATE users SET username = ?, profile_picture = ? WHERE id = ?",
                 (username, profile_picture, user_id)
             )
+        user_cache.invalidate(user_id)
         return {'success': True, 'message': 'Profile updated successfully'}
     except Exception as e:
         return {'error': str(e)}, 500
@@ -1720,7 +1985,7 @@ def api_update_profile_picture():
         # Relative path for DB/Frontend
         relative_path = f"/static/uploads/{filename}"
         
-        with sqlite3.connect('database.db') as conn:
+        with get_db() as conn:
             # Delete old profile picture if exists
             old_picture = conn.execute("SELECT profile_picture FROM users WHERE id = ?", (user_id,)).fetchone()
             if old_picture and old_picture[0] and old_picture[0].startswith('/static/uploads/'):
@@ -1729,6 +1994,7 @@ def api_update_profile_picture():
 
             # Update with new picture
             conn.execute("UPDATE users SET profile_picture = ? WHERE id = ?", (relative_path, user_id))
+        user_cache.invalidate(user_id)
             
         return jsonify({'success': True, 'profile_picture': relative_path, 'message': 'Profile picture updated successfully'})
         
@@ -1748,16 +2014,24 @@ def api_change_password():
         return {'error': 'Current and new passwords are required'}, 400
         
     try:
-        with sqlite3.connect('database.db') as conn:
+        with get_db() as conn:
             user = conn.execute("SELECT password FROM users WHERE id = ?", (user_id,)).fetchone()
-            
-            if not user or not check_password_hash(user[0], current_password):
-                return {'error': 'Incorrect current password'}, 401
-                
-            hashed_new_password = generate_password_hash(new_password)
-            conn.execute("UPDATE users SET password = ? WHERE id = ?", (hashed_new_password, user_id))
+
+        # Verify and hash with no connection checked out; the KDFs take tens of milliseconds
+        if not user or not password_hasher.verify(user[0], current_password):
+            return {'error': 'Incorrect current password'}, 401
+        hashed_new_password = password_hasher.hash(new_password)
+
+        with get_db() as conn:
+            # Only if the password was not changed meanwhile
+            updated = conn.execute("UPDATE users SET password = ? WHERE id = ? AND password = ?",
+                                   (hashed_new_password, user_id, user[0])).rowcount
+        if not updated:
+            return {'error': 'Password was changed in the meantime, please try again'}, 409
             
         return {'success': True, 'message': 'Password changed successfully'}
+    except HashingSaturated:
+        raise
     except Exception as e:
         return {'error': str(e)}, 500
 
@@ -1768,21 +2042,14 @@ def api_delete_account():
     user_id = session.get('user_id')
     
     try:
-        with sqlite3.connect('database.db') as conn:
-            # Delete detection logs and their images first
-            cur = conn.execute("SELECT image_url FROM detection_logs WHERE user_id = ?", (user_id,))
-            for row in cur.fetchall():
-                if row[0]:
-                    image_path = os.path.join('static', row[0].lstrip('/static/'))
-                    if os.path.exists(image_path):
-                        try:
-                            os.remove(image_path)
-                        except:
-                            pass
-            
+        with get_db() as conn:
+            # Delete detection logs; their images go after the commit unless other detections share them
+            image_urls = [row[0] for row in conn.execute("SELECT image_url FROM detection_logs WHERE user_id = ?", (user_id,))]
             conn.execute("DELETE FROM detection_logs WHERE user_id = ?", (user_id,))
             conn.execute("DELETE FROM recommendation_logs WHERE user_id = ?", (user_id,))
             conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        remove_unreferenced_uploads(image_urls)
+        user_cache.invalidate(user_id)
             
         session.clear()
         return {'success': True, 'message': 'Account deleted successfully'}
@@ -1797,35 +2064,27 @@ def api_delete_account():
 def api_admin_stats():
     """Returns platform-wide statistics for the admin dashboard."""
     try:
-        with sqlite3.connect('database.db') as conn:
-            cur = conn.cursor()
-            
-            # Key Metrics
-            total_users = cur.execute("SELECT COUNT(*) FROM users").fetchone()[0]
-            total_detections = cur.execute("SELECT COUNT(*) FROM detection_logs").fetchone()[0]
-            total_recommendations = cur.execute("SELECT COUNT(*) FROM recommendation_logs").fetchone()[0]
+        with get_db() as conn:
+            # Everything below reads precomputed rollups (see rollups.py)
+            counts = rollups.totals(conn)
+            total_users = counts['users']
+            total_detections = counts['detections']
+            total_recommendations = counts['recommendations']
             
             # Disease Distribution (Most/Least Predicted)
-            cur.execute("SELECT disease, COUNT(*) as c FROM detection_logs GROUP BY disease ORDER BY c DESC")
-            disease_stats = [{'name': row[0], 'count': row[1]} for row in cur.fetchall()]
+            disease_stats = [{'name': name, 'count': c} for name, c in rollups.distribution(conn, 'detection_logs')]
             
             # Crop Recommendation Distribution
-            cur.execute("SELECT crop, COUNT(*) as c FROM recommendation_logs GROUP BY crop ORDER BY c DESC")
-            crop_stats = [{'name': row[0], 'count': row[1]} for row in cur.fetchall()]
+            crop_stats = [{'name': name, 'count': c} for name, c in rollups.distribution(conn, 'recommendation_logs')]
             
             # Monthly Activity (Last 6 months)
-            month_stats = []
-            now = datetime.datetime.now()
-            for i in range(5, -1, -1):
-                dt = now - datetime.timedelta(days=30*i)
-                month_str = dt.strftime('%Y-%m')
-                det_count = cur.execute("SELECT COUNT(*) FROM detection_logs WHERE strftime('%Y-%m', created_at) = ?", (month_str,)).fetchone()[0]
-                rec_count = cur.execute("SELECT COUNT(*) FROM recommendation_logs WHERE strftime('%Y-%m', created_at) = ?", (month_str,)).fetchone()[0]
-                month_stats.append({
-                    'month': dt.strftime('%b'),
-                    'detections': det_count,
-                    'recommendations': rec_count
-                })
+            months = last_n_months(6)
+            det_counts = rollups.monthly_totals(conn, 'detection_logs', months)
+            rec_counts = rollups.monthly_totals(conn, 'recommendation_logs', months)
+            month_stats = [
+                {'month': m.label, 'detections': d, 'recommendations': r}
+                for m, d, r in zip(months, det_counts, rec_counts)
+            ]
 
         return {
             'total_users': total_users,
@@ -1838,31 +2097,137 @@ def api_admin_stats():
     except Exception as e:
         return {'error': str(e)}, 500
 
+# sort key -> ORDER BY column expression. Each one is backed by an index
+# (rollup_user rowid, users.username, idx_rollup_user_*), so a page never sorts
+# the whole user table.
+ADMIN_USER_SORTS = {
+    'id': 'r.user_id',
+    'username': 'u.username',
+    'detections': 'r.detections',
+    'recommendations': 'r.recommendations',
+    'activity': 'r.detections + r.recommendations',
+}
+ADMIN_USERS_PAGE_SIZE = 50
+ADMIN_USERS_MAX_PAGE_SIZE = 200
+
+
 @app.route('/api/admin/users', methods=['GET'])
 @admin_required
 @no_cache
 def api_admin_users():
-    """Returns a list of all users with activity summaries."""
+    """
+    Returns one page of users with activity summaries.
+
+    Counts come from the trigger-maintained rollup_user table instead of
+    counting each user's logs. Pages use keyset pagination on (sort key,
+    user_id), so a page costs the same at any depth. Query params: per_page,
+    sort (id|username|detections|recommendations|activity), order (asc|desc),
+    search (case-insensitive substring of username or email, applied before
+    paging), cursor (next_cursor of the previous page, same sort, order and
+    search).
+    """
+    sort = request.args.get('sort', 'id')
+    order = request.args.get('order', 'desc').lower()
+    search = request.args.get('search', '').strip()[:100]
+    if sort not in ADMIN_USER_SORTS or order not in ('asc', 'desc'):
+        return {'error': 'Invalid sort or order'}, 400
     try:
-        with sqlite3.connect('database.db') as conn:
+        per_page = min(max(1, int(request.args.get('per_page', ADMIN_USERS_PAGE_SIZE))), ADMIN_USERS_MAX_PAGE_SIZE)
+    except ValueError:
+        return {'error': 'per_page must be an integer'}, 400
+
+    # Tie-break on user_id so pages are stable when counts are equal (id and username are unique)
+    keys = [ADMIN_USER_SORTS[sort]]
+    if sort not in ('id', 'username'):
+        keys.append('r.user_id')
+    order_by = ', '.join(f"{key} {order.upper()}" for key in keys)
+
+    conditions = []
+    params = []
+    if search:
+        pattern = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        conditions.append("(u.username LIKE ? ESCAPE '\\' OR u.email LIKE ? ESCAPE '\\')")
+        params += [pattern, pattern]
+    search_where = f"WHERE {conditions[0]}" if conditions else ''
+    search_params = list(params)
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            cursor_sort, cursor_order, cursor_search, *values = _decode_admin_users_cursor(cursor)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        if (cursor_sort, cursor_order, cursor_search) != (sort, order, search) or len(values) != len(keys):
+            return {'error': 'Cursor does not match sort, order and search'}, 400
+        op = '<' if order == 'desc' else '>'
+        if len(keys) == 1:
+            conditions.append(f"{keys[0]} {op} ?")
+            params += values
+        else:
+            # Spelled out rather than as a row value so SQLite can seek the expression index
+            conditions.append(f"{keys[0]} {op}= ? AND ({keys[0]} {op} ? OR {keys[1]} {op} ?)")
+            params += [values[0], values[0], values[1]]
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    try:
+        with get_db() as conn:
             conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            query = """
-                SELECT 
+            rows = conn.execute(f"""
+                SELECT
                     u.id, u.username, u.email, u.is_admin, u.banned_until, u.ban_reason,
-                    (SELECT COUNT(*) FROM detection_logs WHERE user_id = u.id) as detection_count,
-                    (SELECT COUNT(*) FROM recommendation_logs WHERE user_id = u.id) as recommendation_count
-                FROM users u
-                ORDER BY u.id DESC
-            """
-            users = [dict(row) for row in cursor.execute(query).fetchall()]
-            
-        return {'users': users}
+                    r.detections AS detection_count,
+                    r.recommendations AS recommendation_count,
+                    {ADMIN_USER_SORTS[sort]} AS sort_key
+                FROM rollup_user r
+                JOIN users u ON u.id = r.user_id
+                {where}
+                ORDER BY {order_by}
+                LIMIT ?
+            """, params + [per_page + 1]).fetchall()
+            if search:
+                total = conn.execute(f"SELECT COUNT(*) FROM users u {search_where}", search_params).fetchone()[0]
+            else:
+                total = rollups.totals(conn)['users']
+
+        users = [dict(row) for row in rows[:per_page]]
+        next_cursor = None
+        if len(rows) > per_page:
+            last = users[-1]
+            values = [last['sort_key'], last['id']] if len(keys) == 2 else [last['sort_key']]
+            next_cursor = _encode_admin_users_cursor([sort, order, search, *values])
+        for user in users:
+            del user['sort_key']
+        return {
+            'users': users,
+            'per_page': per_page,
+            'total': total,
+            'has_more': next_cursor is not None,
+            'next_cursor': next_cursor,
+        }
     except Exception as e:
         print(f"Error fetching users: {e}")
         return {'error': str(e)}, 500
 
+
+def _encode_admin_users_cursor(values):
+    """Opaque cursor: [sort, order, search, sort key value(s) of the last row on a page]."""
+    import base64
+    import json
+    raw = json.dumps(values).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_admin_users_cursor(cursor):
+    import base64
+    import json
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) < 4 or not all(isinstance(v, (str, int)) for v in values):
+        raise ValueError('Invalid cursor')
+    return values
+
 @app.route('/api/admin/users/<int:user_id>/status', methods=['PUT'])
 @admin_required
 def api_admin_update_user_status(user_id):
@@ -1875,7 +2240,7 @@ def api_admin_update_user_status(user_id):
         return {'error': 'Action is required'}, 400
         
     try:
-        with sqlite3.connect('database.db') as conn:
+        with get_db() as conn:
             if action == 'unban':
                 conn.execute("UPDATE users SET banned_until = NULL, ban_reason = NULL WHERE id = ?", (user_id,))
             elif action == 'ban':
@@ -1890,6 +2255,7 @@ def api_admin_update_user_status(user_id):
                 conn.execute("UPDATE users SET banned_until = ?, ban_reason = ? WHERE id = ?", (banned_until, reason, user_id))
             else:
                 return {'error': 'Invalid action'}, 400
+        user_cache.invalidate(user_id)
                 
         return {'success': True}
     except Exception as e:
@@ -1903,21 +2269,14 @@ def api_admin_delete_user(user_id):
         return {'error': 'Cannot self-delete via this endpoint'}, 400
         
     try:
-        with sqlite3.connect('database.db') as conn:
-             # Delete detection logs and their images first
-            cur = conn.execute("SELECT image_url FROM detection_logs WHERE user_id = ?", (user_id,))
-            for row in cur.fetchall():
-                if row[0]:
-                    image_path = os.path.join('static', row[0].lstrip('/static/'))
-                    if os.path.exists(image_path):
-                        try:
-                            os.remove(image_path)
-                        except:
-                            pass
-            
+        with get_db() as conn:
+            # Delete detection logs; their images go after the commit unless other detections share them
+            image_urls = [row[0] for row in conn.execute("SELECT image_url FROM detection_logs WHERE user_id = ?", (user_id,))]
             conn.execute("DELETE FROM detection_logs WHERE user_id = ?", (user_id,))
             conn.execute("DELETE FROM recommendation_logs WHERE user_id = ?", (user_id,))
             conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        remove_unreferenced_uploads(image_urls)
+        user_cache.invalidate(user_id)
             
         return {'success': True}
     except Exception as e:
@@ -1929,15 +2288,11 @@ def api_admin_delete_user(user_id):
 def dashboard_complete():
     """Route for dashboard_complete.html template"""
     # Fetch logged-in user (id, email, username, profile_picture)
-    user = None
-    if 'user_id' in session:
-        with sqlite3.connect('database.db') as conn:
-            user = conn.execute(
-                "SELECT id, email, username, profile_picture FROM users WHERE id = ?",
-                (session['user_id'],)
-            ).fetchone()
+    user = user_cache.get(session.get('user_id'))
 
     return render_template('dashboard_complete.html', user=user)
 
 if __name__ == '__main__':
+    if DISEASE_MODEL_WARMUP:
+        preload_inference()
     app.run(debug=True, use_reloader=False)
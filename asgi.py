@@ -0,0 +1,263 @@
+"""
+This module provides:
+- An asyncio (ASGI) serving mode for the prediction endpoints:
+  POST /predict-disease and POST /api/recommendation
+- Request bodies are read chunk by chunk from the event loop (multipart
+  uploads are parsed incrementally), so a slow mobile upload holds an open
+  connection and a small buffer, not a worker thread
+- Decoding, scoring and response building run on a bounded thread pool
+  (ASYNC_INFERENCE_WORKERS); disease inference is awaited on the shared
+  micro-batcher without holding any thread while it waits
+- Every other route (and any other method) is served by the Flask app
+  through asgiref's WSGI adapter, unchanged
+
+Route paths and JSON bodies are the same as the Flask views; both call the
+same functions in app.py (prepare_disease_input, build_disease_response,
+recommend_and_log).
+
+Usage:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+
+import os
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_cookie, parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, File, Field, Data, Epilogue, NeedData
+from werkzeug.wrappers import Response
+
+import app as flask_views
+from app import app as flask_app
+from security import add_security_headers
+from log_writer import log_writer
+from metrics import stage_span
+
+
+class RequestTooLarge(Exception):
+    """The body exceeded MAX_CONTENT_LENGTH."""
+
+
+class PredictionServer:
+    """
+    ASGI application: the prediction endpoints natively, everything else via Flask.
+
+    Handlers only await socket reads and futures; CPU work is handed to
+    `executor`, so the number of open uploads is limited by the server's
+    connection limit rather than by the number of threads.
+    """
+
+    def __init__(self, flask_app, workers=4, max_body=None):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='async-inference')
+        self.max_body = max_body or flask_app.config.get('MAX_CONTENT_LENGTH') or 16 * 1024 * 1024
+        self.routes = {
+            ('POST', '/predict-disease'): self.predict_disease,
+            ('POST', '/api/recommendation'): self.post_recommendation,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http':
+            handler = self.routes.get((scope['method'], scope['path']))
+            if handler is not None:
+                return await handler(scope, receive, send)
+        return await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if flask_views.DISEASE_MODEL_WARMUP:
+                    await self.run(flask_views.preload_inference)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # Let queued log rows commit before the process goes away
+                await asyncio.get_running_loop().run_in_executor(None, log_writer.flush)
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    # --- request helpers ---
+
+    @staticmethod
+    def _headers(scope) -> Headers:
+        return Headers([(k.decode('latin-1'), v.decode('latin-1')) for k, v in scope['headers']])
+
+    def _check_length(self, scope):
+        length = self._headers(scope).get('content-length', type=int)
+        if length is not None and length > self.max_body:
+            raise RequestTooLarge()
+
+    async def _body_chunks(self, scope, receive):
+        """Yield the request body as it arrives, enforcing max_body."""
+        self._check_length(scope)
+        received = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise ConnectionResetError("Client disconnected")
+            chunk = message.get('body', b'')
+            received += len(chunk)
+            if received > self.max_body:
+                raise RequestTooLarge()
+            if chunk:
+                yield chunk
+            if not message.get('more_body', False):
+                return
+
+    async def _read_upload(self, scope, receive, field_name):
+        """
+        Stream a multipart/form-data body and keep only the file part `field_name`.
+
+        Returns:
+            (filename, bytes), or None if there is no such file part
+        """
+        mimetype, options = parse_options_header(self._headers(scope).get('content-type', ''))
+        boundary = options.get('boundary', '').encode('latin-1')
+        if mimetype != 'multipart/form-data' or not boundary:
+            # Drain the body so the connection can be reused
+            async for _ in self._body_chunks(scope, receive):
+                pass
+            return None
+
+        decoder = MultipartDecoder(boundary, max_form_memory_size=self.max_body)
+        found = None
+        filename = None
+        current = None   # chunks of the wanted file, or None while skipping other parts
+
+        def consume():
+            nonlocal found, filename, current
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File) and event.name == field_name and found is None:
+                    filename, current = event.filename, []
+                elif isinstance(event, (File, Field)):
+                    current = None
+                elif isinstance(event, Data) and current is not None:
+                    current.append(event.data)
+                    if not event.more_data:
+                        found = (filename, b''.join(current))
+                        current = None
+                event = decoder.next_event()
+
+        async for chunk in self._body_chunks(scope, receive):
+            decoder.receive_data(chunk)
+            consume()
+        decoder.receive_data(None)
+        consume()
+        return found
+
+    async def _read_json(self, scope, receive):
+        body = b''.join([chunk async for chunk in self._body_chunks(scope, receive)])
+        if not body:
+            return None
+        return json.loads(body)
+
+    def _session_user_id(self, scope):
+        """The user_id from Flask's signed session cookie, or None."""
+        cookie = parse_cookie(self._headers(scope).get('cookie', '')).get(self.flask_app.config['SESSION_COOKIE_NAME'])
+        if not cookie:
+            return None
+        serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+        if serializer is None:
+            return None
+        try:
+            data = serializer.loads(cookie, max_age=int(self.flask_app.permanent_session_lifetime.total_seconds()))
+        except Exception:
+            return None
+        return data.get('user_id')
+
+    async def _respond(self, send, body, status=200):
+        response = Response(self.flask_app.json.dumps(body) + '\n', status=status, mimetype='application/json')
+        add_security_headers(response)
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in response.headers.to_wsgi_list()],
+        })
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+
+    # --- routes ---
+
+    async def predict_disease(self, scope, receive, send):
+        with stage_span('disease', 'total'):
+            return await self._predict_disease(scope, receive, send)
+
+    async def _predict_disease(self, scope, receive, send):
+        try:
+            # Spans the whole (possibly slow) streamed upload, not a thread's time
+            with stage_span('disease', 'upload'):
+                upload = await self._read_upload(scope, receive, 'image')
+            if upload is None:
+                return await self._respond(send, {'success': False, 'error': 'No image file provided'})
+            filename, image_bytes = upload
+            if not filename:
+                return await self._respond(send, {'success': False, 'error': 'No image file selected'})
+
+            # The image must not be the executor thread's reused decode buffer: the
+            # thread picks up the next upload while this one awaits the batcher
+            prepared = await self.run(flask_views.prepare_disease_input, image_bytes, True)
+            if 'error' in prepared:
+                return await self._respond(send, {'success': False, 'error': prepared['error']})
+
+            probabilities = prepared.get('probabilities')
+            if probabilities is None:
+                # Await the shared micro-batcher directly; no thread waits on the model
+                with stage_span('disease', 'inference'):
+                    future = flask_views.disease_batcher.submit(prepared['image'])
+                    try:
+                        probabilities = await asyncio.wait_for(asyncio.wrap_future(future), flask_views.disease_batcher.timeout)
+                    except (asyncio.TimeoutError, asyncio.CancelledError):
+                        # Timed out or client gone: drop the sample before it takes a batch slot
+                        future.cancel()
+                        raise
+                flask_views.prediction_cache.put(prepared['digest'], flask_views.disease_registry.model_id, probabilities)
+
+            body = await self.run(
+                flask_views.build_disease_response,
+                image_bytes, prepared['digest'], prepared['image_format'], probabilities
+            )
+            return await self._respond(send, body)
+        except RequestTooLarge:
+            return await self._respond(send, {'success': False, 'error': 'Upload too large'}, 413)
+        except ConnectionResetError:
+            return
+        except Exception as e:
+            flask_views.disease_log.exception('prediction_failed error=%s', e)
+            return await self._respond(send, {'success': False, 'error': f'Prediction failed: {str(e)}'})
+
+    async def post_recommendation(self, scope, receive, send):
+        with stage_span('crop', 'total'):
+            return await self._post_recommendation(scope, receive, send)
+
+    async def _post_recommendation(self, scope, receive, send):
+        try:
+            data = await self._read_json(scope, receive)
+        except RequestTooLarge:
+            return await self._respond(send, {'error': 'Request too large'}, 413)
+        except ConnectionResetError:
+            return
+        except ValueError:
+            return await self._respond(send, {'error': 'Invalid JSON body'}, 400)
+
+        try:
+            body, status = await self.run(flask_views.recommend_and_log, data or {}, self._session_user_id(scope))
+        except (TypeError, ValueError, AttributeError) as e:
+            return await self._respond(send, {'error': str(e)}, 400)
+        return await self._respond(send, body, status)
+
+
+# ASGI entry point
+application = PredictionServer(
+    flask_app,
+    workers=int(os.environ.get('ASYNC_INFERENCE_WORKERS', min(8, os.cpu_count() or 1))),
+)
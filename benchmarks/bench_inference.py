@@ -0,0 +1,293 @@
+"""
+This module provides:
+- A reproducible benchmark of the serving path: the real /predict-disease,
+  /predict and /api/recommendation handlers driven through Flask's test
+  client (routing, parsing, decoding, inference, logging, JSON/HTML)
+- Inputs: the JPEGs in test/test/ and rows sampled (fixed seed) from
+  Crop_recommendation.csv
+- p50/p95/p99 latency and throughput at several concurrency levels, peak
+  RSS, and accuracy (disease: test images whose class the model knows,
+  labelled by file name; crops: the CSV label)
+- JSON results (with commit and configuration) for comparing commits, and
+  --compare to print the change against an earlier result file
+
+The prediction cache is disabled by default so every upload reaches the
+model; pass --prediction-cache to measure with it. The database is a fresh
+temporary file. If the HTML templates are not present, /predict renders a
+minimal stand-in template (reported as "templates": "stub").
+
+Usage:
+    python benchmarks/bench_inference.py
+    python benchmarks/bench_inference.py --concurrency 1,4,16 --requests 300
+    python benchmarks/bench_inference.py --compare benchmarks/results/bench_inference-abc1234.json
+"""
+
+import os
+import re
+import sys
+import csv
+import glob
+import json
+import time
+import random
+import argparse
+import tempfile
+import resource
+import platform
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+
+CROP_RESULT = re.compile(r'(\w+) is the best crop')
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def load_images(test_dir):
+    from tflite_backend import TEST_LABELS
+
+    paths = sorted(glob.glob(os.path.join(test_dir, '*.JPG')) + glob.glob(os.path.join(test_dir, '*.jpg')))
+    images = []
+    for path in paths:
+        name = os.path.basename(path)
+        label = next((index for prefix, index in TEST_LABELS.items() if name.startswith(prefix)), None)
+        with open(path, 'rb') as f:
+            images.append((name, f.read(), label))
+    return images
+
+
+def load_crop_rows(csv_path, count, seed):
+    with open(csv_path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    random.Random(seed).shuffle(rows)
+    return [{
+        'nitrogen': float(r['N']), 'phosphorus': float(r['P']), 'potassium': float(r['K']),
+        'temperature': float(r['temperature']), 'ph': float(r['ph']), 'label': r['label'],
+    } for r in rows[:count]]
+
+
+# --- one request per endpoint; each returns (ok, correct or None) ---
+
+def call_predict_disease(client, item, app_module):
+    import io
+    name, data, label = item
+    response = client.post('/predict-disease', data={'image': (io.BytesIO(data), name)},
+                           content_type='multipart/form-data')
+    body = response.get_json() or {}
+    if not body.get('success'):
+        return False, None
+    if label is None:
+        return True, None
+    return True, body['prediction'] == app_module.DISEASE_CLASSES[label]
+
+
+def call_recommendation(client, row, app_module):
+    response = client.post('/api/recommendation', json={k: v for k, v in row.items() if k != 'label'})
+    body = response.get_json() or {}
+    if response.status_code != 200 or 'recommended' not in body:
+        return False, None
+    return True, body['recommended'].lower() == row['label'].lower()
+
+
+def call_predict_form(client, row, app_module):
+    response = client.post('/predict', data={
+        'Nitrogen': row['nitrogen'], 'Phosphorus': row['phosphorus'], 'Potassium': row['potassium'],
+        'Temperature': row['temperature'], 'pH': row['ph'],
+    })
+    match = CROP_RESULT.search(response.get_data(as_text=True))
+    if response.status_code != 200 or match is None:
+        return False, None
+    return True, match.group(1).lower() == row['label'].lower()
+
+
+def run_level(app_module, call, inputs, concurrency, requests):
+    """Send `requests` requests from `concurrency` threads, cycling through inputs."""
+    local = threading.local()
+    counter = iter(range(requests))
+    lock = threading.Lock()
+    latencies, oks, correct, judged = [], 0, 0, 0
+
+    def worker():
+        nonlocal oks, correct, judged
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app_module.app.test_client()
+        samples = []
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                break
+            started = time.perf_counter()
+            ok, is_correct = call(client, inputs[n % len(inputs)], app_module)
+            samples.append(time.perf_counter() - started)
+            with lock:
+                oks += ok
+                if is_correct is not None:
+                    judged += 1
+                    correct += is_correct
+        with lock:
+            latencies.extend(samples)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': requests - oks,
+        'throughput_rps': round(requests / elapsed, 2),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000.0, 2),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000.0, 2),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000.0, 2),
+        'accuracy': round(correct / judged, 4) if judged else None,
+        'judged': judged,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def compare(current, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\nChange vs {previous_path} (commit {previous.get('commit')}):")
+    print(f"{'endpoint':<20}{'conc':>5}{'p50':>10}{'p95':>10}{'p99':>10}{'rps':>10}")
+    for endpoint, result in current['endpoints'].items():
+        earlier = previous.get('endpoints', {}).get(endpoint, {})
+        before = {level['concurrency']: level for level in earlier.get('levels', [])}
+        for level in result['levels']:
+            old = before.get(level['concurrency'])
+            if old is None:
+                continue
+            delta = lambda key: f"{(level[key] - old[key]) / old[key]:+.0%}" if old[key] else 'n/a'
+            print(f"{endpoint:<20}{level['concurrency']:>5}{delta('p50_ms'):>10}{delta('p95_ms'):>10}"
+                  f"{delta('p99_ms'):>10}{delta('throughput_rps'):>10}")
+        if result['accuracy'] is not None and earlier.get('accuracy') is not None:
+            print(f"{endpoint:<20}accuracy {earlier['accuracy']:.1%} -> {result['accuracy']:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', default='1,4,16', help='comma-separated thread counts')
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint and concurrency level')
+    parser.add_argument('--crop-rows', type=int, default=500, help='rows sampled from Crop_recommendation.csv')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--endpoints', default='predict-disease,api-recommendation,predict')
+    parser.add_argument('--workdir', default=ROOT, help='directory with the model files')
+    parser.add_argument('--test-dir', default=os.path.join(ROOT, 'test', 'test'))
+    parser.add_argument('--prediction-cache', action='store_true', help='keep the prediction cache enabled')
+    parser.add_argument('--output', help='JSON results path (default benchmarks/results/bench_inference-<commit>.json)')
+    parser.add_argument('--compare', help='earlier JSON results to compare against')
+    args = parser.parse_args()
+
+    levels = [int(n) for n in args.concurrency.split(',') if n.strip()]
+    commit = git_commit()
+    os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(), 'bench_inference.db'))
+    os.chdir(args.workdir)
+
+    import app as app_module
+
+    templates = 'app'
+    try:
+        app_module.app.jinja_env.get_template('index.html')
+    except Exception:
+        import jinja2
+        app_module.app.jinja_env.loader = jinja2.DictLoader({'index.html': '{{ result }}{{ validation_errors }}'})
+        templates = 'stub'
+    if not args.prediction_cache:
+        app_module.prediction_cache.max_entries = 0
+        app_module.prediction_cache.disk_dir = None
+
+    images = load_images(args.test_dir)
+    crop_rows = load_crop_rows(os.path.join(ROOT, 'Crop_recommendation.csv'), args.crop_rows, args.seed)
+    endpoints = {
+        'predict-disease': (call_predict_disease, images),
+        'api-recommendation': (call_recommendation, crop_rows),
+        'predict': (call_predict_form, crop_rows),
+    }
+    selected = [name for name in args.endpoints.split(',') if name in endpoints]
+
+    started = time.perf_counter()
+    preloaded = app_module.preload_inference()
+    preload_seconds = time.perf_counter() - started
+
+    results = {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'config': {
+            'inference_mode': app_module.INFERENCE_MODE,
+            'disease_model': {k: v for k, v in app_module.disease_registry.info().items()
+                              if k in ('backend', 'quantization', 'model_id', 'threads', 'mode')},
+            'batch_max_size': app_module.disease_batcher.max_batch_size,
+            'prediction_cache': args.prediction_cache,
+            'templates': templates,
+            'images': len(images),
+            'crop_rows': len(crop_rows),
+            'seed': args.seed,
+        },
+        'preload_seconds': round(preload_seconds, 3) if preloaded else None,
+        'endpoints': {},
+    }
+
+    print(f"commit {commit}, {len(images)} images, {len(crop_rows)} crop rows, "
+          f"{args.requests} requests per level, templates={templates}")
+    print(f"{'endpoint':<20}{'conc':>5}{'rps':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'err':>5}{'RSS MB':>8}")
+    for name in selected:
+        call, inputs = endpoints[name]
+        # Accuracy over the whole sample, sequentially; this pass also keeps
+        # first-request costs (tracing, allocation) out of the timed levels
+        accuracy_pass = run_level(app_module, call, inputs, 1, len(inputs))
+        results['endpoints'][name] = {
+            'accuracy': accuracy_pass['accuracy'],
+            'judged': accuracy_pass['judged'],
+            'levels': [],
+        }
+        for concurrency in levels:
+            level = run_level(app_module, call, inputs, concurrency, args.requests)
+            del level['accuracy'], level['judged']
+            results['endpoints'][name]['levels'].append(level)
+            print(f"{name:<20}{concurrency:>5}{level['throughput_rps']:>10.1f}{level['p50_ms']:>9.2f}"
+                  f"{level['p95_ms']:>9.2f}{level['p99_ms']:>9.2f}{level['errors']:>5}{level['peak_rss_mb']:>8.0f}")
+        if accuracy_pass['accuracy'] is not None:
+            print(f"{name:<20}accuracy {accuracy_pass['accuracy']:.1%} on {accuracy_pass['judged']} labelled inputs")
+
+    app_module.log_writer.flush()
+    results['peak_rss_mb'] = round(peak_rss_mb(), 1)
+    results['batcher'] = app_module.disease_batcher.stats()
+
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f'bench_inference-{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nPeak RSS {results['peak_rss_mb']:.0f} MB; results saved to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
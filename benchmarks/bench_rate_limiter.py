@@ -0,0 +1,101 @@
+"""
+This module provides:
+- A contention microbenchmark for security.RateLimiter at 64 threads
+- A baseline copy of the previous list-of-timestamps limiter (one global lock)
+- A distinct-key flood showing tracked keys stay under max_keys
+
+Usage:
+    python benchmarks/bench_rate_limiter.py
+    python benchmarks/bench_rate_limiter.py --threads 64 --checks 5000
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from security import RateLimiter  # noqa: E402
+
+
+class ListRateLimiter:
+    """The previous implementation: rebuilds a timestamp list per check under one lock."""
+
+    def __init__(self):
+        self.requests = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def _is_limited(self, key, max_requests, window_seconds):
+        now = time.time()
+        with self.lock:
+            self.requests[key] = [t for t in self.requests[key] if t > now - window_seconds]
+            current_count = len(self.requests[key])
+            if current_count >= max_requests:
+                return True, 0, window_seconds
+            self.requests[key].append(now)
+            return False, max_requests - current_count - 1, window_seconds
+
+    def stats(self):
+        return {'tracked_keys': len(self.requests)}
+
+
+def run(limiter, threads, checks, keys_per_thread, max_requests):
+    """Each thread hammers its own keys. Returns (checks/s, p50 us, p99 us)."""
+    latencies = [None] * threads
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(t):
+        keys = [f"bench:10.{t}.{k // 256}.{k % 256}" for k in range(keys_per_thread)]
+        samples = []
+        barrier.wait()
+        for n in range(checks):
+            started = time.perf_counter()
+            limiter._is_limited(keys[n % keys_per_thread], max_requests, 60)
+            samples.append(time.perf_counter() - started)
+        latencies[t] = samples
+
+    workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+
+    samples = sorted(s for per_thread in latencies for s in per_thread)
+    p50 = samples[len(samples) // 2] * 1e6
+    p99 = samples[int(len(samples) * 0.99)] * 1e6
+    return threads * checks / elapsed, p50, p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--checks', type=int, default=2000, help='checks per thread')
+    parser.add_argument('--limit', type=int, default=100, help='requests allowed per key per minute')
+    args = parser.parse_args()
+
+    print(f"{args.threads} threads x {args.checks} checks, limit {args.limit}/minute")
+    print(f"{'limiter':<28}{'keys/thread':>12}{'checks/s':>12}{'p50 us':>10}{'p99 us':>10}{'tracked':>10}")
+    # One hot key per thread (history lists grow to `limit`), then many keys per thread
+    for keys_per_thread in (1, 64):
+        for name, limiter in (('list + global lock', ListRateLimiter()),
+                              ('window counter, 1 shard', RateLimiter(shards=1)),
+                              ('window counter, 16 shards', RateLimiter(shards=16))):
+            rate, p50, p99 = run(limiter, args.threads, args.checks, keys_per_thread, args.limit)
+            print(f"{name:<28}{keys_per_thread:>12}{rate:>12,.0f}{p50:>10.1f}{p99:>10.1f}"
+                  f"{limiter.stats()['tracked_keys']:>10}")
+
+    # Distinct-IP flood: memory stays bounded by max_keys
+    limiter = RateLimiter(shards=16, max_keys=10_000)
+    for n in range(100_000):
+        limiter._is_limited(f"flood:{n}", 5, 60)
+    print(f"\nAfter 100,000 distinct keys with max_keys=10,000: {limiter.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+This module provides:
+- A worker startup benchmark: import time, time to first response and RSS
+  for a crop-only worker (imports app.py, serves a crop recommendation)
+  versus a full worker (also loads and warms up the disease model)
+- An "eager" crop-only row that imports TensorFlow before app.py, i.e.
+  what every worker paid when app.py imported it at module level
+- A remote row (INFERENCE_MODE=remote): the web worker with inference in
+  a separate pool, measured without starting the pool (its crop call gets
+  the rule-based fallback answer)
+
+Each scenario runs in a fresh interpreter; the median of --runs is reported.
+Run it from a directory that holds the model files (model.pkl, the scalers
+and trained_plant_disease_model.keras), or pass --workdir.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 5 --workdir /srv/plant-app
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Runs in the child interpreter; prints one JSON line
+CHILD = r'''
+import os, sys, json, time
+started = time.perf_counter()
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+scenario = sys.argv[1]
+if scenario == 'eager':
+    import tensorflow
+import app
+imported = time.perf_counter()
+result = {'import_s': imported - started, 'rss_after_import_mb': rss_mb()}
+
+client = app.app.test_client()
+reply = client.post('/api/recommendation', json={'nitrogen': 90, 'phosphorus': 42, 'potassium': 43, 'temperature': 20.8, 'ph': 6.5})
+result['crop_ok'] = reply.status_code == 200 and 'recommended' in reply.get_json()
+if scenario == 'full':
+    result['disease_loaded'] = app.preload_inference()
+result['first_response_s'] = time.perf_counter() - started
+result['rss_mb'] = rss_mb()
+result['tensorflow_imported'] = 'tensorflow' in sys.modules
+print(json.dumps(result))
+'''
+
+SCENARIOS = (
+    ('crop-only worker', 'crop', {}),
+    ('full worker (preloaded)', 'full', {}),
+    ('crop-only, eager TF import', 'eager', {}),
+    ('remote-inference worker', 'crop', {'INFERENCE_MODE': 'remote'}),
+)
+
+
+def run_once(scenario, extra_env, workdir):
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(ROOT), TF_CPP_MIN_LOG_LEVEL='3', **extra_env)
+    env.setdefault('DATABASE_PATH', os.path.join(workdir, 'bench_startup.db'))
+    out = subprocess.run([sys.executable, '-c', CHILD, scenario], cwd=workdir, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--workdir', default=os.path.abspath(ROOT), help='directory with the model files')
+    args = parser.parse_args()
+
+    print(f"{'worker':<28}{'import s':>10}{'ready s':>10}{'RSS MB':>10}{'TF loaded':>11}{'disease':>9}")
+    for name, scenario, extra_env in SCENARIOS:
+        runs = [run_once(scenario, extra_env, args.workdir) for _ in range(args.runs)]
+        median = lambda key: statistics.median(r[key] for r in runs)
+        last = runs[-1]
+        disease = {True: 'yes', False: 'n/a'}.get(last.get('disease_loaded'), '-')
+        print(f"{name:<28}{median('import_s'):>10.2f}{median('first_response_s'):>10.2f}{median('rss_mb'):>10.0f}"
+              f"{str(last['tensorflow_imported']):>11}{disease:>9}")
+        if not last['crop_ok']:
+            print(f"  warning: crop recommendation failed in '{name}'")
+
+
+if __name__ == '__main__':
+    main()
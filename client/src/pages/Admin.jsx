@@ -1,4 +1,4 @@
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { useAuth } from "../context/AuthContext";
 import { Card, CardContent, CardHeader, CardTitle, CardDescription } from "../components/ui/card";
 import { Button } from "../components/ui/button";
@@ -26,11 +26,15 @@ export default function Admin() {
     const { user } = useAuth();
     const [stats, setStats] = useState(null);
     const [users, setUsers] = useState([]);
+    const [usersCursor, setUsersCursor] = useState(null);
+    const [hasMoreUsers, setHasMoreUsers] = useState(false);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState("");
 
     // User Management State
     const [searchTerm, setSearchTerm] = useState("");
+    const [userSort, setUserSort] = useState("id:desc");
+    const usersRequest = useRef(0);
     const [processingUser, setProcessingUser] = useState(null);
     const [actionModal, setActionModal] = useState({ show: false, user: null, type: '' });
 
@@ -38,15 +42,37 @@ export default function Admin() {
         fetchAdminData();
     }, []);
 
+    // Search and sort run on the server, so users beyond the loaded pages are found too
+    useEffect(() => {
+        if (loading) return;
+        const timer = setTimeout(() => {
+            fetchUsers().catch(err => console.error(err));
+        }, 300);
+        return () => clearTimeout(timer);
+    }, [searchTerm, userSort]);
+
+    const usersParams = (cursor) => {
+        const [sort, order] = userSort.split(":");
+        return { sort, order, search: searchTerm.trim() || undefined, cursor: cursor || undefined };
+    };
+
+    const fetchUsers = async (cursor = null) => {
+        const request = ++usersRequest.current;
+        const { data } = await axios.get("/api/admin/users", { params: usersParams(cursor) });
+        if (request !== usersRequest.current) return; // a newer search or sort superseded this one
+        setUsers(prev => cursor ? [...prev, ...(data.users || [])] : (data.users || []));
+        setUsersCursor(data.next_cursor || null);
+        setHasMoreUsers(Boolean(data.has_more));
+    };
+
     const fetchAdminData = async () => {
         setLoading(true);
         try {
-            const [statsRes, usersRes] = await Promise.all([
+            const [statsRes] = await Promise.all([
                 axios.get("/api/admin/stats"),
-                axios.get("/api/admin/users")
+                fetchUsers()
             ]);
             setStats(statsRes.data);
-            setUsers(usersRes.data.users || []);
         } catch (err) {
             setError(err.response?.data?.error || "Failed to load admin data");
         } finally {
@@ -67,8 +93,7 @@ export default function Admin() {
                     duration_days: action === 'ban' ? 7 : 0 // Default 7 days for temp ban
                 });
                 // Refresh user list to get updated status
-                const { data } = await axios.get("/api/admin/users");
-                setUsers(data.users || []);
+                await fetchUsers();
             }
             setActionModal({ show: false, user: null, type: '' });
         } catch (err) {
@@ -78,10 +103,13 @@ export default function Admin() {
         }
     };
 
-    const filteredUsers = users.filter(u =>
-        u.username.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        u.email.toLowerCase().includes(searchTerm.toLowerCase())
-    );
+    const loadMoreUsers = async () => {
+        try {
+            await fetchUsers(usersCursor);
+        } catch (err) {
+            console.error(err);
+        }
+    };
 
     if (loading) return <div className="flex h-screen items-center justify-center"><Loader2 className="h-8 w-8 animate-spin" /></div>;
     if (error) return <div className="p-8 text-center text-red-500">Error: {error}</div>;
@@ -198,14 +226,29 @@ export default function Admin() {
                             <CardTitle>User Management</CardTitle>
                             <CardDescription>Manage user access and permissions</CardDescription>
                         </div>
-                        <div className="relative w-full md:w-64">
-                            <Search className="absolute left-2.5 top-2.5 h-4 w-4 text-muted-foreground" />
-                            <Input
-                                placeholder="Search users..."
-                                className="pl-9"
-                                value={searchTerm}
-                                onChange={(e) => setSearchTerm(e.target.value)}
-                            />
+                        <div className="flex flex-col sm:flex-row gap-2 w-full md:w-auto">
+                            <select
+                                value={userSort}
+                                onChange={(e) => setUserSort(e.target.value)}
+                                className="h-10 px-3 py-2 rounded-md border border-input bg-background text-sm ring-offset-background focus:outline-none focus:ring-2 focus:ring-ring"
+                            >
+                                <option value="id:desc">Newest first</option>
+                                <option value="id:asc">Oldest first</option>
+                                <option value="username:asc">Username A-Z</option>
+                                <option value="username:desc">Username Z-A</option>
+                                <option value="activity:desc">Most active</option>
+                                <option value="detections:desc">Most scans</option>
+                                <option value="recommendations:desc">Most recommendations</option>
+                            </select>
+                            <div className="relative w-full md:w-64">
+                                <Search className="absolute left-2.5 top-2.5 h-4 w-4 text-muted-foreground" />
+                                <Input
+                                    placeholder="Search users..."
+                                    className="pl-9"
+                                    value={searchTerm}
+                                    onChange={(e) => setSearchTerm(e.target.value)}
+                                />
+                            </div>
                         </div>
                     </div>
                 </CardHeader>
@@ -221,7 +264,7 @@ export default function Admin() {
                                 </tr>
                             </thead>
                             <tbody>
-                                {filteredUsers.map((u) => (
+                                {users.map((u) => (
                                     <tr key={u.id} className="border-b last:border-0 hover:bg-muted/30 transition-colors">
                                         <td className="p-4">
                                             <div className="font-medium text-gray-900 dark:text-gray-100 flex items-center gap-2">
@@ -287,9 +330,23 @@ export default function Admin() {
                                         </td>
                                     </tr>
                                 ))}
+                                {users.length === 0 && (
+                                    <tr>
+                                        <td colSpan={4} className="p-8 text-center text-muted-foreground">
+                                            {searchTerm.trim() ? "No users match your search." : "No users yet."}
+                                        </td>
+                                    </tr>
+                                )}
                             </tbody>
                         </table>
                     </div>
+                    {hasMoreUsers && (
+                        <div className="flex justify-center pt-4">
+                            <Button variant="outline" onClick={loadMoreUsers}>
+                                Load More Users
+                            </Button>
+                        </div>
+                    )}
                 </CardContent>
             </Card>
 
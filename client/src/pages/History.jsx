@@ -16,6 +16,8 @@ export default function History() {
     const [selectedDetection, setSelectedDetection] = useState(null);
     const [visibleDetections, setVisibleDetections] = useState(6);
     const [visibleRecommendations, setVisibleRecommendations] = useState(10);
+    const [detectionsCursor, setDetectionsCursor] = useState(null);
+    const [recommendationsCursor, setRecommendationsCursor] = useState(null);
 
     const fetchData = async () => {
         setLoading(true);
@@ -26,6 +28,8 @@ export default function History() {
             ]);
             setDetections(detRes.data.detections || []);
             setRecommendations(recRes.data.recommendations || []);
+            setDetectionsCursor(detRes.data.next_cursor || null);
+            setRecommendationsCursor(recRes.data.next_cursor || null);
         } catch (err) {
             setError("Failed to load history data");
             console.error(err);
@@ -38,6 +42,33 @@ export default function History() {
         fetchData();
     }, []);
 
+    // History is served in pages; fetch the next one when the loaded rows run out
+    const loadMoreDetections = async () => {
+        if (visibleDetections + 6 > detections.length && detectionsCursor) {
+            try {
+                const { data } = await axios.get("/api/detections", { params: { cursor: detectionsCursor } });
+                setDetections(prev => [...prev, ...(data.detections || [])]);
+                setDetectionsCursor(data.next_cursor || null);
+            } catch (err) {
+                console.error(err);
+            }
+        }
+        setVisibleDetections(prev => prev + 6);
+    };
+
+    const loadMoreRecommendations = async () => {
+        if (visibleRecommendations + 10 > recommendations.length && recommendationsCursor) {
+            try {
+                const { data } = await axios.get("/api/recommendations", { params: { cursor: recommendationsCursor } });
+                setRecommendations(prev => [...prev, ...(data.recommendations || [])]);
+                setRecommendationsCursor(data.next_cursor || null);
+            } catch (err) {
+                console.error(err);
+            }
+        }
+        setVisibleRecommendations(prev => prev + 10);
+    };
+
     const handleDeleteDetection = async (id, e) => {
         if (e) {
             e.preventDefault();
@@ -271,11 +302,11 @@ export default function History() {
                             ))
                         )}
                     </div>
-                    {visibleDetections < detections.length && (
+                    {(visibleDetections < detections.length || detectionsCursor) && (
                         <div className="flex justify-center pt-4">
                             <Button
                                 variant="outline"
-                                onClick={() => setVisibleDetections(prev => prev + 6)}
+                                onClick={loadMoreDetections}
                                 className="rounded-full px-8 hover:bg-primary hover:text-primary-foreground transition-all"
                             >
                                 Load More Detections
@@ -327,11 +358,11 @@ export default function History() {
                             </div>
                         </div>
                     )}
-                    {visibleRecommendations < recommendations.length && (
+                    {(visibleRecommendations < recommendations.length || recommendationsCursor) && (
                         <div className="flex justify-center pt-2">
                             <Button
                                 variant="outline"
-                                onClick={() => setVisibleRecommendations(prev => prev + 10)}
+                                onClick={loadMoreRecommendations}
                                 className="rounded-full px-8 hover:bg-primary hover:text-primary-foreground transition-all"
                             >
                                 Load More Recommendations
@@ -0,0 +1,158 @@
+"""
+This module provides:
+- A compiled crop recommendation scorer built from the pickled sklearn objects
+- MinMaxScaler + StandardScaler folded into one precomputed scale/offset
+- The RandomForest flattened into contiguous NumPy node arrays, evaluated
+  for all rows and all trees in one vectorized traversal
+- A parity check against model.predict over Crop_recommendation.csv
+
+Usage:
+    from crop_scorer import CompiledCropScorer
+
+    scorer = CompiledCropScorer(model, mx, sc)
+    labels = scorer.predict(features)     # same output as model.predict(sc.transform(mx.transform(features)))
+
+    python crop_scorer.py                 # per-call latency against sklearn
+
+The parity check runs in tests/test_crop_scorer.py (python -m pytest tests).
+"""
+
+import numpy as np
+
+
+class CompiledCropScorer:
+    """
+    Scores [N, P, K, temperature, ph] rows without sklearn's per-call validation
+    or per-tree Python dispatch.
+
+    Tree nodes from every estimator are concatenated into flat arrays (feature,
+    threshold, left, right) with child indices rebased to global positions, so a
+    single loop of max_depth steps advances every (row, tree) pair at once.
+    """
+
+    def __init__(self, model, mx, sc):
+        # MinMaxScaler: x * mx.scale_ + mx.min_
+        # StandardScaler: (x - sc.mean_) / sc.scale_
+        # Folded: x * scale + offset
+        sc_mean = sc.mean_ if sc.with_mean else 0.0
+        sc_scale = sc.scale_ if sc.with_std else 1.0
+        self.scale = np.asarray(mx.scale_ / sc_scale, dtype=np.float64)
+        self.offset = np.asarray((mx.min_ - sc_mean) / sc_scale, dtype=np.float64)
+
+        self.classes = np.asarray(model.classes_)
+        self.n_features = int(model.n_features_in_)
+        self.n_estimators = len(model.estimators_)
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        base = 0
+        max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+
+            # Leaves point to themselves so finished rows stay put
+            own = np.arange(n)
+            lefts.append(np.where(is_leaf, own, tree.children_left) + base)
+            rights.append(np.where(is_leaf, own, tree.children_right) + base)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+
+            # Same normalisation as DecisionTreeClassifier.predict_proba
+            proba = tree.value[:, 0, :].astype(np.float64)
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(proba / normalizer)
+
+            roots.append(base)
+            base += n
+            max_depth = max(max_depth, tree.max_depth)
+
+        self.feature = np.ascontiguousarray(np.concatenate(features), dtype=np.intp)
+        self.threshold = np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64)
+        self.left = np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp)
+        self.right = np.ascontiguousarray(np.concatenate(rights), dtype=np.intp)
+        self.value = np.ascontiguousarray(np.concatenate(values), dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.max_depth = max_depth
+
+    def transform(self, X) -> np.ndarray:
+        """Apply both scalers in one step. Trees compare in float32, like sklearn."""
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.n_features)
+        return (X * self.scale + self.offset).astype(np.float32)
+
+    def predict_proba(self, X) -> np.ndarray:
+        Xt = self.transform(X)
+        n_rows = Xt.shape[0]
+        rows = np.arange(n_rows)[:, np.newaxis]
+
+        # (rows, trees) matrix of current node positions
+        node = np.broadcast_to(self.roots, (n_rows, self.n_estimators)).copy()
+        for _ in range(self.max_depth):
+            go_left = Xt[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+
+        # Sum leaf distributions tree by tree (sklearn accumulates in the same order)
+        leaf_values = self.value[node]  # (rows, trees, classes)
+        proba = np.zeros((n_rows, self.classes.shape[0]), dtype=np.float64)
+        for t in range(self.n_estimators):
+            proba += leaf_values[:, t, :]
+        proba /= self.n_estimators
+        return proba
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+def verify_parity(scorer, model, mx, sc, csv_path='Crop_recommendation.csv') -> tuple:
+    """
+    Compare the compiled scorer with the sklearn pipeline on every dataset row.
+
+    Returns:
+        (rows_checked: int, mismatched_row_indices: list)
+    """
+    import pandas as pd
+
+    df = pd.read_csv(csv_path)
+    X = df[['N', 'P', 'K', 'temperature', 'ph']].to_numpy(dtype=np.float64)
+    expected = model.predict(sc.transform(mx.transform(X)))
+    actual = scorer.predict(X)
+    mismatches = np.flatnonzero(expected != actual).tolist()
+    return len(X), mismatches
+
+
+def build_scorer(model, mx, sc, csv_path='Crop_recommendation.csv'):
+    """
+    Build the compiled scorer and check it against sklearn on the dataset.
+    Returns None (caller keeps using sklearn) if the build or parity check fails.
+    """
+    try:
+        scorer = CompiledCropScorer(model, mx, sc)
+        rows, mismatches = verify_parity(scorer, model, mx, sc, csv_path)
+    except Exception as e:
+        print(f"Compiled crop scorer unavailable, using sklearn: {e}")
+        return None
+
+    if mismatches:
+        print(f"Compiled crop scorer disagrees with sklearn on {len(mismatches)}/{rows} rows, using sklearn")
+        return None
+    return scorer
+
+
+if __name__ == '__main__':
+    import pickle
+    import time
+
+    model = pickle.load(open('model.pkl', 'rb'))
+    mx = pickle.load(open('minmaxscaler.pkl', 'rb'))
+    sc = pickle.load(open('standscaler.pkl', 'rb'))
+
+    scorer = CompiledCropScorer(model, mx, sc)
+    row = np.array([[90, 42, 43, 20.88, 6.5]])
+    for name, fn in (('sklearn', lambda: model.predict(sc.transform(mx.transform(row)))),
+                     ('compiled', lambda: scorer.predict(row))):
+        fn()
+        started = time.perf_counter()
+        for _ in range(200):
+            fn()
+        print(f"{name}: {(time.perf_counter() - started) * 1000 / 200:.3f} ms per single-row call")
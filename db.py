@@ -0,0 +1,139 @@
+"""
+This module provides:
+- A pooled, thread-safe SQLite connection layer shared by every route
+- WAL journaling, synchronous=NORMAL, a tuned page cache and mmap
+- Per-connection prepared statement caches that survive across requests
+- Pool checkout latency metrics
+
+Usage:
+    from db import get_db
+
+    with get_db() as conn:        # commits on success, rolls back on error
+        conn.execute("SELECT ...")
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+DATABASE_PATH = os.environ.get('DATABASE_PATH', 'database.db')
+
+
+class ConnectionPool:
+    """
+    Keeps idle SQLite connections around instead of opening one per query.
+
+    Connections are handed out LIFO (the most recently used one has the warmest
+    page cache) and returned after each request. A checkout never blocks: if no
+    idle connection is available a new one is opened, and connections beyond
+    max_idle are closed when they come back.
+    """
+
+    def __init__(self, path=DATABASE_PATH, max_idle=16, cached_statements=256,
+                 cache_size_kib=16384, mmap_size=256 * 1024 * 1024, busy_timeout=5.0):
+        self.path = path
+        self.max_idle = max_idle
+        self.cached_statements = cached_statements
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.busy_timeout = busy_timeout
+        self.idle = []
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+        # Metrics
+        self.connections_opened = 0
+        self.checkouts = 0
+        self.total_checkout_seconds = 0.0
+        self.max_checkout_seconds = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            check_same_thread=False,  # a connection is only used by one thread at a time
+            cached_statements=self.cached_statements,
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kib)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def checkout(self) -> sqlite3.Connection:
+        started = time.perf_counter()
+        conn = None
+        with self.lock:
+            # Connections must not cross a fork (e.g. gunicorn --preload)
+            if self.pid != os.getpid():
+                self.idle = []
+                self.pid = os.getpid()
+            if self.idle:
+                conn = self.idle.pop()
+        if conn is None:
+            conn = self._connect()
+            with self.lock:
+                self.connections_opened += 1
+        conn.row_factory = None
+
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.checkouts += 1
+            self.total_checkout_seconds += elapsed
+            if elapsed > self.max_checkout_seconds:
+                self.max_checkout_seconds = elapsed
+        return conn
+
+    def checkin(self, conn: sqlite3.Connection):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+        with self.lock:
+            if self.pid == os.getpid() and len(self.idle) < self.max_idle:
+                self.idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a `with` block, inside a transaction."""
+        conn = self.checkout()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.checkin(conn)
+
+    def close_all(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> dict:
+        with self.lock:
+            checkouts = self.checkouts
+            return {
+                'path': self.path,
+                'idle_connections': len(self.idle),
+                'connections_opened': self.connections_opened,
+                'checkouts': checkouts,
+                'avg_checkout_ms': round(self.total_checkout_seconds * 1000.0 / checkouts, 4) if checkouts else 0,
+                'max_checkout_ms': round(self.max_checkout_seconds * 1000.0, 4),
+            }
+
+
+# Global pool instance
+db_pool = ConnectionPool()
+
+
+def get_db():
+    """Shortcut for db_pool.connection()."""
+    return db_pool.connection()
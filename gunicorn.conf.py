@@ -0,0 +1,36 @@
+"""
+Gunicorn settings for the Flask app.
+
+- The app is imported once in the master (preload_app) and forked. Importing
+  app.py is cheap: it loads the crop models but not TensorFlow.
+- The disease model is loaded after the fork, in post_worker_init, when
+  DISEASE_MODEL_WARMUP=true. Otherwise each worker loads it on its first upload.
+  Either way, in local inference mode each worker's TensorFlow thread pools
+  get 1/workers of the CPUs.
+  TensorFlow is never imported in the master, because its thread pools do not
+  survive a fork.
+
+Usage:
+    gunicorn -c gunicorn.conf.py app:app
+"""
+
+import os
+import time
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+
+
+def post_worker_init(worker):
+    from app import DISEASE_MODEL_WARMUP, INFERENCE_MODE, disease_registry, preload_inference
+
+    if INFERENCE_MODE == 'local':
+        # The configured worker count, which may not come from WEB_CONCURRENCY
+        disease_registry.share_cpus(worker.cfg.workers)
+    if DISEASE_MODEL_WARMUP:
+        started = time.perf_counter()
+        loaded = preload_inference()
+        worker.log.info("Disease model preloaded=%s in %.2fs", loaded, time.perf_counter() - started)
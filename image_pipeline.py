@@ -0,0 +1,169 @@
+"""
+This module provides:
+- In-memory decoding of uploaded images (no temp files)
+- Fast JPEG downscaling with Pillow's draft mode
+- Resizing into a preallocated, per-thread float32 buffer
+- Persisting the original upload bytes without re-encoding, content-addressed
+  so identical uploads share one file; the file name is an HMAC of the
+  content hash (UPLOAD_NAME_KEY), so nobody can check whether an image was
+  uploaded by hashing it
+- Deleting uploads, sparing files handed out within UPLOAD_GRACE_SECONDS
+  (a client may not have logged its detection of a shared file yet)
+
+Usage:
+    from image_pipeline import decode_image, save_upload_by_digest, delete_upload
+
+    data = file.read()
+    input_arr, fmt = decode_image(data)                            # (128, 128, 3) float32, 0-255
+    image_url, written = save_upload_by_digest(data, digest, fmt)  # '/static/uploads/crop_<hmac>.jpg'
+
+    delete_upload(image_url, min_age=UPLOAD_GRACE_SECONDS)
+"""
+
+import io
+import os
+import hmac
+import uuid
+import hashlib
+import secrets
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+
+DISEASE_INPUT_SIZE = (128, 128)
+
+UPLOAD_FOLDER = os.path.join('static', 'uploads')
+
+# An upload's URL is returned before the client logs a detection for it; until
+# then nothing references the file, so younger files are never deleted
+UPLOAD_GRACE_SECONDS = float(os.environ.get('UPLOAD_GRACE_SECONDS', 3600))
+
+
+def _upload_name_key() -> bytes:
+    key = os.environ.get('UPLOAD_NAME_KEY')
+    if key:
+        return key.encode()
+    # Still unguessable; duplicates are only shared within processes forked from this one
+    print("⚠️  WARNING: No UPLOAD_NAME_KEY set. Using random key; identical uploads are not shared across restarts.")
+    return secrets.token_bytes(32)
+
+
+UPLOAD_NAME_KEY = _upload_name_key()
+
+# Pillow format name -> file extension used when persisting the original bytes
+FORMAT_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'BMP': 'bmp',
+    'WEBP': 'webp',
+    'TIFF': 'tiff',
+    'MPO': 'jpg',  # multi-picture JPEG from some phone cameras
+}
+
+_buffers = threading.local()
+
+
+def _get_buffer(size: tuple) -> np.ndarray:
+    """Per-thread (H, W, 3) float32 buffer, reused across requests on the same thread."""
+    buf = getattr(_buffers, 'array', None)
+    if buf is None or buf.shape[:2] != (size[1], size[0]):
+        buf = np.empty((size[1], size[0], 3), dtype=np.float32)
+        _buffers.array = buf
+    return buf
+
+
+def decode_image(data: bytes, size: tuple = DISEASE_INPUT_SIZE, out: np.ndarray = None) -> tuple:
+    """
+    Decode image bytes into a (H, W, 3) float32 array with 0-255 values.
+
+    JPEGs are decoded at reduced scale via draft mode (DCT scaling), so a 4000px
+    phone photo never gets fully decompressed just to end up at 128x128. The
+    final resize uses nearest-neighbour, the same default as keras load_img.
+
+    The returned array is a reused per-thread buffer unless `out` is given;
+    copy it if it has to outlive the current request.
+
+    Returns:
+        (array: np.ndarray, format: str or None)
+
+    Raises:
+        ValueError: if the bytes are not a readable image
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        fmt = image.format
+        image.draft('RGB', size)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        if image.size != size:
+            image = image.resize(size, Image.NEAREST)
+    except Exception as e:
+        raise ValueError(f"Invalid image file: {e}")
+
+    if out is None:
+        out = _get_buffer(size)
+    np.copyto(out, np.asarray(image), casting='unsafe')
+    return out, fmt
+
+
+def sniff_format(data: bytes):
+    """Pillow format name from the image header only (no pixel decode), or None."""
+    try:
+        return Image.open(io.BytesIO(data)).format
+    except Exception:
+        return None
+
+
+def upload_name(digest: str) -> str:
+    """Keyed (HMAC-SHA256) name for content with this hash; the public URL does not reveal the hash."""
+    return hmac.new(UPLOAD_NAME_KEY, digest.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def save_upload_by_digest(data: bytes, digest: str, fmt: str = None, prefix: str = 'crop') -> tuple:
+    """
+    Write the uploaded bytes under a name derived from their content hash (see upload_name).
+    If that file already exists (a duplicate upload) nothing is written, but its
+    mtime is refreshed so delete_upload() treats it as just handed out.
+
+    Returns:
+        (public URL path, written: bool)
+    """
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    ext = FORMAT_EXTENSIONS.get(fmt, 'jpg')
+    filename = f"{prefix}_{upload_name(digest)}.{ext}"
+    path = os.path.join(UPLOAD_FOLDER, filename)
+    try:
+        os.utime(path)
+        return f'/static/uploads/{filename}', False
+    except FileNotFoundError:
+        pass
+
+    # Write then rename so a concurrent identical upload never sees a partial file
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return f'/static/uploads/{filename}', True
+
+
+def delete_upload(url: str, min_age: float = 0.0) -> bool:
+    """
+    Remove a file previously returned as '/static/uploads/...', unless it was
+    written or handed out again less than `min_age` seconds ago.
+
+    Returns True if a file was deleted.
+    """
+    if not url or not url.startswith('/static/uploads/'):
+        return False
+    path = os.path.join(UPLOAD_FOLDER, os.path.basename(url))
+    try:
+        if min_age and time.time() - os.stat(path).st_mtime < min_age:
+            return False
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
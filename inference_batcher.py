@@ -0,0 +1,177 @@
+"""
+This module provides:
+- A dynamic micro-batching scheduler for model inference
+- Concurrent requests are collected into one predict() call, bounded by
+  a maximum batch size and a maximum wait time
+- Queue-depth and batch-size metrics for tuning
+- Requests that time out are cancelled and never reach the model
+
+Usage:
+    from inference_batcher import MicroBatcher
+
+    batcher = MicroBatcher(model.predict, max_batch_size=16, max_wait_ms=5)
+    probabilities = batcher.predict(image_array)   # one row in, one row out
+"""
+
+import time
+import queue
+import threading
+from concurrent.futures import Future, InvalidStateError, TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Collects single-sample requests from many threads and runs them as one batch.
+
+    The first request to arrive opens a batch; the batch is dispatched as soon as
+    it holds max_batch_size samples or max_wait_ms has passed since it opened,
+    whichever comes first. Each caller gets back its own row of the output.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0, max_queue=1024, timeout=30.0, name='batcher'):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.timeout = timeout
+        self.name = name
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.worker = None
+
+        # Metrics
+        self.total_requests = 0
+        self.total_batches = 0
+        self.max_queue_depth = 0
+        self.batch_size_counts = [0] * (self.max_batch_size + 1)
+        self.total_predict_seconds = 0.0
+        self.cancelled = 0
+
+    def _ensure_worker(self):
+        """Start the dispatch thread lazily so forked workers each get their own."""
+        if self.worker is not None and self.worker.is_alive():
+            return
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name=f"{self.name}-dispatch", daemon=True)
+                self.worker.start()
+
+    def submit(self, sample: np.ndarray) -> Future:
+        """Queue one sample (without batch dimension). Returns a Future for its output row."""
+        self._ensure_worker()
+        future = Future()
+        try:
+            self.queue.put_nowait((sample, future))
+        except queue.Full:
+            raise RuntimeError("Inference queue is full. Please try again later.")
+
+        depth = self.queue.qsize()
+        with self.lock:
+            self.total_requests += 1
+            if depth > self.max_queue_depth:
+                self.max_queue_depth = depth
+        return future
+
+    def predict(self, sample: np.ndarray, timeout=None) -> np.ndarray:
+        """
+        Blocking helper: submit one sample and wait (at most timeout, default
+        self.timeout) for its output row. On timeout the request is cancelled,
+        so it is dropped from the queue instead of still taking a batch slot.
+        """
+        future = self.submit(sample)
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def _take(self, item) -> bool:
+        """Claim a queued item for a batch; False if its caller already cancelled it."""
+        if item[1].set_running_or_notify_cancel():
+            return True
+        with self.lock:
+            self.cancelled += 1
+        return False
+
+    def _collect(self) -> list:
+        """Block for the first live item, then gather more until the batch is full or the wait expires."""
+        item = self.queue.get()
+        while not self._take(item):
+            item = self.queue.get()
+        items = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    item = self.queue.get_nowait()
+                else:
+                    item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if self._take(item):
+                items.append(item)
+        return items
+
+    @staticmethod
+    def _fail(items: list, error: BaseException):
+        for _, f in items:
+            try:
+                f.set_exception(error)
+            except InvalidStateError:
+                pass  # already resolved
+
+    def _dispatch(self, items: list):
+        batch = np.stack([s for s, _ in items])
+        started = time.perf_counter()
+        outputs = self.predict_fn(batch)
+        elapsed = time.perf_counter() - started
+        if len(outputs) != len(items):
+            raise RuntimeError(f"Model returned {len(outputs)} rows for a batch of {len(items)}")
+
+        with self.lock:
+            self.total_batches += 1
+            self.batch_size_counts[len(items)] += 1
+            self.total_predict_seconds += elapsed
+
+        for (_, f), output in zip(items, outputs):
+            try:
+                f.set_result(output)
+            except InvalidStateError:
+                pass  # already resolved
+
+    def _run(self):
+        # Whatever goes wrong, the callers of the current batch get an error rather
+        # than waiting forever; the next submit() restarts a thread that has exited.
+        while True:
+            items = []
+            try:
+                items = self._collect()
+                self._dispatch(items)
+            except Exception as e:
+                self._fail(items, e)
+            except BaseException:
+                self._fail(items, RuntimeError("Inference dispatcher stopped"))
+                raise
+
+    def stats(self) -> dict:
+        """Snapshot of queue and batch metrics."""
+        with self.lock:
+            batches = self.total_batches
+            batched_requests = sum(size * n for size, n in enumerate(self.batch_size_counts))
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'timeout_s': self.timeout,
+                'queue_depth': self.queue.qsize(),
+                'max_queue_depth': self.max_queue_depth,
+                'total_requests': self.total_requests,
+                'total_batches': batches,
+                'cancelled_requests': self.cancelled,
+                'avg_batch_size': round(batched_requests / batches, 2) if batches else 0,
+                'batch_size_histogram': {
+                    str(size): n for size, n in enumerate(self.batch_size_counts) if n
+                },
+                'avg_predict_ms': round(self.total_predict_seconds * 1000.0 / batches, 2) if batches else 0,
+            }
@@ -0,0 +1,493 @@
+"""
+This module provides:
+- A pool of long-lived inference worker processes that each load the Keras
+  disease model and the crop scorer once, serving requests over a local
+  socket (multiprocessing.connection: a Unix socket path, a Windows named
+  pipe or host:port)
+- Authentication: INFERENCE_AUTHKEY is required for host:port and named
+  pipes (the pool refuses to start without it). On a Unix socket without
+  it, the pool generates a random key per start and writes it to
+  <socket>.key (mode 0600), where clients of the same user read it
+- A supervisor that pre-forks the workers onto one listening socket and
+  restarts any that die
+- InferenceClient: a small pooled, reconnecting client for web workers
+- RemoteDiseaseModel: the DiseaseModelRegistry interface (get, predict,
+  model_id, info, ...) backed by the pool, so app.py can swap it in
+
+With INFERENCE_MODE=remote the web workers never import TensorFlow or
+sklearn; the number of inference processes (INFERENCE_WORKERS) is sized to
+CPU cores independently of the number of web workers.
+
+Usage:
+    python inference_workers.py serve              # start the pool (INFERENCE_ADDRESS, INFERENCE_WORKERS)
+    INFERENCE_MODE=remote gunicorn app:app         # web workers forward inference to it
+
+    python inference_workers.py selftest           # start a pool, compare with in-process results
+"""
+
+import os
+import sys
+import time
+import queue
+import signal
+import pickle
+import secrets
+import threading
+from multiprocessing.connection import Listener, Client, AuthenticationError
+
+
+DEFAULT_ADDRESS = 'inference.sock'
+
+
+def parse_address(address: str):
+    """'host:port' -> (host, port) for TCP; anything else is a Unix socket path or pipe name."""
+    host, sep, port = address.rpartition(':')
+    if sep and host and port.isdigit() and '/' not in address and '\\' not in address:
+        return (host, int(port))
+    return address
+
+
+class InferenceUnavailable(Exception):
+    """The inference worker pool could not be reached."""
+
+
+def key_path(address) -> str:
+    """Where a pool on a Unix socket without INFERENCE_AUTHKEY publishes its generated key."""
+    return f"{address}.key"
+
+
+def _authkey_from_env(address):
+    """
+    INFERENCE_AUTHKEY as bytes, or None for a Unix socket without it (the pool
+    then generates a key, see key_path). Requests are pickles, so anyone who
+    can authenticate can run code in the pool: there is no default key.
+
+    Raises:
+        RuntimeError: for host:port or a named pipe without INFERENCE_AUTHKEY
+    """
+    key = os.environ.get('INFERENCE_AUTHKEY')
+    if key:
+        return key.encode()
+    address = parse_address(address)
+    if isinstance(address, tuple) or address.startswith('\\\\'):
+        raise RuntimeError(f"INFERENCE_AUTHKEY must be set for inference address {address!r}")
+    return None
+
+
+def _write_key_file(address, authkey: bytes):
+    """Publish a generated key next to the socket, readable by this user only."""
+    path = key_path(address)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(authkey)
+    os.replace(tmp_path, path)
+
+
+# --- worker side ---
+
+class InferenceService:
+    """
+    Runs inside one worker process: owns the disease model and the crop scorer.
+    Each accepted connection gets a thread; requests are (method, args) tuples
+    and replies ('ok', result) or ('error', message).
+    """
+
+    def __init__(self):
+        self.crop_model = None
+        self.mx = None
+        self.sc = None
+        self.crop_scorer = None
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def load(self):
+        from model_registry import preload_disease_model
+        from crop_scorer import build_scorer
+
+        with open('model.pkl', 'rb') as f:
+            self.crop_model = pickle.load(f)
+        with open('minmaxscaler.pkl', 'rb') as f:
+            self.mx = pickle.load(f)
+        with open('standscaler.pkl', 'rb') as f:
+            self.sc = pickle.load(f)
+        self.crop_scorer = build_scorer(self.crop_model, self.mx, self.sc)
+        preload_disease_model(warm_up=True)
+
+    # Methods callable by clients
+
+    def predict_disease(self, batch):
+        from model_registry import disease_registry
+        probabilities = disease_registry.predict(batch)
+        return {'model_id': disease_registry.model_id, 'probabilities': probabilities}
+
+    def recommend_crops(self, features):
+        """Crop labels (model classes) for an (n, 5) array; app.py maps them to names."""
+        if self.crop_scorer is not None:
+            return self.crop_scorer.predict(features)
+        return self.crop_model.predict(self.sc.transform(self.mx.transform(features)))
+
+    def info(self):
+        from model_registry import disease_registry
+        info = disease_registry.info()
+        info.update({'pid': os.getpid(), 'requests': self.requests, 'crop_scorer': self.crop_scorer is not None})
+        return info
+
+    def warm_up(self):
+        from model_registry import disease_registry
+        return disease_registry.warm_up()
+
+    METHODS = ('predict_disease', 'recommend_crops', 'info', 'warm_up')
+
+    def serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    method, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                with self.lock:
+                    self.requests += 1
+                try:
+                    if method not in self.METHODS:
+                        raise ValueError(f"Unknown method: {method}")
+                    reply = ('ok', getattr(self, method)(*args))
+                except Exception as e:
+                    reply = ('error', f"{type(e).__name__}: {e}")
+                try:
+                    conn.send(reply)
+                except (EOFError, OSError):
+                    return
+
+
+def _worker_main(listener, index, workers):
+    # The supervisor handles SIGINT; workers exit when it terminates them
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Each worker gets its share of the CPUs for TensorFlow's thread pools
+    from model_registry import disease_registry
+    disease_registry.share_cpus(workers)
+    service = InferenceService()
+    service.load()
+    print(f"Inference worker {index} (pid {os.getpid()}) ready")
+    while True:
+        try:
+            conn = listener.accept()
+        except (OSError, EOFError, AuthenticationError) as e:
+            print(f"Inference worker {index}: rejected connection: {e}")
+            continue
+        threading.Thread(target=service.serve_connection, args=(conn,), daemon=True).start()
+
+
+def serve(address=None, workers=None, authkey=None):
+    """Listen on `address` and keep `workers` worker processes accepting on it, until SIGTERM/SIGINT."""
+    import multiprocessing
+
+    address = parse_address(address or os.environ.get('INFERENCE_ADDRESS', DEFAULT_ADDRESS))
+    workers = workers or int(os.environ.get('INFERENCE_WORKERS', os.cpu_count() or 1))
+    authkey = authkey or _authkey_from_env(address)
+    generated_key = authkey is None
+
+    if isinstance(address, str) and not address.startswith('\\\\') and os.path.exists(address):
+        os.unlink(address)  # stale socket from a previous run
+    if generated_key:
+        authkey = secrets.token_bytes(32)
+        _write_key_file(address, authkey)
+    listener = Listener(address, authkey=authkey)
+    print(f"Inference pool listening on {address} with {workers} workers")
+
+    # Workers are forked from a parent that never imported TensorFlow
+    ctx = multiprocessing.get_context('fork')
+    processes = {}
+
+    def start(index):
+        process = ctx.Process(target=_worker_main, args=(listener, index, workers), name=f'inference-{index}', daemon=True)
+        process.start()
+        processes[index] = process
+
+    stopping = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stopping.set())
+
+    for index in range(workers):
+        start(index)
+    try:
+        while not stopping.wait(1.0):
+            for index, process in list(processes.items()):
+                if not process.is_alive():
+                    print(f"Inference worker {index} exited with {process.exitcode}; restarting")
+                    start(index)
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(5)
+        listener.close()
+        if generated_key:
+            try:
+                os.unlink(key_path(address))
+            except OSError:
+                pass
+
+
+# --- web worker side ---
+
+class InferenceClient:
+    """
+    Pooled connections to the inference workers.
+
+    At most pool_size calls are in flight per process; idle connections are
+    reused. A call that fails on a broken connection is retried once on a
+    fresh one (all methods are idempotent). Forked processes start with an
+    empty pool.
+    """
+
+    def __init__(self, address, authkey, pool_size=8, timeout=30.0):
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self._reset()
+
+        # Metrics
+        self.calls = 0
+        self.errors = 0
+        self.reconnects = 0
+        self.total_call_seconds = 0.0
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(self.pool_size)
+
+    def _authkey(self) -> bytes:
+        """The configured key, else the pool's generated one (re-read: it changes when the pool restarts)."""
+        if self.authkey is not None:
+            return self.authkey
+        try:
+            with open(key_path(self.address), 'rb') as f:
+                return f.read()
+        except OSError as e:
+            raise InferenceUnavailable(f"No INFERENCE_AUTHKEY and no key file for {self.address}: {e}")
+
+    def _connect(self):
+        try:
+            return Client(self.address, authkey=self._authkey())
+        except (OSError, EOFError, AuthenticationError) as e:
+            raise InferenceUnavailable(f"Cannot reach inference workers at {self.address}: {e}")
+
+    def _roundtrip(self, conn, method, args):
+        conn.send((method, args))
+        if not conn.poll(self.timeout):
+            raise TimeoutError(f"Inference call {method} timed out after {self.timeout}s")
+        return conn.recv()
+
+    def call(self, method: str, *args):
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self._reset()
+
+        started = time.perf_counter()
+        self.slots.acquire()
+        try:
+            for attempt in (1, 2):
+                try:
+                    conn = self.idle.get_nowait()
+                except queue.Empty:
+                    conn = self._connect()
+                try:
+                    status, result = self._roundtrip(conn, method, args)
+                except TimeoutError:
+                    conn.close()
+                    raise
+                except (EOFError, OSError) as e:
+                    # Worker restarted or connection went stale: retry once on a new one
+                    conn.close()
+                    with self.lock:
+                        self.reconnects += 1
+                    if attempt == 2:
+                        raise InferenceUnavailable(f"Inference call {method} failed: {e}")
+                    continue
+                self.idle.put(conn)
+                if status == 'error':
+                    raise RuntimeError(result)
+                return result
+        except Exception:
+            with self.lock:
+                self.errors += 1
+            raise
+        finally:
+            self.slots.release()
+            with self.lock:
+                self.calls += 1
+                self.total_call_seconds += time.perf_counter() - started
+
+    def recommend_crops(self, features):
+        return self.call('recommend_crops', features)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'address': str(self.address),
+                'pool_size': self.pool_size,
+                'idle_connections': self.idle.qsize(),
+                'calls': self.calls,
+                'errors': self.errors,
+                'reconnects': self.reconnects,
+                'avg_call_ms': round(self.total_call_seconds * 1000.0 / self.calls, 2) if self.calls else 0,
+            }
+
+
+class RemoteModelHandle:
+    """Stands in for the Keras model object in web workers (shapes + predict)."""
+
+    def __init__(self, owner, info):
+        self.owner = owner
+        self.input_shape = tuple(info['input_shape'])
+        self.output_shape = tuple(info['output_shape'])
+
+    def predict(self, batch, verbose=0):
+        return self.owner.predict(batch)
+
+
+class RemoteDiseaseModel:
+    """
+    DiseaseModelRegistry interface backed by the worker pool.
+    get() returns None while the pool is unreachable, like a missing model file.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.handle = None
+        self.model_path = None
+        self.model_id = None
+        self.last_error = None
+        self.lock = threading.Lock()
+
+    def _update(self, info):
+        self.model_path = info.get('model_path')
+        self.model_id = info.get('model_id')
+        self.last_error = info.get('last_error')
+
+    def get(self):
+        if self.handle is not None:
+            return self.handle
+        with self.lock:
+            if self.handle is None:
+                try:
+                    info = self.client.call('info')
+                except (InferenceUnavailable, RuntimeError, TimeoutError) as e:
+                    self.last_error = str(e)
+                    print(f"Disease model unavailable: {e}")
+                    return None
+                self._update(info)
+                if info.get('loaded'):
+                    self.handle = RemoteModelHandle(self, info)
+        return self.handle
+
+    def input_shape(self) -> tuple:
+        handle = self.get()
+        return handle.input_shape if handle is not None else None
+
+    def predict(self, batch):
+        result = self.client.call('predict_disease', batch)
+        # The pool may have been restarted with a different model file
+        self.model_id = result['model_id']
+        return result['probabilities']
+
+    def warm_up(self) -> bool:
+        return bool(self.client.call('warm_up'))
+
+    def reload(self):
+        with self.lock:
+            self.handle = None
+        return self.get()
+
+    def info(self) -> dict:
+        try:
+            info = self.client.call('info')
+            self._update(info)
+        except (InferenceUnavailable, RuntimeError, TimeoutError) as e:
+            info = {'loaded': False, 'last_error': str(e)}
+        info.update({'mode': 'remote', 'client': self.client.stats()})
+        return info
+
+
+# Global client instances (used by app.py when INFERENCE_MODE=remote; nothing connects until first use)
+inference_client = InferenceClient(
+    os.environ.get('INFERENCE_ADDRESS', DEFAULT_ADDRESS),
+    _authkey_from_env(os.environ.get('INFERENCE_ADDRESS', DEFAULT_ADDRESS)),
+    pool_size=int(os.environ.get('INFERENCE_POOL_SIZE', 8)),
+    timeout=float(os.environ.get('INFERENCE_TIMEOUT', 30)),
+)
+remote_disease_model = RemoteDiseaseModel(inference_client)
+
+
+def selftest(workers=2) -> bool:
+    """Start a pool in a child process and compare its answers with in-process inference."""
+    import tempfile
+    import subprocess
+    import numpy as np
+
+    address = os.path.join(tempfile.mkdtemp(), 'inference.sock')
+    env = dict(os.environ, INFERENCE_ADDRESS=address, INFERENCE_WORKERS=str(workers))
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'serve'], env=env)
+    try:
+        client = InferenceClient(address, _authkey_from_env(address), pool_size=4, timeout=120)
+        remote = RemoteDiseaseModel(client)
+        deadline = time.monotonic() + 300
+        while remote.get() is None:
+            if time.monotonic() > deadline or server.poll() is not None:
+                print("Inference pool did not start")
+                return False
+            time.sleep(1.0)
+
+        rng = np.random.default_rng(0)
+        batch = rng.random((4, 128, 128, 3), dtype=np.float32) * 255.0
+        features = np.array([[90, 42, 43, 20.8, 6.5], [85, 58, 41, 21.7, 7.0], [20, 30, 10, 25.0, 5.5]], dtype=np.float64)
+        remote_probabilities = remote.predict(batch)
+        remote_labels = client.recommend_crops(features)
+
+        # Same inputs in this process
+        service = InferenceService()
+        service.load()
+        local_probabilities = service.predict_disease(batch)['probabilities']
+        local_labels = service.recommend_crops(features)
+
+        # Many concurrent calls over the pooled connections
+        errors = []
+        def hammer():
+            try:
+                for _ in range(20):
+                    client.recommend_crops(features)
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=hammer) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        disease_ok = np.allclose(remote_probabilities, local_probabilities, atol=1e-5)
+        crop_ok = list(remote_labels) == list(local_labels)
+        passed = disease_ok and crop_ok and not errors
+        print(f"disease parity={disease_ok} (max diff {float(np.max(np.abs(remote_probabilities - local_probabilities))):.2e}), "
+              f"crop parity={crop_ok}, concurrent errors={len(errors)}, "
+              f"client={client.stats()} [{'ok' if passed else 'FAIL'}]")
+        return passed
+    finally:
+        server.terminate()
+        server.wait(30)
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == 'serve':
+        serve()
+    elif command == 'selftest':
+        sys.exit(0 if selftest() else 1)
+    else:
+        print("Usage: python inference_workers.py serve|selftest")
+        sys.exit(2)
@@ -0,0 +1,215 @@
+"""
+This module provides:
+- Write-behind logging for the detection/recommendation/fertilizer logs:
+  request threads enqueue rows and return, a background thread commits them
+  in batched transactions (one fsync per batch instead of one per request)
+- A bounded queue; when it is full the caller writes synchronously instead
+  of dropping the row
+- A flush on interpreter shutdown (atexit) and an explicit flush()
+- A strict mode (LOG_WRITER_STRICT=true) that writes synchronously and raises
+  on errors, for tests that read rows back immediately
+
+Usage:
+    from log_writer import log_writer
+
+    log_writer.write("INSERT INTO recommendation_logs (...) VALUES (?,?)", (a, b))
+    log_writer.write_many(sql, rows)
+    log_writer.flush()    # wait until everything queued so far is committed
+"""
+
+import os
+import time
+import queue
+import atexit
+import threading
+
+from db import get_db
+
+
+class LogWriter:
+    """
+    Batches INSERTs from many request threads into few transactions.
+
+    The writer thread blocks for the first queued item, then drains up to
+    max_batch_rows rows (waiting at most max_wait_ms for more) and commits
+    them together. If a batch fails, its rows are retried one by one so a
+    single bad row cannot take the rest down with it.
+    """
+
+    def __init__(self, max_queue=10000, max_batch_rows=500, max_wait_ms=20.0, strict=False, name='log-writer'):
+        self.max_queue = max_queue
+        self.max_batch_rows = max(1, int(max_batch_rows))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.strict = strict
+        self.name = name
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.worker = None
+        self.pid = os.getpid()
+
+        # Metrics
+        self.enqueued_rows = 0
+        self.written_rows = 0
+        self.failed_rows = 0
+        self.sync_writes = 0
+        self.batches = 0
+        self.batched_rows = 0
+        self.max_queue_depth = 0
+        self.total_commit_seconds = 0.0
+
+    def _ensure_worker(self):
+        """Start the writer thread lazily; a forked worker gets a fresh queue and thread."""
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.queue = queue.Queue(maxsize=self.max_queue)
+                    self.worker = None
+                    self.pid = os.getpid()
+        if self.worker is not None and self.worker.is_alive():
+            return
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self.worker.start()
+
+    def _write_now(self, sql: str, rows: list):
+        """Synchronous write on the calling thread. Returns the last row id."""
+        with get_db() as conn:
+            if len(rows) == 1:
+                row_id = conn.execute(sql, rows[0]).lastrowid
+            else:
+                conn.executemany(sql, rows)
+                row_id = None
+        with self.lock:
+            self.sync_writes += 1
+            self.written_rows += len(rows)
+        return row_id
+
+    def write_many(self, sql: str, rows: list):
+        """
+        Queue rows for one INSERT statement.
+
+        Returns:
+            None when queued; the last row id when written synchronously
+            (strict mode, or the queue was full)
+        """
+        rows = [tuple(row) for row in rows]
+        if not rows:
+            return None
+        if self.strict:
+            return self._write_now(sql, rows)
+
+        self._ensure_worker()
+        try:
+            self.queue.put_nowait((sql, rows))
+        except queue.Full:
+            # Backpressure: the caller pays for its own commit rather than losing the row
+            try:
+                return self._write_now(sql, rows)
+            except Exception as e:
+                with self.lock:
+                    self.failed_rows += len(rows)
+                print(f"Log write failed: {e}")
+                return None
+
+        depth = self.queue.qsize()
+        with self.lock:
+            self.enqueued_rows += len(rows)
+            if depth > self.max_queue_depth:
+                self.max_queue_depth = depth
+        return None
+
+    def write(self, sql: str, params: tuple):
+        """Queue one row. See write_many."""
+        return self.write_many(sql, [params])
+
+    def _collect(self) -> list:
+        """Block for the first item, then gather more until the batch is full or the wait expires."""
+        items = [self.queue.get()]
+        rows = len(items[0][1])
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_batch_rows:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            items.append(item)
+            rows += len(item[1])
+        return items
+
+    def _commit(self, items: list):
+        # Group by statement so each table gets one executemany
+        by_sql = {}
+        for sql, rows in items:
+            by_sql.setdefault(sql, []).extend(rows)
+        row_count = sum(len(rows) for rows in by_sql.values())
+
+        started = time.perf_counter()
+        try:
+            with get_db() as conn:
+                for sql, rows in by_sql.items():
+                    conn.executemany(sql, rows)
+            written, failed = row_count, 0
+        except Exception as e:
+            print(f"Batched log write failed ({row_count} rows), retrying row by row: {e}")
+            written = failed = 0
+            for sql, rows in by_sql.items():
+                for row in rows:
+                    try:
+                        with get_db() as conn:
+                            conn.execute(sql, row)
+                        written += 1
+                    except Exception as row_err:
+                        failed += 1
+                        print(f"Dropped log row {row!r}: {row_err}")
+        elapsed = time.perf_counter() - started
+
+        with self.lock:
+            self.batches += 1
+            self.batched_rows += row_count
+            self.written_rows += written
+            self.failed_rows += failed
+            self.total_commit_seconds += elapsed
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            try:
+                self._commit(items)
+            finally:
+                for _ in items:
+                    self.queue.task_done()
+
+    def flush(self):
+        """Block until every row queued so far has been committed (or failed)."""
+        if self.worker is not None and self.worker.is_alive() and self.pid == os.getpid():
+            self.queue.join()
+
+    def stats(self) -> dict:
+        with self.lock:
+            batches = self.batches
+            return {
+                'strict': self.strict,
+                'queue_depth': self.queue.qsize(),
+                'max_queue_depth': self.max_queue_depth,
+                'enqueued_rows': self.enqueued_rows,
+                'written_rows': self.written_rows,
+                'failed_rows': self.failed_rows,
+                'sync_writes': self.sync_writes,
+                'batches': batches,
+                'avg_batch_rows': round(self.batched_rows / batches, 2) if batches else 0,
+                'avg_commit_ms': round(self.total_commit_seconds * 1000.0 / batches, 3) if batches else 0,
+            }
+
+
+# Global writer instance
+log_writer = LogWriter(
+    max_queue=int(os.environ.get('LOG_WRITER_MAX_QUEUE', 10000)),
+    max_batch_rows=int(os.environ.get('LOG_WRITER_MAX_BATCH_ROWS', 500)),
+    max_wait_ms=float(os.environ.get('LOG_WRITER_MAX_WAIT_MS', 20)),
+    strict=os.environ.get('LOG_WRITER_STRICT', '').lower() in ('1', 'true', 'yes'),
+)
+
+# Commit whatever is still queued when the worker process exits
+atexit.register(log_writer.flush)
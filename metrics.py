@@ -0,0 +1,243 @@
+"""
+This module provides:
+- An in-process registry of latency histograms (Prometheus-style cumulative
+  buckets, with sum and count per label set)
+- stage_span(): times one stage of a prediction pipeline into
+  plant_pipeline_stage_seconds{pipeline, stage}
+- Component stats (the dicts behind /api/admin/runtime-stats) exported as
+  gauges, and rendering in the Prometheus text format for the /metrics
+  endpoint (component stats only for scrapers holding METRICS_TOKEN)
+- Level-gated structured logging: log_event() writes one
+  "event key=value ..." line and does no formatting at all when the level
+  is disabled (LOG_LEVEL, default INFO)
+
+Values are per process: with several gunicorn workers, each scrape reports
+the worker that answered it.
+
+Usage:
+    from metrics import metrics, stage_span, get_logger, log_event
+
+    with stage_span('disease', 'decode'):
+        image = decode_image(data)
+
+    log = get_logger('plant.disease')
+    log_event(log, logging.INFO, 'low_confidence', confidence=42.0)
+    if log.isEnabledFor(logging.DEBUG):
+        log_event(log, logging.DEBUG, 'probabilities', values=probabilities.tolist())
+
+    metrics.register_stats('log_writer', log_writer.stats)
+    text = metrics.render()
+"""
+
+import os
+import re
+import sys
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+
+
+# Seconds; spans range from sub-millisecond stages (digest, argmax) to multi-second uploads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_INVALID_NAME_CHARS = re.compile(r'[^a-zA-Z0-9_]')
+
+
+def _metric_name(*parts) -> str:
+    return _INVALID_NAME_CHARS.sub('_', '_'.join(str(p) for p in parts if p != ''))
+
+
+def _label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with optional labels.
+
+    observe() is a bisect and a few additions under a lock, cheap enough to
+    call several times per request.
+    """
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.series = {}   # label values -> [bucket counts..., +Inf count], sum
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labelvalues)
+            if series is None:
+                series = self.series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def snapshot(self) -> dict:
+        """{label values: {'count', 'sum', 'buckets': [(upper bound, cumulative count), ...]}}"""
+        with self.lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self.series.items()}
+        result = {}
+        for labels, (counts, total) in series.items():
+            cumulative, running = [], 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                running += count
+                cumulative.append((bound, running))
+            result[labels] = {'count': running, 'sum': total, 'buckets': cumulative}
+        return result
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, data in sorted(self.snapshot().items()):
+            pairs = [f'{k}="{_label_value(v)}"' for k, v in zip(self.labelnames, labels)]
+            for bound, count in data['buckets']:
+                bucket_labels = ','.join(pairs + [f'le="{_format_value(bound)}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {count}")
+            suffix = f"{{{','.join(pairs)}}}" if pairs else ''
+            lines.append(f"{self.name}_sum{suffix} {_format_value(data['sum'])}")
+            lines.append(f"{self.name}_count{suffix} {data['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """Histograms plus stats callbacks, rendered together for /metrics."""
+
+    def __init__(self, namespace: str = 'plant'):
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.stats_sources = {}
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        """Get or create the histogram `<namespace>_<name>`."""
+        full_name = _metric_name(self.namespace, name)
+        with self.lock:
+            histogram = self.histograms.get(full_name)
+            if histogram is None:
+                histogram = self.histograms[full_name] = Histogram(full_name, help_text, labelnames, buckets)
+            return histogram
+
+    def register_stats(self, component: str, stats_fn):
+        """Export the numeric values of stats_fn() (a possibly nested dict) as gauges."""
+        with self.lock:
+            self.stats_sources[component] = stats_fn
+
+    def _stats_lines(self, component: str, stats_fn) -> list:
+        try:
+            stats = stats_fn()
+        except Exception as e:
+            return [f"# {component} stats unavailable: {_INVALID_NAME_CHARS.sub(' ', str(e))}"]
+        lines = []
+
+        def flatten(prefix, value):
+            if isinstance(value, dict):
+                for key, item in value.items():
+                    flatten(f"{prefix}_{key}", item)
+            elif isinstance(value, bool):
+                lines.append(f"{_metric_name(prefix)} {int(value)}")
+            elif isinstance(value, (int, float)):
+                lines.append(f"{_metric_name(prefix)} {_format_value(value)}")
+
+        flatten(_metric_name(self.namespace, component), stats)
+        return [line for metric in lines for line in (f"# TYPE {metric.split(' ')[0]} gauge", metric)]
+
+    def render(self, include_stats: bool = True) -> str:
+        """Histograms, and the component stats unless include_stats is False, in the Prometheus text format (0.0.4)."""
+        with self.lock:
+            histograms = list(self.histograms.values())
+            sources = list(self.stats_sources.items()) if include_stats else []
+        lines = []
+        for histogram in histograms:
+            lines.extend(histogram.render())
+        for component, stats_fn in sources:
+            lines.extend(self._stats_lines(component, stats_fn))
+        return '\n'.join(lines) + '\n'
+
+
+# Global registry and the pipeline stage histogram
+metrics = MetricsRegistry(namespace=os.environ.get('METRICS_NAMESPACE', 'plant'))
+
+PIPELINE_STAGE_SECONDS = metrics.histogram(
+    'pipeline_stage_seconds',
+    'Time spent in each stage of the disease and crop prediction pipelines.',
+    labelnames=('pipeline', 'stage'),
+)
+
+
+@contextmanager
+def stage_span(pipeline: str, stage: str):
+    """Time the enclosed block as one stage of a pipeline (recorded even if it raises)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        PIPELINE_STAGE_SECONDS.observe(time.perf_counter() - started, pipeline, stage)
+
+
+# --- level-gated structured logging ---
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """A logger writing "time level name event key=value ..." lines to stdout at LOG_LEVEL."""
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+        logger.propagate = False
+    return logger
+
+
+def _logfmt(value) -> str:
+    if isinstance(value, float):
+        value = round(value, 4)
+    text = str(value)
+    if not text or any(c in text for c in ' ="'):
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return text
+
+
+def log_event(logger: logging.Logger, level: int, event: str, **fields):
+    """
+    Log one event with key=value fields; nothing is formatted if `level` is disabled.
+
+    Arguments are still evaluated by the caller, so guard expensive ones with
+    logger.isEnabledFor(level).
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, '%s %s', event, ' '.join(f"{key}={_logfmt(value)}" for key, value in fields.items()))
+
+
+if __name__ == '__main__':
+    # The cost of a span and of a disabled debug log (correctness: tests/test_metrics.py)
+    n = 100000
+    started = time.perf_counter()
+    for _ in range(n):
+        with stage_span('selftest', 'noop'):
+            pass
+    span_us = (time.perf_counter() - started) * 1e6 / n
+
+    quiet = get_logger('plant.selftest')
+    quiet.setLevel(logging.WARNING)
+    payload = list(range(1000))
+    started = time.perf_counter()
+    for _ in range(n):
+        if quiet.isEnabledFor(logging.DEBUG):
+            log_event(quiet, logging.DEBUG, 'probabilities', values=payload)
+    disabled_us = (time.perf_counter() - started) * 1e6 / n
+
+    print(f"stage_span: {span_us:.2f} us per span; disabled debug log: {disabled_us:.3f} us per call")
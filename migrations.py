@@ -0,0 +1,248 @@
+"""
+This module provides:
+- Versioned schema migrations tracked in SQLite's PRAGMA user_version
+- Indexes for the log tables' hot queries
+- An EXPLAIN QUERY PLAN regression check that fails if a hot query scans a
+  table (run by tests/test_migrations.py)
+
+Usage:
+    from migrations import migrate
+    migrate(conn)                 # apply every pending migration in order
+
+    python migrations.py          # migrate database.db
+"""
+
+import sys
+import sqlite3
+
+
+def _base_tables(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT UNIQUE NOT NULL,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        banned_until TEXT,
+        ban_reason TEXT,
+        profile_picture TEXT,
+        is_admin BOOLEAN DEFAULT 0
+    )''')
+    # Log of crop recommendations
+    conn.execute('''CREATE TABLE IF NOT EXISTS recommendation_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        crop TEXT,
+        nitrogen REAL,
+        phosphorus REAL,
+        potassium REAL,
+        temperature REAL,
+        ph REAL,
+        created_at TEXT DEFAULT (datetime('now'))
+    )''')
+    # Detection logs for storing plant disease detection results
+    conn.execute('''CREATE TABLE IF NOT EXISTS detection_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        plant_name TEXT,
+        disease TEXT,
+        confidence REAL,
+        image_url TEXT,
+        all_probabilities TEXT,
+        created_at TEXT DEFAULT (datetime('now'))
+    )''')
+    # Fertilizer recommendations
+    conn.execute('''CREATE TABLE IF NOT EXISTS fertilizer_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        crop TEXT,
+        nitrogen_current REAL,
+        phosphorus_current REAL,
+        potassium_current REAL,
+        recommendation TEXT,
+        created_at TEXT DEFAULT (datetime('now'))
+    )''')
+
+
+def _columns(conn, table: str) -> set:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _backfill_columns(conn):
+    """Columns added after the first release, for databases created before them."""
+    users = _columns(conn, 'users')
+    for column, ddl in (('banned_until', 'TEXT'), ('ban_reason', 'TEXT'), ('profile_picture', 'TEXT')):
+        if column not in users:
+            conn.execute(f'ALTER TABLE users ADD COLUMN {column} {ddl}')
+    if 'is_admin' not in users:
+        conn.execute('ALTER TABLE users ADD COLUMN is_admin BOOLEAN DEFAULT 0')
+        # Set user ID 2 as admin default
+        conn.execute('UPDATE users SET is_admin = 1 WHERE id = 2')
+
+    if 'all_probabilities' not in _columns(conn, 'detection_logs'):
+        conn.execute('ALTER TABLE detection_logs ADD COLUMN all_probabilities TEXT')
+
+
+def _log_indexes(conn):
+    # Per-user history, counts and "recent N" lookups
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_detection_logs_user_created ON detection_logs(user_id, created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_recommendation_logs_user_created ON recommendation_logs(user_id, created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_fertilizer_logs_user_created ON fertilizer_logs(user_id, created_at)')
+    # Admin (all users) history ordered by time
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_detection_logs_created ON detection_logs(created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_recommendation_logs_created ON recommendation_logs(created_at)')
+    # Distribution GROUP BYs
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_detection_logs_disease ON detection_logs(disease)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_recommendation_logs_crop ON recommendation_logs(crop)')
+
+
+def _history_filter_indexes(conn):
+    # Keyset-paginated history filtered by plant/disease/crop, newest first.
+    # The implicit rowid (id) at the end of each index gives the (created_at, id) order.
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_detection_logs_disease_created ON detection_logs(disease, created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_detection_logs_plant_created ON detection_logs(plant_name, created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_recommendation_logs_crop_created ON recommendation_logs(crop, created_at)')
+    # Superseded by the composite indexes above (same leading column)
+    conn.execute('DROP INDEX IF EXISTS idx_detection_logs_disease')
+    conn.execute('DROP INDEX IF EXISTS idx_recommendation_logs_crop')
+
+
+def _rollup_tables(conn):
+    # Counters maintained by triggers; backfilled from the existing logs once
+    from rollups import create_rollups, rebuild_rollups
+    create_rollups(conn)
+    rebuild_rollups(conn)
+
+
+def _user_activity_counters(conn):
+    # One rollup_user row per user, created/removed with the user, so the admin
+    # listing can be driven from it and sorted by activity through an index.
+    conn.execute('DELETE FROM rollup_user WHERE user_id NOT IN (SELECT id FROM users)')
+    conn.execute('INSERT INTO rollup_user (user_id) SELECT id FROM users WHERE true ON CONFLICT(user_id) DO NOTHING')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_users_rollup_user_insert AFTER INSERT ON users BEGIN
+        INSERT INTO rollup_user (user_id) VALUES (NEW.id) ON CONFLICT(user_id) DO NOTHING;
+    END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_users_rollup_user_delete AFTER DELETE ON users BEGIN
+        DELETE FROM rollup_user WHERE user_id = OLD.id;
+    END''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_rollup_user_detections ON rollup_user(detections, user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_rollup_user_recommendations ON rollup_user(recommendations, user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_rollup_user_activity ON rollup_user(detections + recommendations, user_id)')
+
+
+def _image_url_index(conn):
+    # Duplicate uploads share one content-addressed file; deleting a detection
+    # checks whether any other row still references its image.
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_detection_logs_image_url ON detection_logs(image_url)')
+
+
+# (version, description, apply function). Append only; never reorder or edit a shipped entry.
+MIGRATIONS = [
+    (1, 'base tables', _base_tables),
+    (2, 'backfill user and detection columns', _backfill_columns),
+    (3, 'log table indexes', _log_indexes),
+    (4, 'history filter indexes', _history_filter_indexes),
+    (5, 'rollup tables and triggers', _rollup_tables),
+    (6, 'per-user activity counters', _user_activity_counters),
+    (7, 'detection image reference index', _image_url_index),
+]
+
+
+def current_version(conn) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn) -> list:
+    """
+    Apply pending migrations, each in its own transaction together with the
+    user_version bump. Returns the list of versions applied.
+    """
+    applied = []
+    previous_isolation = conn.isolation_level
+    if conn.in_transaction:
+        conn.commit()
+    conn.isolation_level = None  # manage BEGIN/COMMIT explicitly so DDL is transactional
+    try:
+        version = current_version(conn)
+        for number, description, apply in MIGRATIONS:
+            if number <= version:
+                continue
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Re-check under the write lock in case another worker migrated first
+                if current_version(conn) >= number:
+                    conn.execute('ROLLBACK')
+                    continue
+                apply(conn)
+                conn.execute(f'PRAGMA user_version = {int(number)}')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            print(f"Applied migration {number}: {description}")
+            applied.append(number)
+        if applied:
+            conn.execute('PRAGMA optimize')
+    finally:
+        conn.isolation_level = previous_isolation
+    return applied
+
+
+# Queries the app runs on every page view. Each must be answered from an index.
+HOT_QUERIES = [
+    ('user detections page', "SELECT id, created_at FROM detection_logs WHERE user_id = ? AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?", (1, '2030-01-01', 10, 51)),
+    ('all detections page', "SELECT id, created_at FROM detection_logs WHERE (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?", ('2030-01-01', 10, 51)),
+    ('detections by disease page', "SELECT id, created_at FROM detection_logs WHERE disease = ? AND created_at >= ? AND created_at < ? ORDER BY created_at DESC, id DESC LIMIT ?", ('Potato___healthy', '2025-01-01', '2026-01-01', 51)),
+    ('detections by plant page', "SELECT id, created_at FROM detection_logs WHERE plant_name = ? ORDER BY created_at DESC, id DESC LIMIT ?", ('Potato', 51)),
+    ('user recommendations page', "SELECT id, created_at FROM recommendation_logs WHERE user_id = ? AND created_at >= ? ORDER BY created_at DESC, id DESC LIMIT ?", (1, '2025-01-01', 51)),
+    ('all recommendations page', "SELECT id, created_at FROM recommendation_logs WHERE (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?", ('2030-01-01', 10, 51)),
+    ('recommendations by crop page', "SELECT id, created_at FROM recommendation_logs WHERE crop = ? ORDER BY created_at DESC, id DESC LIMIT ?", ('Rice', 51)),
+    ('fertilizer history', "SELECT * FROM fertilizer_logs WHERE user_id = ? ORDER BY created_at DESC", (1,)),
+    ('user detection count', "SELECT COUNT(*) FROM detection_logs WHERE user_id=?", (1,)),
+    ('user recommendation count', "SELECT COUNT(*) FROM recommendation_logs WHERE user_id=?", (1,)),
+    ('image still referenced', "SELECT 1 FROM detection_logs WHERE image_url = ? LIMIT 1", ('/static/uploads/crop_0.jpg',)),
+    ('recent detections', "SELECT id, user_id, plant_name, disease, confidence, image_url, created_at FROM detection_logs WHERE user_id=? ORDER BY created_at DESC LIMIT 5", (1,)),
+    ('disease distribution', "SELECT disease, COUNT(*) FROM detection_logs GROUP BY disease", ()),
+    ('crop distribution', "SELECT crop, COUNT(*) as c FROM recommendation_logs GROUP BY crop ORDER BY c DESC", ()),
+    ('monthly recommendations', "SELECT substr(created_at, 1, 7) AS ym, COUNT(*) FROM recommendation_logs WHERE created_at >= ? AND created_at < ? GROUP BY ym", ('2025-11-01 00:00:00', '2026-11-01 00:00:00')),
+    ('user monthly recommendations', "SELECT substr(created_at, 1, 7) AS ym, COUNT(*) FROM recommendation_logs WHERE created_at >= ? AND created_at < ? AND user_id = ? GROUP BY ym", ('2025-11-01 00:00:00', '2026-11-01 00:00:00', 1)),
+    ('monthly detections', "SELECT substr(created_at, 1, 7) AS ym, COUNT(*) FROM detection_logs WHERE created_at >= ? AND created_at < ? GROUP BY ym", ('2026-05-01 00:00:00', '2026-11-01 00:00:00')),
+    ('admin users by id', """
+        SELECT u.id, u.username, r.detections, r.recommendations
+        FROM rollup_user r JOIN users u ON u.id = r.user_id
+        WHERE r.user_id < ?
+        ORDER BY r.user_id DESC LIMIT ?""", (50000, 51)),
+    ('admin users by username', """
+        SELECT u.id, u.username, r.detections, r.recommendations
+        FROM rollup_user r JOIN users u ON u.id = r.user_id
+        WHERE u.username < ?
+        ORDER BY u.username DESC LIMIT ?""", ('m', 51)),
+    ('admin users by activity', """
+        SELECT u.id, u.username, r.detections, r.recommendations
+        FROM rollup_user r JOIN users u ON u.id = r.user_id
+        WHERE r.detections + r.recommendations <= ? AND (r.detections + r.recommendations < ? OR r.user_id < ?)
+        ORDER BY r.detections + r.recommendations DESC, r.user_id DESC LIMIT ?""", (10, 10, 50000, 51)),
+]
+
+LOG_TABLES = ('detection_logs', 'recommendation_logs', 'fertilizer_logs')
+
+
+def plan_problems(conn, sql: str, params=()) -> list:
+    """
+    Return the EXPLAIN QUERY PLAN lines that indicate a log table scan or a row
+    sort. Sorting the (small) output of a GROUP BY is allowed.
+    """
+    problems = []
+    grouped = 'GROUP BY' in sql.upper()
+    for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params):
+        detail = row[-1]
+        scans_table = detail.startswith('SCAN ') and 'INDEX' not in detail
+        sorts_rows = 'TEMP B-TREE FOR ORDER BY' in detail and not grouped
+        if (scans_table and any(t in detail for t in LOG_TABLES)) or sorts_rows:
+            problems.append(detail)
+    return problems
+
+
+if __name__ == '__main__':
+    with sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else 'database.db') as conn:
+        applied = migrate(conn)
+        print(f"Schema at version {current_version(conn)} ({len(applied)} migration(s) applied)")
@@ -0,0 +1,280 @@
+"""
+This module provides:
+- A process-resident registry for the plant disease Keras model
+- One-time loading per worker (thread-safe), with an optional warm-up inference
+- Model identity, input shape and load time for diagnostics endpoints
+- A choice of inference backend (DISEASE_BACKEND): the Keras model as
+  trained, or a TFLite interpreter converted from it with optional float16 or
+  int8 quantization (DISEASE_TFLITE_QUANTIZATION, see tflite_backend.py)
+- For Keras, a tf.function traced once with a fixed (batch, 128, 128, 3)
+  float32 signature instead of model.predict, which builds a tf.data
+  pipeline and callbacks on every call
+- Warm-up of every batch size in DISEASE_WARMUP_BATCH_SIZES
+- TensorFlow intra-/inter-op thread counts pinned to the process's share
+  of the CPU allocation (share_cpus), unless DISEASE_INTRA_OP_THREADS /
+  DISEASE_INTER_OP_THREADS are set
+
+Usage:
+    from model_registry import disease_registry
+
+    model = disease_registry.get()      # loads on first call, then cached
+    info = disease_registry.info()
+"""
+
+import os
+import time
+import hashlib
+import threading
+
+import numpy as np
+
+
+# Candidate model files, tried in order
+DISEASE_MODEL_PATHS = (
+    "trained_plant_disease_model.keras",
+    "plant_disease_model.h5",
+)
+
+DISEASE_INPUT_SHAPE = (128, 128, 3)
+
+
+def cpu_allocation() -> int:
+    """CPUs this process may use: its affinity mask, capped by a cgroup v2 CPU quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cpus = min(cpus, max(1, -(-int(quota) // int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def configure_threads(intra_op: int, inter_op: int) -> bool:
+    """Pin TensorFlow's thread pools. Only possible before TensorFlow runs its first op."""
+    import tensorflow as tf
+
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+        return True
+    except RuntimeError as e:
+        print(f"TensorFlow thread counts not applied (runtime already started): {e}")
+        return False
+
+
+class TracedKerasModel:
+    """
+    A Keras model called through one tf.function with a fixed input signature.
+
+    The batch dimension is left open, so a single trace serves every batch size;
+    each call is a direct graph execution without model.predict's per-call
+    tf.data and callback setup.
+    """
+
+    def __init__(self, model):
+        import tensorflow as tf
+
+        self.model = model
+        self.input_shape = tuple(model.input_shape)
+        self.output_shape = tuple(model.output_shape)
+        self.function = tf.function(
+            lambda images: model(images, training=False),
+            input_signature=[tf.TensorSpec((None,) + DISEASE_INPUT_SHAPE, tf.float32)],
+        )
+
+    def predict(self, batch, verbose=0) -> np.ndarray:
+        return self.function(np.asarray(batch, dtype=np.float32)).numpy()
+
+
+class DiseaseModelRegistry:
+    """
+    Loads the disease model once per process and keeps it warm.
+
+    Every request handler should go through get() instead of calling
+    tf.keras.models.load_model() itself.
+
+    With backend='tflite' the loaded object is a tflite_backend.TFLiteModel,
+    which has the same input_shape/output_shape/predict surface, and model_id
+    carries the backend and quantization so cached predictions never mix.
+    """
+
+    def __init__(self, paths=DISEASE_MODEL_PATHS, backend='keras', quantization='none',
+                 tflite_cache_dir=None, calibration_dir=None, num_threads=None,
+                 warmup_batch_sizes=(1,), intra_op_threads=None, inter_op_threads=None):
+        if backend not in ('keras', 'tflite'):
+            raise ValueError(f"Unknown DISEASE_BACKEND '{backend}' (expected keras or tflite)")
+        self.paths = tuple(paths)
+        self.backend = backend
+        self.quantization = quantization
+        self.tflite_cache_dir = tflite_cache_dir
+        self.calibration_dir = calibration_dir
+        self.warmup_batch_sizes = tuple(warmup_batch_sizes) or (1,)
+        self.intra_op_configured = intra_op_threads is not None
+        self.inter_op_configured = inter_op_threads is not None
+        self.intra_op_threads = intra_op_threads or cpu_allocation()
+        self.inter_op_threads = inter_op_threads or min(2, self.intra_op_threads)
+        self.num_threads = num_threads or self.intra_op_threads
+        self.tflite_threads_configured = num_threads is not None
+        self.threads_pinned = False
+        self.model = None
+        self.model_path = None
+        self.model_id = None
+        self.load_seconds = None
+        self.loaded_at = None
+        self.warmed_up = False
+        self.last_error = None
+        self.lock = threading.Lock()
+
+    def _file_identity(self, path: str) -> str:
+        """Short content hash of the model file, used as the model's identity."""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()[:16]
+
+    def share_cpus(self, processes: int):
+        """Size the thread pools for one of `processes` inference processes on this host
+        (inference pool workers, or web workers in local mode). Thread counts configured
+        explicitly are kept; no effect once the model is loaded."""
+        if self.model is not None:
+            return
+        share = max(1, cpu_allocation() // max(1, processes))
+        if not self.intra_op_configured:
+            self.intra_op_threads = share
+        if not self.inter_op_configured:
+            self.inter_op_threads = min(2, share)
+        if not self.tflite_threads_configured:
+            self.num_threads = share
+
+    def _load_keras(self, path: str):
+        if not self.threads_pinned:
+            self.threads_pinned = configure_threads(self.intra_op_threads, self.inter_op_threads)
+        import tensorflow as tf
+        return tf.keras.models.load_model(path)
+
+    def _load(self):
+        for path in self.paths:
+            if not os.path.exists(path):
+                continue
+            try:
+                started = time.perf_counter()
+                model_id = self._file_identity(path)
+                if self.backend == 'tflite':
+                    from tflite_backend import load_or_convert
+                    model = load_or_convert(
+                        lambda: self._load_keras(path), model_id, self.quantization,
+                        cache_dir=self.tflite_cache_dir, calibration_dir=self.calibration_dir,
+                        num_threads=self.num_threads
+                    )
+                    model_id = f"{model_id}-tflite-{self.quantization}"
+                else:
+                    model = TracedKerasModel(self._load_keras(path))
+                self.load_seconds = time.perf_counter() - started
+                self.model_path = path
+                self.model_id = model_id
+                self.loaded_at = time.time()
+                self.last_error = None
+                print(f"Loaded disease model {path} ({self.backend}) in {self.load_seconds:.2f}s")
+                return model
+            except Exception as e:
+                self.last_error = f"{path}: {e}"
+                print(f"Failed to load disease model {path}: {e}")
+
+        if self.last_error is None:
+            self.last_error = "No model files found"
+        print("No disease model could be loaded")
+        return None
+
+    def get(self):
+        """Return the loaded model, loading it on first use. Returns None if unavailable."""
+        if self.model is not None:
+            return self.model
+        with self.lock:
+            if self.model is None:
+                self.model = self._load()
+        return self.model
+
+    def input_shape(self) -> tuple:
+        """Input shape of the loaded model, e.g. (None, 128, 128, 3)."""
+        model = self.get()
+        if model is None:
+            return None
+        return tuple(model.input_shape)
+
+    def warm_up(self) -> bool:
+        """Run a dummy inference per warm-up batch size so real requests don't pay tracing or allocation."""
+        model = self.get()
+        if model is None:
+            return False
+        shape = [d for d in model.input_shape[1:]]
+        for batch_size in self.warmup_batch_sizes:
+            model.predict(np.zeros([batch_size] + shape, dtype=np.float32), verbose=0)
+        self.warmed_up = True
+        return True
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        """Run the loaded model on a (N, 128, 128, 3) batch and return (N, classes) probabilities."""
+        model = self.get()
+        if model is None:
+            raise RuntimeError("Disease model not available")
+        return model.predict(batch, verbose=0)
+
+    def reload(self):
+        """Drop the cached model and load it again from disk."""
+        with self.lock:
+            self.model = None
+            self.warmed_up = False
+            self.model = self._load()
+        return self.model
+
+    def info(self) -> dict:
+        """Describe the loaded model without triggering a load."""
+        model = self.model
+        return {
+            'loaded': model is not None,
+            'backend': self.backend,
+            'quantization': self.quantization if self.backend == 'tflite' else None,
+            'model_path': self.model_path,
+            'model_id': self.model_id,
+            'input_shape': list(model.input_shape) if model is not None else None,
+            'output_shape': list(model.output_shape) if model is not None else None,
+            'load_seconds': round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            'loaded_at': self.loaded_at,
+            'warmed_up': self.warmed_up,
+            'warmup_batch_sizes': list(self.warmup_batch_sizes),
+            'threads': {
+                'intra_op': self.intra_op_threads,
+                'inter_op': self.inter_op_threads,
+                'pinned': self.threads_pinned,
+                'tflite': self.num_threads,
+            },
+            'last_error': self.last_error,
+        }
+
+
+# Global registry instance (one per worker process)
+disease_registry = DiseaseModelRegistry(
+    backend=os.environ.get('DISEASE_BACKEND', 'keras').lower(),
+    quantization=os.environ.get('DISEASE_TFLITE_QUANTIZATION', 'none').lower(),
+    tflite_cache_dir=os.environ.get('DISEASE_TFLITE_CACHE_DIR', 'tflite_cache'),
+    calibration_dir=os.environ.get('DISEASE_CALIBRATION_DIR', os.path.join('test', 'test')),
+    num_threads=int(os.environ['DISEASE_TFLITE_THREADS']) if os.environ.get('DISEASE_TFLITE_THREADS') else None,
+    warmup_batch_sizes=[int(n) for n in os.environ.get('DISEASE_WARMUP_BATCH_SIZES', '1,2,4,8,16').split(',') if n.strip()],
+    intra_op_threads=int(os.environ['DISEASE_INTRA_OP_THREADS']) if os.environ.get('DISEASE_INTRA_OP_THREADS') else None,
+    inter_op_threads=int(os.environ['DISEASE_INTER_OP_THREADS']) if os.environ.get('DISEASE_INTER_OP_THREADS') else None,
+)
+
+
+def preload_disease_model(warm_up: bool = True) -> bool:
+    """Load (and optionally warm up) the disease model at worker startup."""
+    if disease_registry.get() is None:
+        return False
+    if warm_up:
+        disease_registry.warm_up()
+    return True
@@ -0,0 +1,167 @@
+"""
+This module provides:
+- A bounded thread pool for werkzeug password hashing and verification, so a
+  login burst queues behind a few KDF workers instead of occupying every
+  request thread (hashlib's scrypt/pbkdf2 release the GIL while they run)
+- Backpressure: when the pool and its queue are full, HashingSaturated is
+  raised immediately (the app turns it into a 503)
+- Hash/verify latency percentiles
+- Configurable cost parameters with rehash-on-login when they change
+
+Configured with PASSWORD_HASH_METHOD (a werkzeug method string such as
+'scrypt:32768:8:1' or 'pbkdf2:sha256:1000000'), PASSWORD_HASH_WORKERS and
+PASSWORD_HASH_MAX_QUEUE.
+
+Usage:
+    from password_hashing import password_hasher, HashingSaturated
+
+    stored = password_hasher.hash(password)
+    ok, upgraded = password_hasher.verify_and_update(stored, password)
+    if ok and upgraded:
+        ...  # save `upgraded` in place of `stored`
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+
+class HashingSaturated(Exception):
+    """Every hashing worker is busy and the queue is full."""
+
+
+def stored_method(method: str) -> str:
+    """
+    The method prefix werkzeug stores for a method string, with its defaults
+    filled in the way generate_password_hash does: 'scrypt' -> 'scrypt:32768:8:1',
+    'pbkdf2' -> 'pbkdf2:sha256:<DEFAULT_PBKDF2_ITERATIONS>'. No KDF is run.
+
+    Raises:
+        ValueError: for a method werkzeug would reject
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        if not args:
+            args = [2 ** 15, 8, 1]
+        elif len(args) != 3:
+            raise ValueError("'scrypt' takes 3 arguments.")
+        return 'scrypt:{}:{}:{}'.format(*map(int, args))
+    if name == 'pbkdf2':
+        if len(args) > 2:
+            raise ValueError("'pbkdf2' takes 2 arguments.")
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    raise ValueError(f"Invalid hash method '{name}'.")
+
+
+class PasswordHasher:
+    """
+    Runs password KDF work on `workers` threads with at most `max_queue`
+    jobs waiting. Callers block until their own job finishes, but a job that
+    cannot even be queued fails fast with HashingSaturated.
+    """
+
+    def __init__(self, method='scrypt', workers=2, max_queue=32, sample_size=1024):
+        self.method = method
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self.slots = threading.BoundedSemaphore(workers + max_queue)
+
+        # The prefix werkzeug stores for this method, e.g. 'scrypt' -> 'scrypt:32768:8:1'
+        self.stored_method = stored_method(method)
+
+        # Metrics
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.samples = {'hash': deque(maxlen=sample_size), 'verify': deque(maxlen=sample_size)}
+
+    def _run(self, kind: str, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise HashingSaturated("Password hashing is saturated, please retry shortly")
+        with self.lock:
+            self.in_flight += 1
+
+        def job():
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self.lock:
+                    self.samples[kind].append(elapsed)
+
+        try:
+            return self.executor.submit(job).result()
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+            self.slots.release()
+
+    def hash(self, password: str) -> str:
+        """generate_password_hash with the configured method, on the pool."""
+        return self._run('hash', generate_password_hash, password, self.method)
+
+    def verify(self, pwhash: str, password: str) -> bool:
+        """check_password_hash on the pool."""
+        return self._run('verify', check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        """True if the hash was made with a different method or cost than configured."""
+        return pwhash.split('$', 1)[0] != self.stored_method
+
+    def verify_and_update(self, pwhash: str, password: str) -> tuple:
+        """
+        Verify a password and, if it matches an outdated hash, rehash it.
+
+        Returns:
+            (is_valid: bool, new_hash: str or None) - store new_hash when it is not None
+        """
+        if not self.verify(pwhash, password):
+            return False, None
+        if not self.needs_rehash(pwhash):
+            return True, None
+        new_hash = self.hash(password)
+        with self.lock:
+            self.rehashed += 1
+        return True, new_hash
+
+    @staticmethod
+    def _percentiles(samples) -> dict:
+        if not samples:
+            return {'count': 0, 'p50_ms': 0, 'p95_ms': 0, 'p99_ms': 0}
+        ordered = sorted(samples)
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000.0, 2)
+        return {'count': len(ordered), 'p50_ms': pick(0.50), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99)}
+
+    def stats(self) -> dict:
+        with self.lock:
+            counters = {
+                'method': self.stored_method,
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'in_flight': self.in_flight,
+                'rejected': self.rejected,
+                'rehashed': self.rehashed,
+            }
+            samples = {kind: list(values) for kind, values in self.samples.items()}
+        counters['hash_latency'] = self._percentiles(samples['hash'])
+        counters['verify_latency'] = self._percentiles(samples['verify'])
+        return counters
+
+
+# Global hasher instance
+password_hasher = PasswordHasher(
+    method=os.environ.get('PASSWORD_HASH_METHOD', 'scrypt'),
+    workers=int(os.environ.get('PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1))),
+    max_queue=int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', 32)),
+)
@@ -0,0 +1,144 @@
+"""
+This module provides:
+- A content-addressed cache of disease model outputs, keyed by the SHA-256 of
+  the uploaded bytes plus the model version (DiseaseModelRegistry.model_id),
+  so re-uploads and client retries skip decoding and inference
+- A bounded in-memory LRU tier and an optional on-disk tier
+  (PREDICTION_CACHE_DIR, one .npy per entry under a per-model directory)
+- Hit rate, inference skipped and upload bytes deduplicated counters
+
+Usage:
+    from prediction_cache import prediction_cache, content_digest
+
+    digest = content_digest(image_bytes)
+    probabilities = prediction_cache.get(digest, model_id)
+    if probabilities is None:
+        probabilities = run_model(...)
+        prediction_cache.put(digest, model_id, probabilities)
+"""
+
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def content_digest(data: bytes) -> str:
+    """Hex SHA-256 of the raw upload bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class PredictionCache:
+    """
+    (model_id, digest) -> probability vector.
+
+    Memory entries are evicted least recently used first once max_entries is
+    reached. With a disk_dir, every put is also written there and memory
+    misses fall back to it, so entries survive restarts and are shared by all
+    workers on the host. Changing the model changes model_id, which makes old
+    entries unreachable (their directory can simply be deleted).
+    """
+
+    def __init__(self, max_entries=2048, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        # Metrics
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.uploads_deduplicated = 0
+        self.bytes_deduplicated = 0
+
+    def _disk_path(self, digest: str, model_id: str) -> str:
+        return os.path.join(self.disk_dir, model_id or 'unknown', f'{digest}.npy')
+
+    def _remember(self, key: tuple, probabilities: np.ndarray):
+        with self.lock:
+            self.entries[key] = probabilities
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get(self, digest: str, model_id: str):
+        """The cached probability vector (read-only), or None."""
+        key = (model_id, digest)
+        with self.lock:
+            probabilities = self.entries.get(key)
+            if probabilities is not None:
+                self.entries.move_to_end(key)
+                self.memory_hits += 1
+                return probabilities
+
+        if self.disk_dir:
+            try:
+                probabilities = np.load(self._disk_path(digest, model_id))
+            except (OSError, ValueError):
+                probabilities = None
+            if probabilities is not None:
+                probabilities.setflags(write=False)
+                self._remember(key, probabilities)
+                with self.lock:
+                    self.disk_hits += 1
+                return probabilities
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, digest: str, model_id: str, probabilities):
+        probabilities = np.array(probabilities, dtype=np.float32)
+        probabilities.setflags(write=False)
+        self._remember((model_id, digest), probabilities)
+
+        if self.disk_dir:
+            path = self._disk_path(digest, model_id)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write then rename so other workers never read a partial file
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, probabilities)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Prediction cache disk write failed: {e}")
+
+    def record_upload(self, size: int, written: bool):
+        """Count an upload that was (or, as a duplicate, was not) written to disk."""
+        if not written:
+            with self.lock:
+                self.uploads_deduplicated += 1
+                self.bytes_deduplicated += size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'disk_dir': self.disk_dir,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0,
+                'inference_skipped': hits,
+                'uploads_deduplicated': self.uploads_deduplicated,
+                'bytes_deduplicated': self.bytes_deduplicated,
+            }
+
+
+# Global cache instance
+prediction_cache = PredictionCache(
+    max_entries=int(os.environ.get('PREDICTION_CACHE_MAX_ENTRIES', 2048)),
+    disk_dir=os.environ.get('PREDICTION_CACHE_DIR') or None,
+)
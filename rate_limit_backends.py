@@ -0,0 +1,395 @@
+"""
+This module provides:
+- Shared storage backends for security.RateLimiter and BruteForceProtection,
+  so every gunicorn worker enforces the same limits and sees the same lockouts
+- SQLiteBackend: a small WAL-mode SQLite file shared by processes on one host
+- RedisBackend: a minimal RESP client (no redis-py dependency); every check
+  is one pipelined round-trip
+- A RESP stand-in server for local testing (tests/test_rate_limit_backends.py
+  checks both backends across processes)
+
+Selected with RATE_LIMIT_BACKEND=memory|sqlite|redis (default memory, i.e.
+process-local state kept by security.py). RATE_LIMIT_DB sets the SQLite file
+and REDIS_URL the Redis server.
+
+Usage:
+    from rate_limit_backends import backend_from_env
+
+    backend = backend_from_env()      # None means in-process memory
+"""
+
+import os
+import time
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+
+class BackendError(Exception):
+    """The shared store could not be reached or returned an error."""
+
+
+class SQLiteBackend:
+    """
+    Counters and lockouts in a SQLite file shared by every process on the host.
+
+    Each operation is one short IMMEDIATE transaction on a per-thread
+    connection. Expired rows are deleted every `purge_every` writes.
+    """
+
+    def __init__(self, path='rate_limits.db', busy_timeout=5.0, purge_every=1000):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.purge_every = purge_every
+        self.local = threading.local()
+        self.writes = 0
+        with self._transaction() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS rate_windows (
+                key TEXT NOT NULL,
+                window INTEGER NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (key, window)
+            ) WITHOUT ROWID''')
+            conn.execute('''CREATE TABLE IF NOT EXISTS login_failures (
+                identifier TEXT PRIMARY KEY,
+                count INTEGER NOT NULL DEFAULT 0,
+                expires_at REAL NOT NULL,
+                locked_until REAL
+            ) WITHOUT ROWID''')
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Limiter state is disposable; losing the last writes on power loss is fine
+            conn.execute('PRAGMA synchronous=OFF')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        try:
+            conn = self._conn()
+            conn.execute('BEGIN IMMEDIATE')
+        except sqlite3.Error as e:
+            raise BackendError(str(e)) from e
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _maybe_purge(self, conn, now: float):
+        self.writes += 1
+        if self.writes % self.purge_every == 0:
+            conn.execute('DELETE FROM rate_windows WHERE expires_at < ?', (now,))
+            conn.execute('DELETE FROM login_failures WHERE expires_at < ? AND COALESCE(locked_until, 0) < ?', (now, now))
+
+    # --- Rate limiting ---
+
+    def incr_window(self, key: str, window: int, window_seconds: int) -> tuple:
+        """Count one request in `window`. Returns (current_count_including_this, previous_window_count)."""
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                current = conn.execute(
+                    '''INSERT INTO rate_windows (key, window, count, expires_at) VALUES (?, ?, 1, ?)
+                       ON CONFLICT(key, window) DO UPDATE SET count = count + 1 RETURNING count''',
+                    (key, window, now + 2 * window_seconds)
+                ).fetchone()[0]
+                row = conn.execute(
+                    'SELECT count FROM rate_windows WHERE key = ? AND window = ?', (key, window - 1)
+                ).fetchone()
+                self._maybe_purge(conn, now)
+        except sqlite3.Error as e:
+            raise BackendError(str(e)) from e
+        return current, row[0] if row else 0
+
+    # --- Brute-force protection ---
+
+    def record_failure(self, identifier: str, max_attempts: int, duration: int) -> int:
+        """Count a failed login; lock the identifier once max_attempts is reached. Returns the failure count."""
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                count = conn.execute(
+                    '''INSERT INTO login_failures (identifier, count, expires_at) VALUES (?, 1, ?)
+                       ON CONFLICT(identifier) DO UPDATE SET
+                           count = CASE WHEN expires_at < ? THEN 1 ELSE count + 1 END,
+                           expires_at = CASE WHEN expires_at < ? THEN excluded.expires_at ELSE expires_at END
+                       RETURNING count''',
+                    (identifier, now + duration, now, now)
+                ).fetchone()[0]
+                if count >= max_attempts:
+                    conn.execute('UPDATE login_failures SET locked_until = ? WHERE identifier = ?',
+                                 (now + duration, identifier))
+                self._maybe_purge(conn, now)
+        except sqlite3.Error as e:
+            raise BackendError(str(e)) from e
+        return count
+
+    def lockout_remaining(self, identifier: str) -> float:
+        """Seconds until the lockout ends (0 if not locked)."""
+        try:
+            row = self._conn().execute(
+                'SELECT locked_until FROM login_failures WHERE identifier = ?', (identifier,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            raise BackendError(str(e)) from e
+        if not row or row[0] is None:
+            return 0
+        return max(0.0, row[0] - time.time())
+
+    def failure_count(self, identifier: str) -> int:
+        try:
+            row = self._conn().execute(
+                'SELECT count FROM login_failures WHERE identifier = ? AND expires_at >= ?',
+                (identifier, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            raise BackendError(str(e)) from e
+        return row[0] if row else 0
+
+    def clear(self, identifier: str):
+        try:
+            with self._transaction() as conn:
+                conn.execute('DELETE FROM login_failures WHERE identifier = ?', (identifier,))
+        except sqlite3.Error as e:
+            raise BackendError(str(e)) from e
+
+
+class RedisBackend:
+    """
+    Counters and lockouts in Redis, spoken over raw RESP.
+
+    Only plain commands are used (GET, SET .. PX NX, INCR, PEXPIRE, PTTL, DEL),
+    so any Redis-compatible server works. Commands for one check are written
+    in a single pipeline, i.e. one network round-trip.
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', timeout=1.0, prefix='cropsys:'):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self.prefix = prefix
+        self.local = threading.local()
+
+    # --- RESP plumbing ---
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        out = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            out.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        return b''.join(out)
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line:
+            raise BackendError('connection closed by server')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise BackendError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length == -1:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(rest)
+            return None if length == -1 else [self._read_reply(reader) for _ in range(length)]
+        raise BackendError(f'unexpected reply {line!r}')
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = (sock, sock.makefile('rb'))
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+            setup = []
+            if self.password:
+                setup.append(('AUTH', self.password))
+            if self.db:
+                setup.append(('SELECT', self.db))
+            if setup:
+                self._send(conn, setup)
+        return conn
+
+    def _send(self, conn, commands) -> list:
+        sock, reader = conn
+        sock.sendall(b''.join(self._encode(c) for c in commands))
+        replies, error = [], None
+        for _ in commands:
+            try:
+                replies.append(self._read_reply(reader))
+            except BackendError as e:
+                # Keep reading so the connection stays in sync
+                if 'connection closed' in str(e):
+                    raise
+                error = error or e
+                replies.append(None)
+        if error:
+            raise error
+        return replies
+
+    def pipeline(self, *commands) -> list:
+        """Send all commands in one write and read their replies (one round-trip)."""
+        try:
+            return self._send(self._connection(), commands)
+        except (OSError, BackendError) as e:
+            conn = getattr(self.local, 'conn', None)
+            if conn is not None:
+                conn[0].close()
+                self.local.conn = None
+            raise BackendError(str(e)) from e
+
+    # --- Rate limiting ---
+
+    def incr_window(self, key: str, window: int, window_seconds: int) -> tuple:
+        current_key = f'{self.prefix}rl:{key}:{window}'
+        current, _, previous = self.pipeline(
+            ('INCR', current_key),
+            ('PEXPIRE', current_key, int(2 * window_seconds * 1000)),
+            ('GET', f'{self.prefix}rl:{key}:{window - 1}'),
+        )
+        return current, int(previous) if previous else 0
+
+    # --- Brute-force protection ---
+
+    def record_failure(self, identifier: str, max_attempts: int, duration: int) -> int:
+        fail_key = f'{self.prefix}bf:fail:{identifier}'
+        # SET NX starts the window (with its TTL) on the first failure; INCR keeps the TTL
+        _, count = self.pipeline(
+            ('SET', fail_key, 0, 'PX', int(duration * 1000), 'NX'),
+            ('INCR', fail_key),
+        )
+        if count >= max_attempts:
+            self.pipeline(('SET', f'{self.prefix}bf:lock:{identifier}', 1, 'PX', int(duration * 1000)))
+        return count
+
+    def lockout_remaining(self, identifier: str) -> float:
+        ttl_ms, = self.pipeline(('PTTL', f'{self.prefix}bf:lock:{identifier}'))
+        return ttl_ms / 1000.0 if ttl_ms > 0 else 0
+
+    def failure_count(self, identifier: str) -> int:
+        count, = self.pipeline(('GET', f'{self.prefix}bf:fail:{identifier}'))
+        return int(count) if count else 0
+
+    def clear(self, identifier: str):
+        self.pipeline(('DEL', f'{self.prefix}bf:fail:{identifier}', f'{self.prefix}bf:lock:{identifier}'))
+
+
+def backend_from_env():
+    """Build the backend named by RATE_LIMIT_BACKEND. Returns None for in-process memory."""
+    name = os.environ.get('RATE_LIMIT_BACKEND', 'memory').lower()
+    if name == 'memory':
+        return None
+    if name == 'sqlite':
+        return SQLiteBackend(os.environ.get('RATE_LIMIT_DB', 'rate_limits.db'))
+    if name == 'redis':
+        return RedisBackend(os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND '{name}' (expected memory, sqlite or redis)")
+
+
+# --- Local stand-in for tests ---
+
+class RespStandIn:
+    """
+    A tiny single-process RESP server implementing the commands RedisBackend uses.
+    For local testing only; not a Redis replacement.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.server = socket.create_server((host, port))
+        self.port = self.server.getsockname()[1]
+        self.data = {}       # key -> (value bytes, expires_at or None)
+        self.lock = threading.Lock()
+        self.commands = 0
+
+    @property
+    def url(self) -> str:
+        return f'redis://127.0.0.1:{self.port}/0'
+
+    def start(self):
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def _accept(self):
+        while True:
+            conn, _ = self.server.accept()
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        reader = conn.makefile('rb')
+        with conn:
+            while True:
+                line = reader.readline()
+                if not line:
+                    return
+                args = []
+                for _ in range(int(line[1:-2])):
+                    length = int(reader.readline()[1:-2])
+                    args.append(reader.read(length + 2)[:-2])
+                conn.sendall(self._execute([args[0].decode().upper()] + args[1:]))
+
+    def _live(self, key, now):
+        item = self.data.get(key)
+        if item and item[1] is not None and item[1] <= now:
+            del self.data[key]
+            return None
+        return item
+
+    def _execute(self, args) -> bytes:
+        command, now = args[0], time.time()
+        with self.lock:
+            self.commands += 1
+            if command in ('PING', 'SELECT', 'AUTH'):
+                return b'+OK\r\n'
+            if command == 'GET':
+                item = self._live(args[1], now)
+                return b'$-1\r\n' if item is None else b'$%d\r\n%s\r\n' % (len(item[0]), item[0])
+            if command == 'SET':
+                options = [a.decode().upper() for a in args[3:]]
+                if 'NX' in options and self._live(args[1], now) is not None:
+                    return b'$-1\r\n'
+                expires = now + int(options[options.index('PX') + 1]) / 1000.0 if 'PX' in options else None
+                self.data[args[1]] = (args[2], expires)
+                return b'+OK\r\n'
+            if command == 'INCR':
+                item = self._live(args[1], now)
+                value = int(item[0]) + 1 if item else 1
+                self.data[args[1]] = (str(value).encode(), item[1] if item else None)
+                return b':%d\r\n' % value
+            if command == 'PEXPIRE':
+                item = self._live(args[1], now)
+                if item is None:
+                    return b':0\r\n'
+                self.data[args[1]] = (item[0], now + int(args[2]) / 1000.0)
+                return b':1\r\n'
+            if command == 'PTTL':
+                item = self._live(args[1], now)
+                if item is None:
+                    return b':-2\r\n'
+                return b':-1\r\n' if item[1] is None else b':%d\r\n' % int((item[1] - now) * 1000)
+            if command == 'DEL':
+                removed = sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+                return b':%d\r\n' % removed
+        return b'-ERR unknown command\r\n'
+
@@ -0,0 +1,178 @@
+"""
+This module provides:
+- Rollup tables with precomputed counts per day, user, disease and crop
+- SQLite triggers that keep them current in the same transaction as every
+  log insert/delete (so they can never drift from a committed log row)
+- A rebuild that recomputes every rollup from the raw logs
+- Read helpers used by the admin dashboard
+
+Usage:
+    from rollups import totals, distribution, monthly_totals
+
+    python rollups.py rebuild     # recompute rollups from detection/recommendation/fertilizer logs
+"""
+
+import sys
+import sqlite3
+
+
+# Log table -> (kind stored in rollup_daily/rollup_totals, rollup_user column)
+LOG_KINDS = {
+    'detection_logs': ('detections', 'detections'),
+    'recommendation_logs': ('recommendations', 'recommendations'),
+    'fertilizer_logs': ('fertilizer', 'fertilizer'),
+}
+
+# Log table -> (column, rollup table) for per-value distributions
+DISTRIBUTIONS = {
+    'detection_logs': ('disease', 'rollup_disease'),
+    'recommendation_logs': ('crop', 'rollup_crop'),
+}
+
+
+def _triggers(table: str) -> list:
+    """CREATE TRIGGER statements adding/removing one log row from every rollup."""
+    kind, user_column = LOG_KINDS[table]
+    statements = []
+    for event, row, delta in (('INSERT', 'NEW', '+ 1'), ('DELETE', 'OLD', '- 1')):
+        day = f"COALESCE(date({row}.created_at), date('now'))"
+        body = []
+        if event == 'INSERT':
+            # Make sure the counter rows exist before incrementing them
+            body += [
+                f"INSERT INTO rollup_daily (day, kind, count) VALUES ({day}, '{kind}', 0) ON CONFLICT(day, kind) DO NOTHING;",
+                f"INSERT INTO rollup_totals (name, count) VALUES ('{kind}', 0) ON CONFLICT(name) DO NOTHING;",
+                f"INSERT INTO rollup_user (user_id) SELECT {row}.user_id WHERE {row}.user_id IS NOT NULL ON CONFLICT(user_id) DO NOTHING;",
+            ]
+            if table in DISTRIBUTIONS:
+                column, rollup = DISTRIBUTIONS[table]
+                body.append(
+                    f"INSERT INTO {rollup} ({column}, count) SELECT {row}.{column}, 0 WHERE {row}.{column} IS NOT NULL ON CONFLICT({column}) DO NOTHING;"
+                )
+        body += [
+            f"UPDATE rollup_daily SET count = count {delta} WHERE day = {day} AND kind = '{kind}';",
+            f"UPDATE rollup_totals SET count = count {delta} WHERE name = '{kind}';",
+            f"UPDATE rollup_user SET {user_column} = {user_column} {delta} WHERE user_id = {row}.user_id;",
+        ]
+        if table in DISTRIBUTIONS:
+            column, rollup = DISTRIBUTIONS[table]
+            body.append(f"UPDATE {rollup} SET count = count {delta} WHERE {column} = {row}.{column};")
+        statements.append(
+            f"CREATE TRIGGER IF NOT EXISTS trg_{table}_rollup_{event.lower()} AFTER {event} ON {table} "
+            f"BEGIN {' '.join(body)} END"
+        )
+    return statements
+
+
+def create_rollups(conn):
+    """Create the rollup tables and the triggers that maintain them."""
+    conn.execute('''CREATE TABLE IF NOT EXISTS rollup_daily (
+        day TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, kind)
+    ) WITHOUT ROWID''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS rollup_user (
+        user_id INTEGER PRIMARY KEY,
+        detections INTEGER NOT NULL DEFAULT 0,
+        recommendations INTEGER NOT NULL DEFAULT 0,
+        fertilizer INTEGER NOT NULL DEFAULT 0
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS rollup_disease (
+        disease TEXT PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS rollup_crop (
+        crop TEXT PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS rollup_totals (
+        name TEXT PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID''')
+
+    for table in LOG_KINDS:
+        for statement in _triggers(table):
+            conn.execute(statement)
+
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_users_rollup_insert AFTER INSERT ON users BEGIN
+        INSERT INTO rollup_totals (name, count) VALUES ('users', 0) ON CONFLICT(name) DO NOTHING;
+        UPDATE rollup_totals SET count = count + 1 WHERE name = 'users';
+    END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_users_rollup_delete AFTER DELETE ON users BEGIN
+        UPDATE rollup_totals SET count = count - 1 WHERE name = 'users';
+    END''')
+
+
+def rebuild_rollups(conn):
+    """Recompute every rollup table from the raw logs. Run inside one transaction."""
+    for rollup in ('rollup_daily', 'rollup_user', 'rollup_disease', 'rollup_crop', 'rollup_totals'):
+        conn.execute(f'DELETE FROM {rollup}')
+
+    for table, (kind, user_column) in LOG_KINDS.items():
+        conn.execute(f'''INSERT INTO rollup_daily (day, kind, count)
+            SELECT COALESCE(date(created_at), date('now')) AS d, '{kind}', COUNT(*) FROM {table} GROUP BY d''')
+        conn.execute(f"INSERT INTO rollup_totals (name, count) SELECT '{kind}', COUNT(*) FROM {table}")
+        conn.execute(f'''INSERT INTO rollup_user (user_id, {user_column})
+            SELECT user_id, COUNT(*) FROM {table} WHERE user_id IS NOT NULL GROUP BY user_id
+            ON CONFLICT(user_id) DO UPDATE SET {user_column} = excluded.{user_column}''')
+
+    for table, (column, rollup) in DISTRIBUTIONS.items():
+        conn.execute(f'''INSERT INTO {rollup} ({column}, count)
+            SELECT {column}, COUNT(*) FROM {table} WHERE {column} IS NOT NULL GROUP BY {column}''')
+
+    conn.execute("INSERT INTO rollup_totals (name, count) SELECT 'users', COUNT(*) FROM users")
+    # Users without any logs still get a (zero) counter row
+    conn.execute('INSERT INTO rollup_user (user_id) SELECT id FROM users WHERE true ON CONFLICT(user_id) DO NOTHING')
+
+
+# --- Read helpers ---
+
+def totals(conn) -> dict:
+    """{'users': n, 'detections': n, 'recommendations': n, 'fertilizer': n}"""
+    result = {'users': 0, 'detections': 0, 'recommendations': 0, 'fertilizer': 0}
+    result.update(dict(conn.execute('SELECT name, count FROM rollup_totals').fetchall()))
+    return result
+
+
+def distribution(conn, table: str) -> list:
+    """[(value, count), ...] for diseases (detection_logs) or crops (recommendation_logs), most frequent first."""
+    column, rollup = DISTRIBUTIONS[table]
+    return conn.execute(
+        f'SELECT {column}, count FROM {rollup} WHERE count > 0 ORDER BY count DESC'
+    ).fetchall()
+
+
+def monthly_totals(conn, table: str, months: list) -> list:
+    """Per-month counts for a log table (all users), aligned with aggregations.last_n_months()."""
+    if not months:
+        return []
+    kind = LOG_KINDS[table][0]
+    rows = conn.execute(
+        '''SELECT substr(day, 1, 7) AS ym, SUM(count) FROM rollup_daily
+           WHERE kind = ? AND day >= ? AND day < ? GROUP BY ym''',
+        (kind, months[0].start[:10], months[-1].next().start[:10])
+    ).fetchall()
+    by_key = dict(rows)
+    return [by_key.get(m.key, 0) for m in months]
+
+
+def user_totals(conn, user_id) -> dict:
+    """{'detections': n, 'recommendations': n, 'fertilizer': n} for one user."""
+    row = conn.execute(
+        'SELECT detections, recommendations, fertilizer FROM rollup_user WHERE user_id = ?', (user_id,)
+    ).fetchone()
+    if row is None:
+        return {'detections': 0, 'recommendations': 0, 'fertilizer': 0}
+    return {'detections': row[0], 'recommendations': row[1], 'fertilizer': row[2]}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'rebuild':
+        print("Usage: python rollups.py rebuild [database.db]")
+        sys.exit(2)
+
+    with sqlite3.connect(sys.argv[2] if len(sys.argv) > 2 else 'database.db') as conn:
+        create_rollups(conn)
+        rebuild_rollups(conn)
+        print(f"Rollups rebuilt: {totals(conn)}")
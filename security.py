@@ -1,8 +1,8 @@
 """
 This module provides:
-- In-memory rate limiting (production should use Redis)
+- Sliding-window rate limiting (sharded in memory, or shared via rate_limit_backends)
 - Input validation functions
-- Brute-force protection
+- Brute-force protection (bounded, self-expiring in memory)
 - Security headers middleware
 
 Usage:
@@ -10,18 +10,36 @@ Usage:
 """
 
 import re
+import math
+import heapq
 import time
 import hmac
 from functools import wraps
-from collections import defaultdict
+from collections import OrderedDict, deque
 from flask import request, jsonify
 import threading
 
+from rate_limit_backends import BackendError, backend_from_env
+
 
 class RateLimiter:
     """
-    Simple in-memory rate limiter. For production, replace with Redis-backed solution.
-    
+    In-memory sliding-window-counter rate limiter.
+
+    Each key keeps two counters (the current and previous fixed window) and the
+    allowed rate is estimated as previous * (1 - elapsed fraction) + current, so a
+    check is O(1) no matter how many requests the key has made.
+
+    Keys are spread over `shards` independently locked LRU maps (lock striping),
+    so concurrent requests for different clients rarely wait on each other.
+    Idle keys expire after two windows, and each shard holds at most
+    max_keys / shards keys; past that the least recently seen key is evicted
+    (its counters restart from zero, i.e. eviction fails open).
+
+    With a shared `backend` (see rate_limit_backends) the two counters live in
+    SQLite or Redis instead, so all workers enforce one limit. Shared counters
+    also count rejected requests, and an unreachable backend fails open.
+
     Usage:
         limiter = RateLimiter()
         
@@ -29,10 +47,20 @@ class RateLimiter:
         def my_endpoint():
             ...
     """
-    
-    def __init__(self):
-        self.requests = defaultdict(list)
-        self.lock = threading.Lock()
+
+    # Expired keys purged per check; keeps the purge cost amortized O(1)
+    PURGE_BATCH = 8
+
+    def __init__(self, shards=16, max_keys=100_000, backend=None):
+        self.backend = backend
+        self.backend_errors = 0
+        self.shard_count = shards
+        self.max_keys_per_shard = max(1, max_keys // shards)
+        # key -> [window_index, current_count, previous_count, expires_at], least recently seen first
+        self.shards = [OrderedDict() for _ in range(shards)]
+        self.locks = [threading.Lock() for _ in range(shards)]
+        self.expired = [0] * shards
+        self.evicted = [0] * shards
     
     def _parse_limit(self, limit_string: str) -> tuple:
         """Parse limit string like '5 per minute' into (count, seconds)"""
@@ -57,26 +85,96 @@ class RateLimiter:
         if key_func:
             return key_func()
         return request.remote_addr
-    
+
+    def _purge(self, i: int, entries: OrderedDict, now: float):
+        """Drop a few expired keys from the cold end of a shard. Caller holds the shard lock."""
+        for _ in range(self.PURGE_BATCH):
+            if not entries:
+                return
+            key, entry = next(iter(entries.items()))
+            if entry[3] > now:
+                return
+            del entries[key]
+            self.expired[i] += 1
+
     def _is_limited(self, key: str, max_requests: int, window_seconds: int) -> tuple:
         """Check if the key is rate limited. Returns (is_limited, remaining, reset_time)"""
+        if self.backend is not None:
+            return self._is_limited_shared(key, max_requests, window_seconds)
+
         now = time.time()
-        
-        with self.lock:
-            # Clean old requests
-            self.requests[key] = [t for t in self.requests[key] if t > now - window_seconds]
-            
-            current_count = len(self.requests[key])
-            
-            if current_count >= max_requests:
-                oldest = min(self.requests[key]) if self.requests[key] else now
-                reset_time = int(oldest + window_seconds - now)
-                return True, 0, reset_time
-            
-            # Record this request
-            self.requests[key].append(now)
-            
-            return False, max_requests - current_count - 1, window_seconds
+        window = int(now // window_seconds)
+        elapsed = (now - window * window_seconds) / window_seconds
+        i = hash(key) % self.shard_count
+        entries = self.shards[i]
+
+        with self.locks[i]:
+            self._purge(i, entries, now)
+
+            entry = entries.get(key)
+            if entry is None:
+                if len(entries) >= self.max_keys_per_shard:
+                    entries.popitem(last=False)
+                    self.evicted[i] += 1
+                entry = entries[key] = [window, 0, 0, 0.0]
+            else:
+                entries.move_to_end(key)
+                if entry[0] != window:
+                    # Roll forward: the old current window becomes the previous one
+                    entry[2] = entry[1] if entry[0] == window - 1 else 0
+                    entry[1] = 0
+                    entry[0] = window
+            entry[3] = now + 2 * window_seconds
+
+            is_limited, remaining, reset_time = self._decide(entry[1], entry[2], elapsed, max_requests, window_seconds)
+            if not is_limited:
+                # Record this request
+                entry[1] += 1
+            return is_limited, remaining, reset_time
+
+    @staticmethod
+    def _decide(current: int, previous: int, elapsed: float, max_requests: int, window_seconds: int) -> tuple:
+        """Sliding-window decision for one more request, given the counts before it."""
+        estimated = previous * (1.0 - elapsed) + current
+        if estimated + 1 > max_requests:
+            # Time until previous * (1 - elapsed) + current leaves room for one more request
+            if current >= max_requests:
+                # Wait for this window to end and enough of it to slide out
+                wait = (1.0 - elapsed) + (1.0 - (max_requests - 1) / current)
+            else:
+                wait = (1.0 - (max_requests - current - 1) / previous) - elapsed
+            return True, 0, max(1, math.ceil(wait * window_seconds))
+        return False, max(0, int(max_requests - estimated - 1)), window_seconds
+
+    def _is_limited_shared(self, key: str, max_requests: int, window_seconds: int) -> tuple:
+        now = time.time()
+        window = int(now // window_seconds)
+        elapsed = (now - window * window_seconds) / window_seconds
+        try:
+            current, previous = self.backend.incr_window(key, window, window_seconds)
+        except BackendError as e:
+            self.backend_errors += 1
+            print(f"Rate limit backend unavailable, allowing request: {e}")
+            return False, max_requests, window_seconds
+        # current already includes this request
+        return self._decide(current - 1, previous, elapsed, max_requests, window_seconds)
+
+    def stats(self) -> dict:
+        """Tracked keys and eviction counters across all shards."""
+        if self.backend is not None:
+            return {'backend': type(self.backend).__name__, 'backend_errors': self.backend_errors}
+        tracked = 0
+        for i in range(self.shard_count):
+            with self.locks[i]:
+                tracked += len(self.shards[i])
+        return {
+            'backend': 'memory',
+            'shards': self.shard_count,
+            'tracked_keys': tracked,
+            'max_keys': self.max_keys_per_shard * self.shard_count,
+            'expired_keys': sum(self.expired),
+            'evicted_keys': sum(self.evicted),
+        }
     
     def limit(self, limit_string: str, key_func=None, error_message=None):
         """
@@ -104,15 +202,18 @@ class RateLimiter:
                     response.headers['Retry-After'] = str(reset_time)
                     response.headers['X-RateLimit-Limit'] = str(max_requests)
                     response.headers['X-RateLimit-Remaining'] = '0'
-                    response.headers['X-RateLimit-Reset'] = str(int(time.time() + reset_time))
+                    response.headers['X-RateLimit-Reset'] = str(math.ceil(time.time() + reset_time))
                     return response
                 
                 return f(*args, **kwargs)
             return decorated_function
         return decorator
 
+# Shared store for rate limits and lockouts (None = this process only)
+shared_backend = backend_from_env()
+
 # Global rate limiter instance
-rate_limiter = RateLimiter()
+rate_limiter = RateLimiter(backend=shared_backend)
 
 
 
@@ -203,42 +304,152 @@ def validate_username(username: str) -> tuple:
 
 
 
+class ExpiringStore:
+    """
+    A bounded dict whose entries carry an expiry time.
+
+    A min-heap of (expires_at, key) finds the next entry to expire, so
+    purge() drops a few stale entries per call in amortized O(1) without a
+    sweep. Updating a key leaves its old heap item behind; stale items are
+    skipped on pop and compacted once the heap grows to twice the live size.
+    When full, set() on a new key evicts the entry closest to expiring, or
+    with evict=False leaves the store alone and returns False.
+    """
+
+    def __init__(self, max_entries: int, purge_batch=8, evict=True):
+        self.max_entries = max_entries
+        self.purge_batch = purge_batch
+        self.evict = evict
+        self.items = {}  # key -> (value, expires_at)
+        self.heap = []
+        self.expired = 0
+        self.evicted = 0
+        self.refused = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key, now: float):
+        item = self.items.get(key)
+        if item is None or item[1] <= now:
+            return None
+        return item[0]
+
+    def set(self, key, value, expires_at: float) -> bool:
+        """Store the entry; False if the store is full and does not evict."""
+        if key not in self.items and len(self.items) >= self.max_entries:
+            if not self.evict:
+                self.refused += 1
+                return False
+            if self._pop_soonest() is not None:
+                self.evicted += 1
+        self.items[key] = (value, expires_at)
+        heapq.heappush(self.heap, (expires_at, key))
+        return True
+
+    def pop(self, key):
+        # Its heap item becomes stale and is skipped later
+        item = self.items.pop(key, None)
+        return item[0] if item else None
+
+    def _pop_soonest(self):
+        while self.heap:
+            expires_at, key = heapq.heappop(self.heap)
+            item = self.items.get(key)
+            if item is not None and item[1] == expires_at:
+                del self.items[key]
+                return key
+        return None
+
+    def purge(self, now: float):
+        """Drop up to purge_batch expired entries and compact stale heap items."""
+        for _ in range(self.purge_batch):
+            if not self.heap or self.heap[0][0] > now:
+                break
+            expires_at, key = heapq.heappop(self.heap)
+            item = self.items.get(key)
+            # A stale heap item (key updated or removed since) leaves the store alone
+            if item is not None and item[1] == expires_at:
+                del self.items[key]
+                self.expired += 1
+        if len(self.heap) > 2 * len(self.items) + 64:
+            self.heap = [(expires_at, key) for key, (_, expires_at) in self.items.items()]
+            heapq.heapify(self.heap)
+
+
 class BruteForceProtection:
     """
     Tracks failed login attempts and implements progressive lockout.
+
+    In memory, failures (the last max_attempts timestamps per identifier) and
+    lockouts live in two ExpiringStores capped at max_entries each. Every call
+    purges a few expired identifiers, so a credential-stuffing run over many
+    distinct emails drains away on its own. A flood of new identifiers only
+    evicts other identifiers' failure history (the ones closest to expiring).
+    The lockout store never evicts: once max_entries identifiers are locked
+    out, further lockouts are refused (counted as refused_lockouts) until
+    some expire, so locking out throwaway identifiers cannot unlock real ones.
     
-    For production, use Redis with proper TTL handling.
+    With a shared `backend` (see rate_limit_backends) failures and lockouts are
+    visible to every worker. Failures then count from the first one in a
+    lockout_duration window, and an unreachable backend fails open.
     """
     
-    def __init__(self, max_attempts=5, lockout_duration=900):  # 15 minutes
-        self.failed_attempts = defaultdict(list)
-        self.lockouts = {}
+    def __init__(self, max_attempts=5, lockout_duration=900, backend=None, max_entries=100_000):  # 15 minutes
+        self.backend = backend
+        self.backend_errors = 0
+        self.failed_attempts = ExpiringStore(max_entries)  # identifier -> deque of failure times
+        self.lockouts = ExpiringStore(max_entries, evict=False)  # identifier -> locked_until
         self.max_attempts = max_attempts
         self.lockout_duration = lockout_duration
         self.lock = threading.Lock()
+
+    def _shared(self, method: str, *args, default=None):
+        """Call a backend method; on backend failure log it and return `default`."""
+        try:
+            return getattr(self.backend, method)(*args)
+        except BackendError as e:
+            self.backend_errors += 1
+            print(f"Brute-force backend unavailable: {e}")
+            return default
+
+    def _purge(self, now: float):
+        self.failed_attempts.purge(now)
+        self.lockouts.purge(now)
     
     def record_failure(self, identifier: str):
         """Record a failed login attempt."""
+        if self.backend is not None:
+            self._shared('record_failure', identifier, self.max_attempts, self.lockout_duration)
+            return
+
         now = time.time()
         
         with self.lock:
-            # Clean old attempts shiiiiiittttttt 
-            self.failed_attempts[identifier] = [
-                t for t in self.failed_attempts[identifier]
-                if t > now - self.lockout_duration
-            ]
-            
-            self.failed_attempts[identifier].append(now)
-            
-        
-            if len(self.failed_attempts[identifier]) >= self.max_attempts:
-                self.lockouts[identifier] = now + self.lockout_duration
+            self._purge(now)
+            attempts = self.failed_attempts.get(identifier, now)
+            if attempts is None:
+                attempts = deque(maxlen=self.max_attempts)
+            attempts.append(now)
+            # The entry lives as long as its newest failure counts
+            self.failed_attempts.set(identifier, attempts, now + self.lockout_duration)
+
+            recent = sum(1 for t in attempts if t > now - self.lockout_duration)
+            if recent >= self.max_attempts:
+                recorded = self.lockouts.set(identifier, now + self.lockout_duration, now + self.lockout_duration)
+                if not recorded and self.lockouts.refused % 1000 == 1:
+                    print(f"Lockout store full ({self.lockouts.max_entries} identifiers); "
+                          f"{self.lockouts.refused} lockouts refused so far")
     
     def record_success(self, identifier: str):
         """Clear failed attempts after successful login."""
+        if self.backend is not None:
+            self._shared('clear', identifier)
+            return
+
         with self.lock:
-            self.failed_attempts.pop(identifier, None)
-            self.lockouts.pop(identifier, None)
+            self.failed_attempts.pop(identifier)
+            self.lockouts.pop(identifier)
     
     def is_locked_out(self, identifier: str) -> tuple:
         """
@@ -247,29 +458,52 @@ class BruteForceProtection:
         Returns:
             (is_locked: bool, seconds_remaining: int)
         """
+        if self.backend is not None:
+            remaining = int(self._shared('lockout_remaining', identifier, default=0))
+            return (True, remaining) if remaining > 0 else (False, 0)
+
         now = time.time()
         
         with self.lock:
-            if identifier in self.lockouts:
-                remaining = int(self.lockouts[identifier] - now)
+            self._purge(now)
+            locked_until = self.lockouts.get(identifier, now)
+            if locked_until is not None:
+                remaining = int(locked_until - now)
                 if remaining > 0:
                     return True, remaining
-                else:
-                    # Lockout expired
-                    del self.lockouts[identifier]
-                    self.failed_attempts.pop(identifier, None)
         
         return False, 0
     
     def get_remaining_attempts(self, identifier: str) -> int:
         """Get the number of remaining login attempts."""
+        if self.backend is not None:
+            return max(0, self.max_attempts - self._shared('failure_count', identifier, default=0))
+
+        now = time.time()
         with self.lock:
-            current = len(self.failed_attempts.get(identifier, []))
+            attempts = self.failed_attempts.get(identifier, now) or ()
+            current = sum(1 for t in attempts if t > now - self.lockout_duration)
             return max(0, self.max_attempts - current)
 
+    def stats(self) -> dict:
+        """Tracked identifiers, lockouts and expiry/eviction counters."""
+        if self.backend is not None:
+            return {'backend': type(self.backend).__name__, 'backend_errors': self.backend_errors}
+        with self.lock:
+            return {
+                'backend': 'memory',
+                'tracked_identifiers': len(self.failed_attempts),
+                'locked_identifiers': len(self.lockouts),
+                'max_entries': self.failed_attempts.max_entries,
+                'expired_identifiers': self.failed_attempts.expired,
+                'evicted_identifiers': self.failed_attempts.evicted,
+                'expired_lockouts': self.lockouts.expired,
+                'refused_lockouts': self.lockouts.refused,
+            }
+
 
 
-brute_force = BruteForceProtection()
+brute_force = BruteForceProtection(backend=shared_backend)
 
 
 
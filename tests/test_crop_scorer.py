@@ -0,0 +1,36 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from crop_scorer import CompiledCropScorer, verify_parity
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def sklearn_pipeline():
+    loaded = []
+    for name in ('model.pkl', 'minmaxscaler.pkl', 'standscaler.pkl'):
+        with open(os.path.join(ROOT, name), 'rb') as f:
+            loaded.append(pickle.load(f))
+    return loaded
+
+
+def test_matches_model_predict_on_every_dataset_row(sklearn_pipeline):
+    model, mx, sc = sklearn_pipeline
+    scorer = CompiledCropScorer(model, mx, sc)
+    rows, mismatches = verify_parity(scorer, model, mx, sc, os.path.join(ROOT, 'Crop_recommendation.csv'))
+    assert rows > 0
+    assert mismatches == []
+
+
+def test_single_row_and_probabilities_match_sklearn(sklearn_pipeline):
+    model, mx, sc = sklearn_pipeline
+    scorer = CompiledCropScorer(model, mx, sc)
+    row = np.array([[90, 42, 43, 20.88, 6.5]])
+    scaled = sc.transform(mx.transform(row))
+    assert scorer.predict(row).tolist() == model.predict(scaled).tolist()
+    np.testing.assert_allclose(scorer.transform(row), scaled)
+    np.testing.assert_allclose(scorer.predict_proba(row), model.predict_proba(scaled))
@@ -0,0 +1,23 @@
+import os
+import time
+
+import image_pipeline
+from image_pipeline import save_upload_by_digest, delete_upload
+
+
+def test_shared_upload_survives_delete_within_grace_window(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_pipeline, 'UPLOAD_FOLDER', str(tmp_path))
+    url, written = save_upload_by_digest(b'jpeg bytes', 'a' * 64, 'JPEG')
+    assert written
+    path = os.path.join(str(tmp_path), os.path.basename(url))
+    old = time.time() - 7200
+    os.utime(path, (old, old))
+
+    # A duplicate upload hands the same file out again
+    assert save_upload_by_digest(b'jpeg bytes', 'a' * 64, 'JPEG') == (url, False)
+    assert not delete_upload(url, min_age=3600)
+    assert os.path.exists(path)
+
+    os.utime(path, (old, old))
+    assert delete_upload(url, min_age=3600)
+    assert not os.path.exists(path)
@@ -0,0 +1,40 @@
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import numpy as np
+import pytest
+
+from inference_batcher import MicroBatcher
+
+
+def test_timed_out_request_never_reaches_the_model():
+    started, release = threading.Event(), threading.Event()
+    batches = []
+
+    def predict(batch):
+        started.set()
+        release.wait(5)
+        batches.append(len(batch))
+        return batch.sum(axis=1, keepdims=True)
+
+    batcher = MicroBatcher(predict, max_batch_size=4, max_wait_ms=0)
+    first = batcher.submit(np.ones(3))               # occupies the model until released
+    assert started.wait(5)
+    with pytest.raises(FutureTimeoutError):
+        batcher.predict(np.zeros(3), timeout=0.05)    # queued behind it, gives up
+    second = batcher.submit(np.full(3, 2.0))
+    release.set()
+
+    assert first.result(timeout=5)[0] == 3.0
+    assert second.result(timeout=5)[0] == 6.0
+    assert sum(batches) == 2
+    assert batcher.stats()['cancelled_requests'] == 1
+
+
+def test_failed_dispatch_fails_the_batch():
+    def predict(batch):
+        raise ValueError('model exploded')
+
+    batcher = MicroBatcher(predict, max_batch_size=2, max_wait_ms=0)
+    with pytest.raises(ValueError):
+        batcher.predict(np.zeros(3), timeout=5)
@@ -0,0 +1,35 @@
+import logging
+
+from metrics import Histogram, MetricsRegistry, get_logger, log_event
+
+
+def test_histogram_buckets_are_cumulative_and_rendered():
+    histogram = Histogram('test_seconds', 'Test.', labelnames=('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, 'decode')
+
+    data = histogram.snapshot()[('decode',)]
+    assert data['count'] == 4 and [count for _, count in data['buckets']] == [2, 3, 4]
+    rendered = '\n'.join(histogram.render())
+    assert 'test_seconds_bucket{stage="decode",le="+Inf"} 4' in rendered
+    assert 'test_seconds_count{stage="decode"} 4' in rendered
+
+
+def test_stats_are_exported_only_when_included():
+    registry = MetricsRegistry('test')
+    registry.register_stats('cache', lambda: {'hits': 3, 'enabled': True, 'nested': {'size': 1.5}, 'path': '/tmp'})
+
+    rendered = registry.render()
+    assert 'test_cache_hits 3' in rendered and 'test_cache_enabled 1' in rendered
+    assert 'test_cache_nested_size 1.5' in rendered and 'path' not in rendered
+    assert 'test_cache' not in registry.render(include_stats=False)
+
+
+def test_log_event_formats_logfmt_and_skips_disabled_levels(caplog):
+    logger = get_logger('plant.test')
+    logger.propagate = True
+    logger.setLevel(logging.INFO)
+    with caplog.at_level(logging.INFO, logger='plant.test'):
+        log_event(logger, logging.INFO, 'low_confidence', confidence=42.123456, note='two words')
+        log_event(logger, logging.DEBUG, 'probabilities', values=[1, 2])
+    assert [r.getMessage() for r in caplog.records] == ['low_confidence confidence=42.1235 note="two words"']
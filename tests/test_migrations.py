@@ -0,0 +1,27 @@
+import sqlite3
+
+import pytest
+
+from migrations import HOT_QUERIES, MIGRATIONS, current_version, migrate, plan_problems
+
+
+@pytest.fixture(scope='module')
+def conn():
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize('name,sql,params', HOT_QUERIES, ids=[name for name, _, _ in HOT_QUERIES])
+def test_hot_query_uses_an_index(conn, name, sql, params):
+    assert plan_problems(conn, sql, params) == []
+
+
+def test_plan_check_flags_a_log_table_scan(conn):
+    assert plan_problems(conn, "SELECT * FROM detection_logs WHERE confidence > ?", (50,))
+
+
+def test_migrate_is_idempotent(conn):
+    assert current_version(conn) == MIGRATIONS[-1][0]
+    assert migrate(conn) == []
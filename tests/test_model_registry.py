@@ -0,0 +1,18 @@
+import model_registry
+from model_registry import DiseaseModelRegistry
+
+
+def test_share_cpus_splits_threads_and_keeps_each_override(monkeypatch):
+    monkeypatch.setattr(model_registry, 'cpu_allocation', lambda: 8)
+
+    registry = DiseaseModelRegistry()
+    registry.share_cpus(4)
+    assert (registry.intra_op_threads, registry.inter_op_threads, registry.num_threads) == (2, 2, 2)
+
+    registry = DiseaseModelRegistry(inter_op_threads=1)
+    registry.share_cpus(8)
+    assert (registry.intra_op_threads, registry.inter_op_threads) == (1, 1)
+
+    registry = DiseaseModelRegistry(intra_op_threads=3)
+    registry.share_cpus(8)
+    assert (registry.intra_op_threads, registry.inter_op_threads) == (3, 1)
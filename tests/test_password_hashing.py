@@ -0,0 +1,22 @@
+import pytest
+from werkzeug.security import generate_password_hash
+
+from password_hashing import PasswordHasher, stored_method
+
+
+@pytest.mark.parametrize('method', ['scrypt', 'scrypt:16384:8:1', 'pbkdf2', 'pbkdf2:sha512', 'pbkdf2:sha256:1000'])
+def test_stored_method_matches_werkzeug(method):
+    assert stored_method(method) == generate_password_hash('x', method=method).split('$', 1)[0]
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        PasswordHasher(method='md5')
+
+
+def test_outdated_hash_is_upgraded():
+    hasher = PasswordHasher(method='pbkdf2:sha256:2000', workers=1)
+    old = generate_password_hash('secret', method='pbkdf2:sha256:1000')
+    assert hasher.verify_and_update(old, 'wrong') == (False, None)
+    ok, upgraded = hasher.verify_and_update(old, 'secret')
+    assert ok and upgraded.startswith('pbkdf2:sha256:2000$') and not hasher.needs_rehash(upgraded)
@@ -0,0 +1,54 @@
+import multiprocessing
+
+import pytest
+
+from rate_limit_backends import RedisBackend, RespStandIn, SQLiteBackend
+from security import BruteForceProtection, RateLimiter
+
+
+def _backend(spec):
+    kind, target, prefix = spec
+    return SQLiteBackend(target) if kind == 'sqlite' else RedisBackend(target, prefix=prefix)
+
+
+def _count_allowed(args):
+    spec, limit, attempts = args
+    limiter = RateLimiter(backend=_backend(spec))
+    return sum(1 for _ in range(attempts) if not limiter._is_limited('test:login', limit, 60)[0])
+
+
+@pytest.fixture(scope='module')
+def stand_in():
+    return RespStandIn().start()
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def spec(request, tmp_path, stand_in):
+    if request.param == 'sqlite':
+        spec = ('sqlite', str(tmp_path / 'rate_limits.db'), None)
+    else:
+        # Keys are per test, so tests do not share counters in the one stand-in
+        spec = ('redis', stand_in.url, f'{request.node.name}:')
+    _backend(spec)  # create tables before worker processes race for them
+    return spec
+
+
+def test_limit_is_shared_across_processes(spec):
+    processes, limit, attempts = 4, 10, 25
+    with multiprocessing.get_context('fork').Pool(processes) as pool:
+        allowed = sum(pool.map(_count_allowed, [(spec, limit, attempts)] * processes))
+    assert allowed == limit
+
+
+def test_lockout_is_visible_to_another_worker_until_cleared(spec):
+    guard = BruteForceProtection(max_attempts=3, lockout_duration=60, backend=_backend(spec))
+    for _ in range(3):
+        guard.record_failure('victim@example.org')
+
+    other_worker = BruteForceProtection(max_attempts=3, lockout_duration=60, backend=_backend(spec))
+    locked, remaining = other_worker.is_locked_out('victim@example.org')
+    assert locked and 0 < remaining <= 60
+    assert other_worker.get_remaining_attempts('victim@example.org') == 0
+
+    guard.record_success('victim@example.org')
+    assert other_worker.is_locked_out('victim@example.org') == (False, 0)
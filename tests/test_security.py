@@ -0,0 +1,59 @@
+import security
+from security import BruteForceProtection, ExpiringStore, RateLimiter
+
+
+def test_purge_skips_stale_heap_top_without_dropping_live_entry():
+    store = ExpiringStore(max_entries=10)
+    store.set('stale', 'x', expires_at=500)
+    store.pop('stale')                      # leaves (500, 'stale') on top of the heap
+    store.set('live', 'failures', expires_at=1400)
+
+    store.purge(now=900)
+
+    assert store.get('live', now=901) == 'failures'
+    assert store.expired == 0
+
+
+def test_purge_ignores_superseded_expiry():
+    store = ExpiringStore(max_entries=10)
+    store.set('key', 'old', expires_at=500)
+    store.set('key', 'new', expires_at=1400)   # (500, 'key') is now stale
+
+    store.purge(now=900)
+    assert store.get('key', now=901) == 'new'
+
+    store.purge(now=1400)
+    assert store.get('key', now=1400) is None
+    assert len(store) == 0 and store.expired == 1
+
+
+def test_retry_after_is_enough_to_be_allowed_again(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(security.time, 'time', lambda: clock[0])
+    limiter = RateLimiter(backend=None)
+
+    for offset in (0.0, 20.0, 40.0, 55.0, 59.0):    # 5 per minute, used up in one window
+        clock[0] = 960.0 + offset
+        assert not limiter._is_limited('login:ip', 5, 60)[0]
+    clock[0] = 1019.5                                # just before the window boundary
+    is_limited, _, retry_after = limiter._is_limited('login:ip', 5, 60)
+    assert is_limited and isinstance(retry_after, int)
+
+    clock[0] += retry_after - 1
+    assert limiter._is_limited('login:ip', 5, 60)[0]
+    clock[0] += 1
+    assert not limiter._is_limited('login:ip', 5, 60)[0]
+
+
+def test_throwaway_lockouts_do_not_displace_real_ones(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(security.time, 'time', lambda: clock[0])
+    guard = BruteForceProtection(max_attempts=2, lockout_duration=900, max_entries=3)
+
+    for identifier in ['victim@example.com'] + [f'throwaway{i}@example.com' for i in range(5)]:
+        guard.record_failure(identifier)
+        guard.record_failure(identifier)
+        clock[0] += 1
+
+    assert guard.is_locked_out('victim@example.com')[0]
+    assert guard.stats()['refused_lockouts'] == 3
@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pytest
+
+from tflite_backend import TFLiteModel, calibration_images, convert, load_or_convert
+
+tf = pytest.importorskip('tensorflow')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_DIR = os.path.join(ROOT, 'test', 'test')
+MODEL_PATH = os.path.join(ROOT, 'trained_plant_disease_model.keras')
+
+
+@pytest.fixture(scope='module')
+def images():
+    images = calibration_images(TEST_DIR)
+    if not images:
+        pytest.skip(f'no images in {TEST_DIR}')
+    return np.stack(images)
+
+
+@pytest.fixture(scope='module')
+def small_model():
+    """A small CNN with the disease model's input and output shapes."""
+    tf.keras.utils.set_random_seed(0)
+    return tf.keras.Sequential([
+        tf.keras.Input((128, 128, 3)),
+        tf.keras.layers.Rescaling(1.0 / 255),
+        tf.keras.layers.Conv2D(8, 3, strides=2, activation='relu'),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(38, activation='softmax'),
+    ])
+
+
+@pytest.mark.parametrize('quantization,tolerance', [('none', 1e-5), ('float16', 1e-2), ('int8', 5e-2)])
+def test_converted_model_matches_keras(small_model, images, quantization, tolerance):
+    model = TFLiteModel(convert(small_model, quantization, list(images[::2])))
+    reference = small_model.predict(images, verbose=0)
+
+    assert model.input_shape == (None, 128, 128, 3) and model.output_shape == (None, 38)
+    np.testing.assert_allclose(model.predict(images), reference, atol=tolerance)
+    # Resizing the batch dimension back down gives the same rows
+    np.testing.assert_allclose(model.predict(images[:1]), model.predict(images)[:1], atol=1e-6)
+
+
+def test_load_or_convert_reuses_the_cached_flatbuffer(small_model, tmp_path):
+    calls = []
+    loader = lambda: calls.append(1) or small_model
+    load_or_convert(loader, 'abc123', 'none', cache_dir=str(tmp_path))
+    load_or_convert(loader, 'abc123', 'none', cache_dir=str(tmp_path))
+    assert len(calls) == 1 and os.listdir(tmp_path) == ['abc123-none.tflite']
+
+
+@pytest.mark.skipif(not os.path.exists(MODEL_PATH), reason='trained disease model not present')
+@pytest.mark.parametrize('quantization', ['none', 'float16'])
+def test_trained_model_top1_parity_on_test_images(images, quantization):
+    keras_model = tf.keras.models.load_model(MODEL_PATH)
+    reference = keras_model.predict(images, verbose=0).argmax(axis=1)
+    model = TFLiteModel(convert(keras_model, quantization))
+    assert (model.predict(images).argmax(axis=1) == reference).all()
@@ -0,0 +1,271 @@
+"""
+This module provides:
+- Conversion of the Keras disease model to a TFLite flatbuffer, optionally
+  with post-training float16 or int8 quantization (int8 is calibrated on
+  images from DISEASE_CALIBRATION_DIR, by default test/test); inputs and
+  outputs stay float32 so callers feed the same arrays as to Keras
+- A cache of converted flatbuffers keyed by model identity and quantization
+  (DISEASE_TFLITE_CACHE_DIR), so workers convert once
+- TFLiteModel: a thread-safe interpreter wrapper with the parts of the Keras
+  model interface the app uses (input_shape, output_shape, predict)
+- A parity, latency and memory report against the Keras model on test/test;
+  the pass/fail parity checks run in tests/test_tflite_backend.py
+
+The interpreter comes from ai_edge_litert or tflite_runtime when installed
+(no TensorFlow needed once the flatbuffer is cached), else from tf.lite.
+Selected with DISEASE_BACKEND=tflite (see model_registry.py).
+
+Usage:
+    from tflite_backend import load_or_convert
+
+    model = load_or_convert(keras_loader, model_id, quantization='int8')
+    probabilities = model.predict(batch)
+
+    python tflite_backend.py trained_plant_disease_model.keras   # parity, latency and memory report
+"""
+
+import os
+import sys
+import glob
+import time
+import threading
+
+import numpy as np
+
+
+QUANTIZATIONS = ('none', 'float16', 'int8')
+IMAGE_PATTERNS = ('*.jpg', '*.JPG', '*.jpeg', '*.JPEG', '*.png', '*.PNG')
+
+
+def _interpreter_class():
+    """The lightest available TFLite interpreter implementation."""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+def calibration_images(directory: str, limit: int = 200) -> list:
+    """Decoded (128, 128, 3) float32 arrays for up to `limit` images in `directory`."""
+    from image_pipeline import decode_image
+
+    paths = sorted({p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(directory, pattern))})
+    images = []
+    for path in paths[:limit]:
+        with open(path, 'rb') as f:
+            try:
+                image, _ = decode_image(f.read(), out=np.empty((128, 128, 3), dtype=np.float32))
+            except ValueError:
+                continue
+        images.append(image)
+    return images
+
+
+def convert(keras_model, quantization: str = 'none', calibration: list = None) -> bytes:
+    """
+    Convert a loaded Keras model to a TFLite flatbuffer.
+
+    quantization:
+        'none'    - float32 weights and activations
+        'float16' - float16 weights, dequantized at load (about half the size)
+        'int8'    - int8 weights and activations, ranges calibrated on `calibration`
+    """
+    import tensorflow as tf
+
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization {quantization!r}; expected one of {', '.join(QUANTIZATIONS)}")
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    if quantization == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        if not calibration:
+            raise ValueError("int8 quantization needs calibration images")
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([image[np.newaxis, ...]] for image in calibration)
+    return converter.convert()
+
+
+class TFLiteModel:
+    """
+    A TFLite interpreter behind a lock (interpreters are not thread-safe).
+
+    The batch dimension is resized on demand; the micro-batcher sends one
+    batch at a time, so resizes only happen when the batch size changes.
+    """
+
+    def __init__(self, model_content: bytes, num_threads: int = None):
+        self.interpreter = _interpreter_class()(model_content=model_content, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+        self.input_shape = tuple(None if d == -1 else int(d) for d in self.input_detail['shape_signature'])
+        self.output_shape = tuple(None if d == -1 else int(d) for d in self.output_detail['shape_signature'])
+        self.size_bytes = len(model_content)
+        self.batch_size = int(self.input_detail['shape'][0])
+        self.lock = threading.Lock()
+
+    def predict(self, batch, verbose=0) -> np.ndarray:
+        batch = np.asarray(batch, dtype=np.float32)
+        index = self.input_detail['index']
+        with self.lock:
+            if batch.shape[0] != self.batch_size:
+                self.interpreter.resize_tensor_input(index, list(batch.shape))
+                self.interpreter.allocate_tensors()
+                self.batch_size = batch.shape[0]
+            self.interpreter.set_tensor(index, batch)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output_detail['index']).copy()
+
+
+def load_or_convert(keras_loader, model_id: str, quantization: str = 'none', cache_dir: str = None,
+                    calibration_dir: str = None, num_threads: int = None) -> TFLiteModel:
+    """
+    A TFLiteModel for the model identified by `model_id`.
+
+    The flatbuffer is read from cache_dir when present; otherwise keras_loader()
+    is called to get the Keras model, which is converted and cached.
+    """
+    cache_path = None
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, f"{model_id}-{quantization}.tflite")
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as f:
+                return TFLiteModel(f.read(), num_threads=num_threads)
+
+    calibration = calibration_images(calibration_dir) if quantization == 'int8' and calibration_dir else None
+    started = time.perf_counter()
+    content = convert(keras_loader(), quantization, calibration)
+    print(f"Converted disease model to TFLite ({quantization}, {len(content) / 1024:.0f} KB) "
+          f"in {time.perf_counter() - started:.2f}s")
+
+    if cache_path:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"Could not cache TFLite model: {e}")
+    return TFLiteModel(content, num_threads=num_threads)
+
+
+# --- parity / latency / memory report ---
+
+# test/test file name prefix -> index in app.DISEASE_CLASSES, for images of classes the model knows
+TEST_LABELS = {
+    'CornCommonRust': 1,
+    'PotatoEarlyBlight': 4,
+    'PotatoHealthy': 6,
+}
+
+
+def _rss_mb() -> float:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _latency_ms(model, batch, repeats) -> tuple:
+    model.predict(batch, verbose=0)  # warm up (graph tracing / tensor allocation)
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        model.predict(batch, verbose=0)
+        samples.append((time.perf_counter() - started) * 1000.0)
+    samples.sort()
+    return samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+def _memory_child(model_path, variant, flatbuffer_path):
+    """Runs in a fresh interpreter: RSS of a process holding only one backend."""
+    before = _rss_mb()
+    if variant == 'keras':
+        import tensorflow as tf
+        model = tf.keras.models.load_model(model_path)
+    else:
+        with open(flatbuffer_path, 'rb') as f:
+            model = TFLiteModel(f.read())
+    model.predict(np.zeros((16, 128, 128, 3), dtype=np.float32), verbose=0)
+    print(f"{_rss_mb():.1f} {before:.1f}")
+
+
+def parity_report(model_path, test_dir='test/test', repeats=50) -> bool:
+    """
+    Compare every quantization against Keras on test_dir. int8 is calibrated on
+    the even-numbered half of the images; agreement is also reported for the
+    held-out odd half.
+    """
+    import tempfile
+    import subprocess
+    import tensorflow as tf
+
+    paths = sorted({p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(test_dir, pattern))})
+    images = np.stack(calibration_images(test_dir, limit=len(paths)))
+    names = [os.path.basename(p) for p in paths]
+    labels = [next((i for prefix, i in TEST_LABELS.items() if n.startswith(prefix)), None) for n in names]
+    labelled = [i for i, label in enumerate(labels) if label is not None]
+    held_out = list(range(1, len(images), 2))
+
+    keras_model = tf.keras.models.load_model(model_path)
+    reference = keras_model.predict(images, verbose=0)
+    reference_top1 = reference.argmax(axis=1)
+
+    workdir = tempfile.mkdtemp()
+    rows = [('keras', reference, keras_model, None, os.path.getsize(model_path))]
+    for quantization in QUANTIZATIONS:
+        content = convert(keras_model, quantization, list(images[::2]))
+        flatbuffer_path = os.path.join(workdir, f'{quantization}.tflite')
+        with open(flatbuffer_path, 'wb') as f:
+            f.write(content)
+        model = TFLiteModel(content)
+        rows.append((f'tflite-{quantization}', model.predict(images), model, flatbuffer_path, len(content)))
+
+    print(f"{len(images)} images in {test_dir} ({len(labelled)} with labels the model knows); "
+          f"int8 calibrated on {len(images[::2])}, held out {len(held_out)}")
+    print(f"{'backend':<16}{'size KB':>9}{'agree':>8}{'agree*':>8}{'acc':>7}{'max|dp|':>9}"
+          f"{'b1 p50':>8}{'b1 p95':>8}{'b16 p50':>9}{'RSS MB':>8}")
+    ok = True
+    for name, probabilities, model, flatbuffer_path, size in rows:
+        top1 = probabilities.argmax(axis=1)
+        agree = float(np.mean(top1 == reference_top1))
+        agree_held_out = float(np.mean(top1[held_out] == reference_top1[held_out]))
+        accuracy = float(np.mean([top1[i] == labels[i] for i in labelled])) if labelled else float('nan')
+        max_diff = float(np.max(np.abs(probabilities - reference)))
+        b1_p50, b1_p95 = _latency_ms(model, images[:1], repeats)
+        b16_p50, _ = _latency_ms(model, images[:16], max(5, repeats // 5))
+        variant = 'keras' if flatbuffer_path is None else 'tflite'
+        rss = subprocess.run([sys.executable, os.path.abspath(__file__), '--memory-child', model_path, variant, flatbuffer_path or ''],
+                             capture_output=True, text=True, env=dict(os.environ, TF_CPP_MIN_LOG_LEVEL='3')).stdout.split()
+        print(f"{name:<16}{size / 1024:>9.0f}{agree:>8.1%}{agree_held_out:>8.1%}{accuracy:>7.1%}{max_diff:>9.4f}"
+              f"{b1_p50:>8.2f}{b1_p95:>8.2f}{b16_p50:>9.2f}{float(rss[0]) if rss else float('nan'):>8.0f}")
+        if name in ('tflite-none', 'tflite-float16') and agree < 1.0:
+            ok = False
+    print("agree = top-1 agreement with Keras on all images, agree* = on the held-out half, "
+          "acc = accuracy on labelled images, latencies in ms")
+    return ok
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--memory-child':
+        _memory_child(sys.argv[2], sys.argv[3], sys.argv[4])
+        sys.exit(0)
+    model_path = sys.argv[1] if len(sys.argv) > 1 else 'trained_plant_disease_model.keras'
+    test_dir = sys.argv[2] if len(sys.argv) > 2 else 'test/test'
+    sys.exit(0 if parity_report(model_path, test_dir) else 1)
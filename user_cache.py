@@ -0,0 +1,116 @@
+"""
+This module provides:
+- A per-process LRU + TTL cache of the user context row that page routes
+  render the navbar from and admin_required checks: (id, email, username,
+  profile_picture, is_admin)
+- Explicit invalidation for routes that change those columns or delete users
+- Hit/miss counters
+
+Each worker process has its own cache, so a change made through another
+worker becomes visible here after at most USER_CACHE_TTL seconds.
+
+Usage:
+    from user_cache import user_cache
+
+    user = user_cache.get(session['user_id'])   # tuple or None
+    user_cache.invalidate(user_id)              # after UPDATE/DELETE on users
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from db import get_db
+
+
+def load_user_context(user_id):
+    with get_db() as conn:
+        return conn.execute(
+            "SELECT id, email, username, profile_picture, is_admin FROM users WHERE id = ?",
+            (user_id,)
+        ).fetchone()
+
+
+class UserContextCache:
+    """
+    Maps user id -> (row, expires_at), least recently used first.
+    Missing users are not cached, so a new account is never hidden by a stale miss.
+    """
+
+    def __init__(self, loader=load_user_context, max_entries=4096, ttl=30.0):
+        self.loader = loader
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Bumped by every invalidation so a load that raced with one is not cached
+        self.generation = 0
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id):
+        """The user's context row, from cache when fresh, else from the database."""
+        if user_id is None:
+            return None
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self.entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self.generation
+
+        row = self.loader(user_id)
+        if row is not None:
+            with self.lock:
+                if generation != self.generation:
+                    return row
+                self.entries[user_id] = (tuple(row), now + self.ttl)
+                self.entries.move_to_end(user_id)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return row
+
+    def invalidate(self, user_id):
+        """Drop one user's cached row (call after changing or deleting the user)."""
+        if user_id is None:
+            return
+        try:
+            user_id = int(user_id)  # form values arrive as strings
+        except (TypeError, ValueError):
+            return
+        with self.lock:
+            self.entries.pop(user_id, None)
+            self.generation += 1
+            self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'invalidations': self.invalidations,
+            }
+
+
+# Global cache instance
+user_cache = UserContextCache(
+    max_entries=int(os.environ.get('USER_CACHE_MAX_ENTRIES', 4096)),
+    ttl=float(os.environ.get('USER_CACHE_TTL', 30)),
+)